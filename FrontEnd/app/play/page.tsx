@@ -5,7 +5,7 @@ import SuccessView from './components/SuccessView';
 import FailView from './components/FailView';
 import IncorrectView from './components/IncorrectView';
 import PlayView from './components/PlayView';
-import { startSession, getQuestion, submitAnswer, streamLogs } from '@/services/apiService';
+import { startSession, getQuestion, submitAnswer, streamLogs, getPlayerId } from '@/services/apiService';
 import { RiddleData } from '@/types';
 import { useAuth } from '@/context/AuthContext';
 
@@ -29,25 +29,6 @@ const Battlespace = () => {
     // Track if fail logs have been added to prevent duplicates
     const [failLogsAdded, setFailLogsAdded] = useState(false);
 
-    // Persistent History of Seen Cities (to avoid repeats across sessions)
-    const [seenCities, setSeenCities] = useState<string[]>([]);
-
-    useEffect(() => {
-        const stored = localStorage.getItem('atlast_seen_cities');
-        if (stored) {
-            try { setSeenCities(JSON.parse(stored)); } catch { setSeenCities([]); }
-        }
-    }, []);
-
-    const addToSeenCities = (city: string) => {
-        if (!city) return;
-        setSeenCities(prev => {
-            const next = [...new Set([...prev, city])].slice(-50); // Keep last 50
-            localStorage.setItem('atlast_seen_cities', JSON.stringify(next));
-            return next;
-        });
-    };
-
     const stopLogStreamRef = useRef<(() => void) | null>(null);
 
     // Map frontend difficulty names to backend names
@@ -79,9 +60,8 @@ const Battlespace = () => {
 
             setAgentLogs(prev => [...prev, `Difficulty: ${backendDifficulty.toUpperCase()}`]);
 
-            // Start a new session with difficulty
-            // Start a new session with difficulty AND exclude list
-            const newSessionId = await startSession(backendDifficulty, seenCities);
+            // Start a new session with difficulty (seen cities are tracked server-side per player)
+            const newSessionId = await startSession(backendDifficulty, getPlayerId(userId));
             setSessionId(newSessionId);
             setAgentLogs(prev => [...prev, `Session established: ${newSessionId.slice(0, 8)}...`]);
 
@@ -103,7 +83,6 @@ const Battlespace = () => {
             setAgentLogs(prev => [...prev, 'Requesting target intelligence...']);
             const riddleData = await getQuestion(newSessionId);
             setRiddle(riddleData);
-            if (riddleData?.location?.name) addToSeenCities(riddleData.location.name);
             setAgentLogs(prev => [...prev, 'Target acquired: [REDACTED]']);
             setAgentLogs(prev => [...prev, 'MISSION READY. AWAITING AGENT INPUT.']);
 
@@ -114,7 +93,7 @@ const Battlespace = () => {
         } finally {
             setIsLoadingRiddle(false);
         }
-    }, []);
+    }, [userId]);
 
     // Start the game when user clicks the handoff modal
     const handleStartGame = useCallback(async () => {
@@ -324,7 +303,6 @@ const Battlespace = () => {
             // Fetch the next riddle using existing session
             const riddleData = await getQuestion(sessionId);
             setRiddle(riddleData);
-            if (riddleData?.location?.name) addToSeenCities(riddleData.location.name);
             setAgentLogs(prev => [...prev, 'Target acquired: [REDACTED]']);
             setAgentLogs(prev => [...prev, 'MISSION READY. AWAITING AGENT INPUT.']);
         } catch (error) {
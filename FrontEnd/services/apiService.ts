@@ -1,20 +1,51 @@
-import { SessionResponse, QuestionResponse, RiddleData, AnswerResponse, UserCredentials, AuthResponse, LeaderboardEntry } from '@/types';
+import { SessionResponse, QuestionResponse, RiddleData, AnswerResponse, UserCredentials, AuthResponse, LeaderboardEntry, GameSocketMessage } from '@/types';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
+/**
+ * Stable player id for server-side "seen cities" tracking: the account id when
+ * logged in, otherwise an anonymous id kept in localStorage.
+ */
+export const getPlayerId = (userId?: string | null): string | undefined => {
+    if (userId) return userId;
+    if (typeof window === 'undefined') return undefined;
+    let playerId = localStorage.getItem('atlast_player_id');
+    if (!playerId) {
+        playerId = crypto.randomUUID();
+        localStorage.setItem('atlast_player_id', playerId);
+    }
+    return playerId;
+};
+
+const postStartSession = (difficulty: string, playerId?: string): Promise<Response> =>
+    fetch(`${API_BASE_URL}/start_session`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ difficulty, user_id: playerId }),
+    });
+
 /**
  * Initialize a new game session with the backend
  * @param difficulty - 'Easy', 'Medium', or 'Hard'
+ * @param playerId - see getPlayerId; the backend remembers which cities this player has seen
+ * @param maxRetries - attempts after a 503 (server overloaded), each after its Retry-After
  */
-export const startSession = async (difficulty: string = 'Medium', excludeCities: string[] = []): Promise<string> => {
+export const startSession = async (
+    difficulty: string = 'Medium',
+    playerId?: string,
+    maxRetries: number = 3
+): Promise<string> => {
     try {
-        const response = await fetch(`${API_BASE_URL}/start_session`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ difficulty, exclude_cities: excludeCities }),
-        });
+        let response = await postStartSession(difficulty, playerId);
+
+        // 503 = the backend is shedding new games under load; Retry-After says when to come back
+        for (let retries = 0; response.status === 503 && retries < maxRetries; retries++) {
+            const retryAfter = Number(response.headers.get('Retry-After')) || 2;
+            await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+            response = await postStartSession(difficulty, playerId);
+        }
 
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
@@ -33,13 +64,15 @@ export const startSession = async (difficulty: string = 'Medium', excludeCities:
  */
 export const getQuestion = async (
     sessionId: string,
-    maxRetries: number = 15
+    maxRetries: number = 15,
+    waitSeconds: number = 20
 ): Promise<RiddleData> => {
     let retries = 0;
 
     while (retries < maxRetries) {
         try {
-            const response = await fetch(`${API_BASE_URL}/get_question/${sessionId}`);
+            // Long-poll: the backend holds the request until a riddle is ready
+            const response = await fetch(`${API_BASE_URL}/get_question/${sessionId}?wait=${waitSeconds}`);
 
             if (!response.ok && response.status !== 202) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -51,8 +84,8 @@ export const getQuestion = async (
                 // Cache hit - return immediately
                 return data.data;
             } else if (data.status === 'processing') {
-                // Cache miss - wait and retry
-                const retryAfter = data.retry_after || 2;
+                // Cache miss - wait and retry (0 after a long-poll timeout)
+                const retryAfter = data.retry_after ?? 2;
                 await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
                 retries++;
             }
@@ -67,6 +100,10 @@ export const getQuestion = async (
 
 /**
  * Stream real-time logs from the backend using Server-Sent Events (SSE)
+ *
+ * Each log line carries its stream id, so when the connection drops the
+ * browser's EventSource reconnects on its own and sends Last-Event-ID;
+ * the backend then replays only the lines we missed.
  */
 export const streamLogs = (
     sessionId: string,
@@ -80,8 +117,12 @@ export const streamLogs = (
     };
 
     eventSource.onerror = (error) => {
+        // CONNECTING means the browser is already retrying with Last-Event-ID
+        if (eventSource.readyState !== EventSource.CLOSED) {
+            console.warn('SSE connection interrupted, resuming...');
+            return;
+        }
         console.error('SSE Error:', error);
-        eventSource.close();
         if (onError) {
             onError(new Error('Lost connection to agent log stream.'));
         }
@@ -128,6 +169,38 @@ export const submitAnswer = async (
     }
 };
 
+/**
+ * Open the single game channel: questions, verdicts and agent logs over one WebSocket
+ * instead of REST + polling + SSE. Questions are pushed as soon as they're ready.
+ */
+export const openGameSocket = (
+    sessionId: string,
+    onMessage: (message: GameSocketMessage) => void,
+    userId?: string
+) => {
+    const wsBase = API_BASE_URL.replace(/^http/, 'ws');
+    const query = userId ? `?user_id=${encodeURIComponent(userId)}` : '';
+    const socket = new WebSocket(`${wsBase}/ws/${sessionId}${query}`);
+
+    socket.onmessage = (event) => {
+        onMessage(JSON.parse(event.data) as GameSocketMessage);
+    };
+
+    const send = (frame: object) => {
+        if (socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify(frame));
+        }
+    };
+
+    return {
+        requestQuestion: () => send({ type: 'get_question' }),
+        submitAnswer: (answer: string, timeRemaining?: number) =>
+            send({ type: 'answer', answer, time_remaining: timeRemaining, user_id: userId }),
+        close: () => socket.close(),
+        socket,
+    };
+};
+
 /**
  * Search for city suggestions
  */
@@ -74,6 +74,15 @@ export interface AnswerResponse {
   };
 }
 
+// /ws/{session_id} frames (server -> client)
+export type GameSocketMessage =
+  | { type: 'question'; data: RiddleData; queue_status: string; queue_depth: number }
+  | { type: 'queue_status'; status: string; queue_depth: number }
+  | ({ type: 'verdict' } & AnswerResponse)
+  | { type: 'log'; id?: string; data: string }
+  | { type: 'error'; detail: string }
+  | { type: 'pong' };
+
 export interface UserCredentials {
   username: string;
   password?: string;
@@ -1,5 +1,7 @@
+import asyncio
 import os
-from typing import TypedDict, Literal, Optional
+import time
+from typing import TypedDict, Literal, Optional, List
 from dotenv import load_dotenv
 
 # LangChain / LangGraph Imports
@@ -21,6 +23,20 @@ if not os.getenv("GOOGLE_API_KEY"):
 # and temperature=0.0 for the adversary (strict logic).
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0.7)
 
+# Best-of-K: drafts written concurrently per round, judged together in one call.
+# A round costs ~2 LLM latencies whatever K is; only an all-fail round loops.
+DRAFTS_PER_ROUND = int(os.getenv("RIDDLE_DRAFTS", "3"))
+MAX_ROUNDS = 3
+
+# One angle per concurrent draft so the K candidates don't converge on the same clue
+DRAFT_ANGLES = [
+    "landmarks and architecture",
+    "history and famous events",
+    "geography, rivers and climate",
+    "food, festivals and culture",
+    "nicknames, industry and famous residents",
+]
+
 # ------------------------------------------------------------------
 # DATA MODELS (Pydantic & TypedDict)
 # ------------------------------------------------------------------
@@ -29,12 +45,16 @@ llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0.7)
 class AgentState(TypedDict):
     """
     The shared state of the graph.
+    iteration_count counts rounds; each round drafts `drafts_per_round`
+    candidates into `candidates`, and draft_riddle is the adversary's pick.
     """
     target_city: str
     draft_riddle: str
     feedback: str
     iteration_count: int
     is_acceptable: bool
+    drafts_per_round: int
+    candidates: List[str]
 
 # 2. Structured Outputs for Agents
 class GeneratorOutput(BaseModel):
@@ -44,76 +64,117 @@ class AdversaryOutput(BaseModel):
     is_acceptable: bool = Field(description="True if the riddle is valid, unique, and accurate. False otherwise.")
     feedback: str = Field(description="Specific feedback on why the riddle failed, or 'Approved' if passed.")
 
+class CandidateVerdict(AdversaryOutput):
+    index: int = Field(description="Number of the candidate riddle being judged (1-based).")
+    score: int = Field(description="Quality from 0 (unusable) to 10 (excellent): accuracy, uniqueness, wit.")
+
+class AdversaryBatchOutput(BaseModel):
+    verdicts: List[CandidateVerdict] = Field(description="Exactly one verdict per candidate riddle.")
+
 # ------------------------------------------------------------------
 # NODES (AGENTS)
 # ------------------------------------------------------------------
 
-def generator_node(state: AgentState):
-    """
-    Generates a riddle. Incorporates feedback if this is a retry.
-    """
-    print(f"\n--- GENERATOR NODE (Iteration {state['iteration_count'] + 1}) ---")
-    
-    city = state['target_city']
-    feedback = state.get('feedback', "")
-    
-    # Dynamic prompting based on state
+def build_generator_prompt(city: str, feedback: str = "", angle: Optional[str] = None) -> str:
+    """Generator prompt; `feedback` is set when the previous round was rejected."""
+    focus = f"Focus on {angle}." if angle else "Focus on landmarks, history, or geography."
     if feedback:
-        system_prompt = (
-            f"You are a riddle master. The previous riddle for {city} was rejected.\n"
+        return (
+            f"You are a riddle master. The previous riddles for {city} were rejected.\n"
             f"Feedback from QA: {feedback}\n"
             f"Write a NEW, 3-sentence cryptic riddle for {city}. "
-            f"Fix the issues mentioned."
-        )
-    else:
-        system_prompt = (
-            f"You are a riddle master. Write a 3-sentence cryptic riddle for the city of {city}.\n"
-            f"Do not mention the city name explicitly. "
-            f"Focus on landmarks, history, or geography."
+            f"Fix the issues mentioned. {focus}"
         )
+    return (
+        f"You are a riddle master. Write a 3-sentence cryptic riddle for the city of {city}.\n"
+        f"Do not mention the city name explicitly. "
+        f"{focus}"
+    )
 
-    # Enforce structured output
-    structured_llm = llm.with_structured_output(GeneratorOutput)
-    response = structured_llm.invoke(system_prompt)
+async def generator_node(state: AgentState):
+    """
+    Drafts K riddles concurrently (one angle each). Incorporates feedback if this is a retry.
+    """
+    print(f"\n--- GENERATOR NODE (Round {state['iteration_count'] + 1}) ---")
 
-    print(f"Draft: {response.riddle}")
+    city = state['target_city']
+    feedback = state.get('feedback', "")
+    k = max(1, state.get('drafts_per_round') or DRAFTS_PER_ROUND)
+
+    # Enforce structured output; the K calls run in parallel
+    structured_llm = llm.with_structured_output(GeneratorOutput)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        structured_llm.ainvoke(build_generator_prompt(city, feedback, DRAFT_ANGLES[i % len(DRAFT_ANGLES)]))
+        for i in range(k)
+    ), return_exceptions=True)
+
+    candidates = []
+    for result in results:
+        if isinstance(result, BaseException):
+            print(f"⚠️ Draft failed: {result}")
+        elif result and result.riddle:
+            candidates.append(result.riddle)
+    if not candidates:
+        raise RuntimeError(f"All {k} drafts failed for {city}")
+
+    print(f"{len(candidates)}/{k} drafts in {time.perf_counter() - started:.1f}s")
+    for i, riddle in enumerate(candidates, 1):
+        print(f"Draft {i}: {riddle}")
 
     return {
-        "draft_riddle": response.riddle,
+        "candidates": candidates,
         "iteration_count": state["iteration_count"] + 1
     }
 
-def adversary_node(state: AgentState):
+async def adversary_node(state: AgentState):
     """
-    Critiques the riddle. Checks for ambiguity, factual correctness, and difficulty.
+    Critiques every candidate in ONE structured call (ambiguity, factual
+    correctness, difficulty) and keeps the best-scoring acceptable one.
     """
     print("\n--- ADVERSARY NODE ---")
-    
+
     city = state['target_city']
-    riddle = state['draft_riddle']
+    candidates = state['candidates']
+    numbered = "\n".join(f"{i}. {riddle}" for i, riddle in enumerate(candidates, 1))
 
     system_prompt = (
         f"You are a strict Geography Trivia QA Engineer.\n"
         f"Target City: {city}\n"
-        f"Proposed Riddle: {riddle}\n\n"
-        f"Analyze the riddle. Criteria:\n"
+        f"Candidate Riddles:\n{numbered}\n\n"
+        f"Analyze EACH riddle. Criteria:\n"
         f"1. Is it factually correct?\n"
         f"2. Is it clearly about {city} and not applicable to many other cities?\n"
         f"3. Is it approximately 3 sentences?\n"
         f"4. Does it NOT contain the city name?\n\n"
-        f"Provide a boolean pass/fail and specific constructive feedback."
+        f"For every candidate give its number, a boolean pass/fail, a 0-10 score "
+        f"and specific constructive feedback."
     )
 
     # Enforce structured output (Low temp for strictness)
-    strict_llm = llm.bind(temperature=0.0).with_structured_output(AdversaryOutput)
-    response = strict_llm.invoke(system_prompt)
-
-    status = "PASSED" if response.is_acceptable else "FAILED"
-    print(f"Verdict: {status} | Feedback: {response.feedback}")
-
+    strict_llm = llm.bind(temperature=0.0).with_structured_output(AdversaryBatchOutput)
+    response = await strict_llm.ainvoke(system_prompt)
+
+    verdicts = [v for v in response.verdicts if 1 <= v.index <= len(candidates)]
+    for v in verdicts:
+        status = "PASSED" if v.is_acceptable else "FAILED"
+        print(f"Candidate {v.index}: {status} ({v.score}/10) | Feedback: {v.feedback}")
+
+    accepted = [v for v in verdicts if v.is_acceptable]
+    if accepted:
+        best = max(accepted, key=lambda v: v.score)
+        return {
+            "draft_riddle": candidates[best.index - 1],
+            "is_acceptable": True,
+            "feedback": best.feedback
+        }
+
+    # Every candidate failed: keep the least bad one, feed all the issues back
+    best = max(verdicts, key=lambda v: v.score, default=None)
     return {
-        "is_acceptable": response.is_acceptable,
-        "feedback": response.feedback
+        "draft_riddle": candidates[best.index - 1] if best else candidates[0],
+        "is_acceptable": False,
+        "feedback": " | ".join(v.feedback for v in verdicts) or "No verdict returned."
     }
 
 # ------------------------------------------------------------------
@@ -122,12 +183,13 @@ def adversary_node(state: AgentState):
 
 def should_continue(state: AgentState) -> Literal["generator", "end"]:
     """
-    Determines if the process should stop or loop back to the generator.
+    Determines if the process should stop or loop back to the generator
+    (only when every candidate of the round failed).
     """
     if state["is_acceptable"]:
         return "end"
     
-    if state["iteration_count"] >= 3:
+    if state["iteration_count"] >= MAX_ROUNDS:
         print("\n!!! Max iterations reached. Stopping to prevent infinite loop. !!!")
         return "end"
     
@@ -164,54 +226,59 @@ app = workflow.compile()
 # PUBLIC API
 # ------------------------------------------------------------------
 
-def generate_riddle(city_name: str) -> str:
+def initial_state(city_name: str, drafts: int = DRAFTS_PER_ROUND) -> AgentState:
+    return {
+        "target_city": city_name,
+        "draft_riddle": "",
+        "feedback": "",
+        "iteration_count": 0,
+        "is_acceptable": False,
+        "drafts_per_round": drafts,
+        "candidates": []
+    }
+
+async def agenerate_riddle(city_name: str, drafts: int = DRAFTS_PER_ROUND) -> str:
     """
     Generate a cryptic riddle for a given city using the AI workflow.
     
     Args:
         city_name: Name of the city to generate a riddle for
+        drafts: Candidates drafted concurrently per round (K)
         
     Returns:
         The generated riddle text
     """
-    initial_state = {
-        "target_city": city_name,
-        "draft_riddle": "",
-        "feedback": "",
-        "iteration_count": 0,
-        "is_acceptable": False
-    }
-    
-    final_state = app.invoke(initial_state)
+    final_state = await app.ainvoke(initial_state(city_name, drafts))
     
     # Return the riddle regardless of acceptance status
     # (better to have a potentially imperfect riddle than fail)
     return final_state['draft_riddle']
 
+def generate_riddle(city_name: str, drafts: int = DRAFTS_PER_ROUND) -> str:
+    """Blocking wrapper around agenerate_riddle (not for use inside an event loop)."""
+    return asyncio.run(agenerate_riddle(city_name, drafts))
+
 # ------------------------------------------------------------------
 # EXECUTION
 # ------------------------------------------------------------------
 
-if __name__ == "__main__":
+async def main():
     # Test Case 1: A distinct city
     test_city = "Kyoto"
-    
-    initial_state = {
-        "target_city": test_city,
-        "draft_riddle": "",
-        "feedback": "",
-        "iteration_count": 0,
-        "is_acceptable": False
-    }
 
-    print(f"Starting process for: {test_city}")
-    final_state = app.invoke(initial_state)
+    print(f"Starting process for: {test_city} ({DRAFTS_PER_ROUND} drafts per round)")
+    started = time.perf_counter()
+    final_state = await app.ainvoke(initial_state(test_city))
 
     print("\n\n=== FINAL RESULT ===")
+    print(f"Rounds: {final_state['iteration_count']} | Time: {time.perf_counter() - started:.1f}s")
     if final_state['is_acceptable']:
         print(f"✅ SUCCESS for {final_state['target_city']}!")
         print(f"Riddle: {final_state['draft_riddle']}")
     else:
         print(f"❌ FAILED for {final_state['target_city']}.")
         print(f"Last Draft: {final_state['draft_riddle']}")
-        print(f"Reason: {final_state['feedback']}")
\ No newline at end of file
+        print(f"Reason: {final_state['feedback']}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,190 +1,302 @@
 import asyncio
 import json
+import os
 import uuid
-from typing import Optional, Dict, Any, AsyncGenerator
+from typing import Optional, Dict, Any, AsyncGenerator, Tuple
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException, status, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, FastAPI, HTTPException, status, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sse_starlette.sse import EventSourceResponse
 import redis.asyncio as redis
 from pydantic import BaseModel
-try:
-    from fakeredis import FakeAsyncRedis
-    FAKEREDIS_AVAILABLE = True
-except ImportError:
-    FAKEREDIS_AVAILABLE = False
 
 # Import Polyglot AI riddle generator (multi-provider: Groq, Cohere, Gemini)
-from polyglot_ai import generate_riddle_optimized, search_city_names, get_distance_hint
+from polyglot_ai import CITY_CATALOG, generation_capacity, search_city_names, get_distance_hint
 from services.db import db_service
+from services.matcher import AnswerMatcher
+from services import riddle_codec
+from services.riddle_codec import QueuedRiddle
+from services.generation import generate_and_buffer
+from services.job_queue import GenerationJobQueue
+from services.scheduler import TOP_UP, GenerationScheduler, refill_priorities
+from services.session_store import SessionStore, RedisSessionStore, parse_entry_id
+from services.memory_store import MemorySessionStore
+from services.log_hub import LogHub
+from services.long_poll import QuestionWaiter
+from services.loop_monitor import LoopMonitor
+from services.admission import AdmissionController
+from services.lifecycle import GenerationGuard, SessionReaper
+from services.snapshot import WARM_RESTART, load_snapshot, save_snapshot
+from services.quota import QUOTA
+from services.metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware, QUESTION_CACHE, QUEUE_DEPTH
 
 # ==========================================
 # CONFIGURATION & CONSTANTS
 # ==========================================
-REDIS_URL = "redis://localhost:6379"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 QUEUE_PREFIX = "queue"
 LOG_CHANNEL_PREFIX = "logs"
 BUFFER_SIZE = 3  # Target number of questions to keep in queue
+LOG_QUEUE_SIZE = 100  # Per-client buffered log lines before dropping the oldest
+LOG_HEARTBEAT_SEC = 15  # SSE keep-alive ping interval
+LOG_STREAM_MAXLEN = 200  # Log lines retained per session for Last-Event-ID replay
+MAX_LONG_POLL_SEC = 25  # Upper bound for get_question?wait=
+BLOCKING_POOL_SIZE = 50  # Dedicated connections for BLPOP long-polls
+# "inline": generate in this process (GenerationScheduler). "queue": enqueue jobs
+# for worker.py processes (needs Redis). API nodes then only enqueue and serve.
+GENERATION_MODE = os.getenv("GENERATION_MODE", "inline")
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "16"))  # Inline riddles in flight
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "1") == "1"  # Event-loop lag + blocking-call detector
+LOOP_STALL_MS = float(os.getenv("LOOP_STALL_MS", "100"))  # Lag that counts as a stall (stack captured)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))  # worker.py slots (queue-mode capacity)
+# Graceful shutdown: how long running generations get to finish before they're checkpointed
+SHUTDOWN_DRAIN_SEC = float(os.getenv("SHUTDOWN_DRAIN_SEC", "10"))
 
 # ==========================================
 # APP SETUP & LIFESPAN
 # ==========================================
 
-# Global Redis Client
+# Global Redis Client (None when running on the in-memory store)
 redis_client: Optional[redis.Redis] = None
+# Session/queue/log storage: Redis-backed, or in-process if Redis is unreachable
+session_store: Optional[SessionStore] = None
+# One log listener per process, fanned out to SSE clients
+log_hub: Optional[LogHub] = None
+# Separate pool for blocking pops so long-polls can't starve normal traffic
+blocking_client: Optional[redis.Redis] = None
+question_waiter: Optional[QuestionWaiter] = None
+# Generation job queue (GENERATION_MODE=queue only)
+job_queue: Optional[GenerationJobQueue] = None
+# In-process priority queue of generations (inline mode)
+scheduler: Optional[GenerationScheduler] = None
+loop_monitor: Optional[LoopMonitor] = None
+# Sheds new sessions and picks the generation ladder level (services/admission.py)
+admission: Optional[AdmissionController] = None
+# Idle sessions: reclaim their riddles, cancel their generations (services/lifecycle.py)
+session_reaper: Optional[SessionReaper] = None
+generation_guard: Optional[GenerationGuard] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Manages the application lifecycle.
     Replaces deprecated @app.on_event("startup") and ("shutdown").
+    WARM_RESTART: startup restores the snapshot the last shutdown saved
+    (services/snapshot.py).
     """
-    global redis_client
+    global redis_client, session_store, log_hub, blocking_client, question_waiter, job_queue, scheduler, loop_monitor, admission
+    global session_reaper, generation_guard
     
     # --- STARTUP LOGIC ---
+    if LOOP_MONITOR:
+        loop_monitor = LoopMonitor(threshold=LOOP_STALL_MS / 1000)
+        await loop_monitor.start()
+
     try:
         # Try connecting to real Redis
         client = redis.from_url(REDIS_URL, decode_responses=True)
         await client.ping()
         print(f"✅ Connected to Real Redis at {REDIS_URL}")
         redis_client = client
+        # Reads must outlive the longest BLPOP (redis-py's default socket timeout is shorter)
+        blocking_client = redis.from_url(
+            REDIS_URL, decode_responses=True, max_connections=BLOCKING_POOL_SIZE,
+            socket_timeout=MAX_LONG_POLL_SEC + 5
+        )
+        session_store = RedisSessionStore(
+            redis_client,
+            queue_prefix=QUEUE_PREFIX,
+            log_prefix=LOG_CHANNEL_PREFIX,
+            log_maxlen=LOG_STREAM_MAXLEN
+        )
+        if GENERATION_MODE == "queue":
+            job_queue = GenerationJobQueue(redis_client)
+            print("📮 Generation mode: queue (run worker.py to generate riddles)")
     except Exception as e:
         print(f"⚠️ Failed to connect to Real Redis: {e}")
-        
-        if FAKEREDIS_AVAILABLE:
-            print("🚀 Switching to In-Memory Redis (FakeRedis)...")
-            # Create a shared state for FakeRedis
-            redis_client = FakeAsyncRedis(decode_responses=True)
-            print("✅ Connected to FakeRedis (In-Memory)")
-        else:
-            print("❌ FakeRedis not installed. App will fail.")
-            # In production, we would crash the pod here.
+        # Native dicts/deques, not a Redis emulator. Single process only.
+        print("🚀 Switching to In-Memory Session Store...")
+        session_store = MemorySessionStore(log_maxlen=LOG_STREAM_MAXLEN)
+        if GENERATION_MODE == "queue":
+            print("⚠️ GENERATION_MODE=queue needs Redis. Generating in-process instead.")
+
+    snapshot = await load_snapshot(redis_client) if WARM_RESTART else None
+    if snapshot and snapshot.get("store") and isinstance(session_store, MemorySessionStore):
+        restored = session_store.restore(snapshot["store"])
+        print(f"♨️ Restored {restored} sessions from the last shutdown")
+        QUOTA.restore(snapshot.get("quota", {}))
+    # Daily provider quota accounting + pacing, shared with the workers through Redis
+    await QUOTA.start(redis_client)
+    
+    await session_store.start()
+    log_hub = LogHub(session_store, queue_size=LOG_QUEUE_SIZE)
+    await log_hub.start()
+    question_waiter = QuestionWaiter(
+        session_store, blocking_client=blocking_client, max_blocking=BLOCKING_POOL_SIZE
+    )
+    session_reaper = SessionReaper(session_store)
+    await session_reaper.start()
+    if job_queue is None:
+        generation_guard = GenerationGuard(session_store)
+        await generation_guard.start()
+        scheduler = GenerationScheduler(
+            lambda session_id, difficulty, priority: buffer_worker(session_id, difficulty, priority=priority),
+            concurrency=GENERATION_CONCURRENCY
+        )
+        await scheduler.start()
+        REGISTRY.gauge_callback(
+            "atlast_generation_jobs", "In-process generation jobs by state (inline mode)", ("state",),
+            lambda: [((f"queued_{name}",), n) for name, n in scheduler.queued_by_priority().items()]
+                    + [(("running",), scheduler.running)]
+        )
+    admission = AdmissionController(generation_load, demand_per_session=BUFFER_SIZE)
+    if snapshot:
+        admission.restore(snapshot.get("admission", {}))
+        await resubmit_generations(snapshot.get("jobs", []))
+    await admission.start()
     
     yield  # Application runs here
     
     # --- SHUTDOWN LOGIC ---
+    if admission:
+        await admission.stop()
+    unfinished = []
+    if scheduler:
+        if WARM_RESTART:
+            # Let running generations land, checkpoint the rest below
+            unfinished = await scheduler.drain(SHUTDOWN_DRAIN_SEC)
+        else:
+            await scheduler.stop()
+    if generation_guard:
+        await generation_guard.stop()
+    if session_reaper:
+        await session_reaper.stop()
+    if log_hub:
+        await log_hub.stop()
+    await QUOTA.stop()
+    if WARM_RESTART and session_store:
+        await checkpoint(unfinished)
+    if session_store:
+        await session_store.close()
+    if blocking_client:
+        await blocking_client.close()
     if redis_client:
         await redis_client.close()
         print("🛑 Redis connection closed")
+    if loop_monitor:
+        await loop_monitor.stop()
+
+async def checkpoint(unfinished):
+    """Shutdown half of the warm restart: unfinished generations, admission latencies, the in-memory store and quota."""
+    snapshot = {"jobs": unfinished, "admission": admission.checkpoint() if admission else {}}
+    sessions = ""
+    if isinstance(session_store, MemorySessionStore):
+        snapshot["store"] = session_store.checkpoint()
+        snapshot["quota"] = QUOTA.checkpoint()
+        sessions = f", {len(snapshot['store']['sessions'])} sessions"
+    try:
+        where = await save_snapshot(snapshot, redis_client)
+        print(f"💾 Snapshot: {len(unfinished)} unfinished generations{sessions} -> {where}")
+    except Exception as e:
+        print(f"⚠️ Snapshot failed: {e}")
 
-app = FastAPI(title="Phase 2: Prefetching Agent Architecture", lifespan=lifespan)
-
-# CORS is non-negotiable for frontend dev
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# ==========================================
-# MOCK AGENT & BACKGROUND WORKERS
-# ==========================================
-
+# Endpoints register on the router; create_app() (bottom of the file) builds the app
+router = APIRouter()
 
-# ==========================================
-# AGENTIC WORKERS
-# ==========================================
 
-async def agent_riddle_generation(session_id: str, difficulty: str = "Medium", topic: str = "Geography") -> Dict[str, Any]:
+def create_app() -> FastAPI:
     """
-    Real Agentic Workflow (Polyglot AI + Supabase).
-    1. Publishes thought logs to Redis Pub/Sub.
-    2. Generates city + riddle using AI (with difficulty level).
-    3. Handles fallback to Supabase if generation fails.
+    App factory. Every call builds a fresh app whose lifespan creates this
+    process's clients (Redis, session store, log hub, scheduler), so each
+    forked worker of serve.py gets its own. `api:app` below is the default
+    single-process instance (uvicorn api:app).
     """
-    channel = f"{LOG_CHANNEL_PREFIX}:{session_id}"
-    
-    # ------------------------------------------------------------------
-    # AGENTIC WORKFLOW
-    # ------------------------------------------------------------------
-    
-    # Get already used cities for this session (to avoid repeats)
-    used_cities = []
-    if redis_client:
-        used_cities_key = f"used_cities:{session_id}"
-        used_cities = await redis_client.smembers(used_cities_key) or []
-        used_cities = list(used_cities)
-        if used_cities:
-            await redis_client.publish(channel, f"Excluding {len(used_cities)} previously visited targets...")
-    
-    # 1. Agent: Select Target City (AI Generated)
-    if redis_client:
-        await redis_client.publish(channel, f"Mission Control: Scouting global targets related to {topic} [Difficulty: {difficulty.upper()}]...")
-    await asyncio.sleep(0.5)
-
-    # 2. Agent: Generate Riddle (Polyglot System + DB Fallback)
-    if redis_client:
-        await redis_client.publish(channel, "🚀 Invoking Polyglot AI System (Groq + Cohere + Gemini)...")
-    await asyncio.sleep(0.3)
-    
-    # Call the new async function directly (no executor needed)
-    riddle_result = await generate_riddle_optimized(
-        difficulty=difficulty,
-        exclude_cities=used_cities,
-        timeout_sec=15
+    app = FastAPI(title="Phase 2: Prefetching Agent Architecture", lifespan=lifespan)
+
+    # CORS is non-negotiable for frontend dev
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Retry-After"],  # Read by the client after a shed start_session
     )
-    
-    # Extract data
-    riddle_text = riddle_result["riddle"]
-    stats = riddle_result["stats"]
-    location = riddle_result["location"]
-    
-    # Track this city as used for this session
-    if redis_client and location.get("name"):
-        used_cities_key = f"used_cities:{session_id}"
-        await redis_client.sadd(used_cities_key, location["name"])
-        # Set expiry to match session (1 hour)
-        await redis_client.expire(used_cities_key, 3600)
-    
-    # Log the result
-    if redis_client:
-        # Check if fallback was used
-        if stats["generator_provider"] in ["supabase_backup", "supabase_cache"]:
-            await redis_client.publish(channel, f"⚠️ Generation slow. Fetched from Secure Vault (Supabase).")
-        else:
-            await redis_client.publish(
-                channel, 
-                f"✅ Target Locked. Riddle generated in {stats['total_time_ms']}ms!"
-            )
-            await redis_client.publish(
-                channel,
-                f"📊 Stats: Gen={stats['generator_provider']}, Critic={stats['critic_provider']}"
-            )
+    # Outermost, so the timing covers CORS and error handling too
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+    return app
 
-    return {
-        "riddle": riddle_text,
-        "answer": location["name"],
-        "difficulty": difficulty,
-        "topic": topic,
-        "location": location,
-        "provider_stats": stats
-    }
+# ==========================================
+# AGENTIC WORKERS
+# ==========================================
 
-async def buffer_worker(session_id: str, difficulty: str = "Medium", count: int = 1):
+async def buffer_worker(session_id: str, difficulty: str = "Medium", count: int = 1, priority: int = TOP_UP):
     """
-    Background Task:
-    Generates 'count' questions and pushes them to the Redis List (Queue).
+    Scheduler job (GENERATION_MODE=inline):
+    Generates 'count' questions and pushes them to the session queue.
+    `priority` (the urgency class) lets the quota planner pace top-ups.
     """
-    if not redis_client:
-        print("❌ Worker failed: No Redis connection")
+    if not session_store:
+        print("❌ Worker failed: No session store")
         return
 
     print(f"⚙️ Background Task: Generating {count} questions for {session_id} [Difficulty: {difficulty}]")
     
     for _ in range(count):
-        # Generate the content (Slow operation)
-        riddle_data = await agent_riddle_generation(session_id, difficulty)
+        try:
+            # Generate (slow), compile the matcher and push to the session queue.
+            # Under overload the admission level swaps in stored riddles. The
+            # guard skips / cancels it once the session goes idle (None)
+            queued = await generation_guard.run(
+                session_id, generate_and_buffer(session_store, session_id, difficulty, admission.level, priority)
+            )
+        except Exception as e:
+            print(f"❌ Generation failed for {session_id}: {e}")
+            await session_store.release_generation(session_id)
+            continue
+        if not queued:
+            print(f"⏹️ Session {session_id} is idle or expired, stopped generating")
+            return
         
-        # Serialize and Push to Redis List (Right Push)
-        queue_key = f"{QUEUE_PREFIX}:{session_id}"
-        await redis_client.rpush(queue_key, json.dumps(riddle_data))
+        # Wake any long-polling get_question in this process
+        question_waiter.notify(session_id)
         
         print(f"✅ Buffered question for {session_id}")
 
+async def generation_load() -> Tuple[int, int, int]:
+    """(generations queued + running, job slots, job slots the providers can fill): admission control."""
+    if job_queue is not None:
+        return await job_queue.load(WORKER_CONCURRENCY, min(WORKER_CONCURRENCY, generation_capacity()))
+    return scheduler.queued + scheduler.running, GENERATION_CONCURRENCY, generation_capacity()
+
+async def request_generation(session_id: str, difficulty: str, count: int, waiting: bool = False):
+    """
+    Get `count` riddles generated for a session, one job per riddle, each
+    prioritised by the queue position it will fill (services/scheduler.py).
+    waiting=True: the client has nothing to play right now.
+    queue mode: enqueue jobs for worker.py (durable, returns immediately).
+    inline mode: submit to this process's GenerationScheduler.
+    """
+    priorities = refill_priorities(BUFFER_SIZE, count, waiting)
+    if job_queue is not None:
+        await job_queue.enqueue(session_id, difficulty, priorities)
+    else:
+        for priority in priorities:
+            scheduler.submit(session_id, difficulty, priority)
+
+async def resubmit_generations(jobs):
+    """Startup half of the warm restart: requeue the generations the last shutdown cut off."""
+    for session_id, difficulty, priority in jobs:
+        if job_queue is not None:
+            await job_queue.enqueue(session_id, difficulty, [priority])
+        else:
+            scheduler.submit(session_id, difficulty, priority)
+    if jobs:
+        print(f"♨️ Resubmitted {len(jobs)} generations from the last shutdown")
+
 # ==========================================
 # ENDPOINTS
 # ==========================================
@@ -192,63 +304,74 @@ async def buffer_worker(session_id: str, difficulty: str = "Medium", count: int
 
 class StartSessionRequest(BaseModel):
     difficulty: str = "Medium"
-    exclude_cities: list[str] = []
+    user_id: Optional[str] = None  # Stable player id: seen cities persist across sessions
+    exclude_cities: list[str] = []  # Legacy clients only; the server tracks seen cities
 
 class UserCredentials(BaseModel):
     username: str
     password: str
 
-@app.post("/auth/register")
+@router.post("/auth/register")
 async def register(creds: UserCredentials):
     user_id = db_service.create_user(creds.username, creds.password)
     if not user_id:
         raise HTTPException(status_code=400, detail="Registration failed. Username may be taken.")
     return {"user_id": user_id, "message": "User registered successfully"}
 
-@app.post("/auth/login")
+@router.post("/auth/login")
 async def login(creds: UserCredentials):
     user_id = db_service.login_user(creds.username, creds.password)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     return {"user_id": user_id, "message": "Login successful"}
 
-@app.get("/leaderboard")
+@router.get("/leaderboard")
 async def leaderboard(region: str = "GLOBAL"):
     return db_service.get_leaderboard(region=region)
 
-@app.post("/start_session")
-async def start_session(request: Request, background_tasks: BackgroundTasks):
+@router.post("/start_session")
+async def start_session(request: Request):
     """
     Initializes a user session with a specific difficulty.
     """
     try:
         body = await request.json()
         difficulty = body.get("difficulty", "Medium")
+        user_id = str(body.get("user_id") or "")[:64] or None
         exclude_cities = body.get("exclude_cities", [])
     except Exception as e:
         print(f"❌ Error parsing start_session body: {e}")
         difficulty = "Medium"
+        user_id = None
         exclude_cities = []
 
-    print(f"🔔 START_SESSION Received Difficulty: [{difficulty}], Excluding: {len(exclude_cities)} cities")
+    print(f"🔔 START_SESSION Received Difficulty: [{difficulty}], Player: {'yes' if user_id else 'anonymous'}")
+
+    # Shed instead of queueing generations the providers can't get to in time
+    admitted, retry_after = admission.admit()
+    if not admitted:
+        print(f"🚦 START_SESSION shed: generation backlog {admission.demand()}, retry in {retry_after}s")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(retry_after)},
+            content={
+                "status": "overloaded",
+                "message": "Too many games are starting right now. Please retry shortly.",
+                "retry_after": retry_after
+            }
+        )
 
     session_id = str(uuid.uuid4())
     
-    # Store session config
-    if redis_client:
-        config_key = f"config:{session_id}"
-        await redis_client.hset(config_key, mapping={"difficulty": difficulty})
-        await redis_client.expire(config_key, 3600)
-
-        # Pre-seed used cities from frontend history
-        if exclude_cities:
-            used_cities_key = f"used_cities:{session_id}"
-            await redis_client.sadd(used_cities_key, *exclude_cities)
-            await redis_client.expire(used_cities_key, 3600)
-            print(f"🚫 Seeded {len(exclude_cities)} excluded cities for session {session_id}")
-
-    # Fire and forget: Fill the buffer immediately
-    background_tasks.add_task(buffer_worker, session_id, difficulty, BUFFER_SIZE)
+    # Store session record (seen cities live server-side; old clients may still seed some)
+    if session_store:
+        seen_ids = CITY_CATALOG.ids_of(exclude_cities)
+        await session_store.create_session(session_id, difficulty, seen_ids, pending=BUFFER_SIZE, user_id=user_id)
+        if seen_ids:
+            print(f"🚫 Seeded {len(seen_ids)} excluded cities for session {session_id}")
+
+    # Fire and forget: Fill the buffer immediately (the first riddle is urgent)
+    await request_generation(session_id, difficulty, BUFFER_SIZE, waiting=True)
     
     return {
         "session_id": session_id,
@@ -257,111 +380,145 @@ async def start_session(request: Request, background_tasks: BackgroundTasks):
     }
 
 
-@app.get("/get_question/{session_id}")
-async def get_question(session_id: str, background_tasks: BackgroundTasks):
+async def fetch_question(session_id: str, wait: float = 0) -> Tuple[Optional[QueuedRiddle], Optional[str], int]:
+    """
+    Pop the session's next riddle, keeping the buffer topped up.
+    wait > 0 parks on a miss until a riddle is enqueued (long-poll).
+    Refills after a miss are scheduled as urgent: the player is waiting.
+    Returns (decoded queue entry or None, difficulty, queue depth);
+    difficulty None = unknown or expired session (nothing was created or scheduled).
+    """
+    # One round trip: pop next riddle + arm answer + reset attempts + read config
+    # + claim whatever refills the buffer needs (0 if generations are already pending)
+    raw_data, difficulty, queue_depth, refill = await session_store.pop_question(session_id, BUFFER_SIZE)
+    if not difficulty:
+        return None, None, 0
+    QUESTION_CACHE.inc("hit" if raw_data else "miss")
+    QUEUE_DEPTH.observe(queue_depth)
+    long_poll = not raw_data and wait > 0
+
+    if refill:
+        await request_generation(session_id, difficulty, refill, waiting=not raw_data)
+    
+    if long_poll:
+        raw_data, _, queue_depth, more = await question_waiter.wait_for_question(
+            session_id, min(wait, MAX_LONG_POLL_SEC), BUFFER_SIZE
+        )
+        if more:
+            await request_generation(session_id, difficulty, more)
+    
+    return (riddle_codec.decode(raw_data) if raw_data else None), difficulty, queue_depth
+
+def queue_status(queue_depth: int) -> str:
+    return "refilling" if queue_depth < BUFFER_SIZE else "full"
+
+def question_body(riddle: QueuedRiddle, queue_depth: int, frame_type: Optional[str] = None) -> str:
+    """The "ready" response around the riddle's pre-encoded client JSON (spliced, not re-serialized)."""
+    head = f'{{"type":"{frame_type}",' if frame_type else "{"
+    return (f'{head}"status":"ready","data":{riddle.client_json},'
+            f'"queue_status":"{queue_status(queue_depth)}","queue_depth":{queue_depth}}}')
+
+@router.get("/get_question/{session_id}")
+async def get_question(session_id: str, wait: float = 0):
     """
     Prefetching Pattern Implementation:
     1. Try to pop from Redis Queue.
-    2. If HIT: Return data + Trigger 1 background generation (maintain buffer).
-    3. If MISS: Return 202 (Processing) + Trigger generation.
+    2. If HIT: Return data + Trigger background generation (maintain buffer).
+    3. If MISS: Trigger generation (unless one is already pending), then
+       - wait=N: park the request up to N seconds and return the riddle the
+         instant it is enqueued (long-poll),
+       - otherwise: Return 202 (Processing).
+    Unknown or expired sessions get a 404; nothing is created for them.
     """
-    if not redis_client:
-        raise HTTPException(status_code=503, detail="Redis unavailable")
+    if not session_store:
+        raise HTTPException(status_code=503, detail="Session store unavailable")
 
-    queue_key = f"{QUEUE_PREFIX}:{session_id}"
-    
-    # LPOP: Non-blocking pop from the left of the list
-    raw_data = await redis_client.lpop(queue_key)
+    riddle, difficulty, queue_depth = await fetch_question(session_id, wait)
+    if difficulty is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired. Start a new session.")
     
-    if raw_data:
+    if riddle:
         # === CACHE HIT ===
-        # We have data. Return it instantly.
-        data = json.loads(raw_data)
-        
-        # Store answer in Redis for verification
-        answer_key = f"answer:{session_id}"
-        answer_data = {
-            "answer": data.get("answer"),
-            "location": data.get("location")
-        }
-        await redis_client.setex(answer_key, 3600, json.dumps(answer_data))  # Expire after 1 hour
-        
-        # Reset attempts counter
-        attempts_key = f"attempts:{session_id}"
-        await redis_client.delete(attempts_key)
-        
-        # CRITICAL: Trigger a background refill to ensure the user 
-        # doesn't wait for the NEXT question.
-        # Retrieve difficulty from config
-        config_key = f"config:{session_id}"
-        difficulty = await redis_client.hget(config_key, "difficulty")
-        if not difficulty: difficulty = "Medium"
-        
-        background_tasks.add_task(buffer_worker, session_id, difficulty, 1)
-        
-        return {
-            "status": "ready",
-            "data": data,
-            "queue_status": "refilling"
-        }
+        # We have data. Return it instantly: the client part was encoded at
+        # generation time (without the matcher), so it goes out as stored
+        return Response(content=question_body(riddle, queue_depth), media_type="application/json")
     
     else:
         # === CACHE MISS ===
         # The user consumed content faster than we generated, or this is a cold start.
-        config_key = f"config:{session_id}"
-        difficulty = await redis_client.hget(config_key, "difficulty")
-        if not difficulty: difficulty = "Medium"
-        
-        background_tasks.add_task(buffer_worker, session_id, difficulty, 1)
-        
         return JSONResponse(
             status_code=status.HTTP_202_ACCEPTED,
             content={
                 "status": "processing",
                 "message": "The agent is thinking. Please poll again shortly.",
-                "retry_after": 2
+                # A long-poll already waited server-side: come straight back
+                "retry_after": 0 if wait > 0 else 2
             }
         )
 
-@app.post("/verify_answer")
+@router.post("/verify_answer")
 async def verify_answer(request: Request):
     """
     Verify if the user's answer is correct.
     Expects JSON body: {"session_id": str, "user_answer": str, "riddle_id": str}
     Returns: {"correct": bool, "location": dict (if correct), "attempts_remaining": int}
     """
-    if not redis_client:
-        raise HTTPException(status_code=503, detail="Redis unavailable")
+    if not session_store:
+        raise HTTPException(status_code=503, detail="Session store unavailable")
     
     data = await request.json()
     session_id = data.get("session_id")
     user_answer = data.get("user_answer", "").strip().lower()
     user_id = data.get("user_id")
-    time_remaining = data.get("time_remaining", 0)  # Expecting frontend to send this
+    time_remaining = parse_time_remaining(data.get("time_remaining", 0))  # Expecting frontend to send this
 
     
     if not session_id or not user_answer:
         raise HTTPException(status_code=400, detail="Missing session_id or user_answer")
+    if time_remaining is None:
+        raise HTTPException(status_code=400, detail="time_remaining must be a number")
     
-    # Get the current riddle answer from Redis
-    answer_key = f"answer:{session_id}"
-    stored_answer = await redis_client.get(answer_key)
+    # One round trip: load active riddle + count attempt + read config
+    answer_data, attempts, difficulty = await session_store.check_answer(session_id)
+    if not difficulty: difficulty = "Medium"
     
-    if not stored_answer:
+    if not answer_data:
         raise HTTPException(status_code=404, detail="No active riddle found for this session")
     
-    # Parse stored answer data
-    answer_data = json.loads(stored_answer)
-    correct_answer = answer_data.get("answer", "").strip().lower()
+    return await judge_answer(
+        answer_data, attempts, difficulty,
+        data.get("user_answer", ""), user_id, time_remaining
+    )
+
+def parse_time_remaining(value: Any) -> Optional[int]:
+    """Client-sent seconds left as a non-negative int (missing = 0); None if it isn't a number."""
+    if value is None or value == "":
+        return 0
+    try:
+        return max(int(float(value)), 0)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+async def judge_answer(
+    answer_data: Dict[str, Any],
+    attempts: int,
+    difficulty: str,
+    raw_answer: str,
+    user_id: Optional[str] = None,
+    time_remaining: int = 0,
+    matcher: Optional[AnswerMatcher] = None
+) -> Dict[str, Any]:
+    """
+    Score a guess against the active riddle (already loaded + attempt counted).
+    Shared by verify_answer and the game WebSocket, which passes its cached matcher.
+    """
+    user_answer = raw_answer.strip().lower()
     location = answer_data.get("location")
+    if matcher is None:
+        matcher = AnswerMatcher.from_dict(answer_data.get("matcher"), answer_data.get("answer", ""))
     
-    # Track attempts
-    attempts_key = f"attempts:{session_id}"
-    attempts = await redis_client.incr(attempts_key)
-    await redis_client.expire(attempts_key, 3600)  # Expire after 1 hour
-    
-    # Verify answer (case-insensitive)
-    is_correct = user_answer == correct_answer
+    # Verify answer (aliases, punctuation and small typos accepted)
+    is_correct = matcher.matches(user_answer)
     
     if is_correct:
         if user_id:
@@ -383,14 +540,7 @@ async def verify_answer(request: Request):
             score = base_score + streak_bonus
             print(f"💰 Score Calculation: Base({base_score}) + Streak({new_streak}x -> {streak_bonus}) = {score}")
             
-            # Retrieve difficulty from config
-            config_key = f"config:{session_id}"
-            difficulty = await redis_client.hget(config_key, "difficulty")
-            if not difficulty: difficulty = "Medium"
-            
-            # Pass correct_answer (the city name) as city_target
-            # Note: correct_answer is already lowercased, maybe we want original case?
-            # answer_data.get("answer") preserves original casing
+            # The city name as city_target, original casing
             original_answer = answer_data.get("answer", "Unknown")
             
             db_service.save_score(
@@ -414,7 +564,7 @@ async def verify_answer(request: Request):
         
         if location and location.get("lat") and location.get("lng"):
             # Get original user answer (before lowercase)
-            original_answer = data.get("user_answer", "").strip()
+            original_answer = raw_answer.strip()
             hint = get_distance_hint(original_answer, location["lat"], location["lng"])
             
             if hint:
@@ -441,7 +591,7 @@ async def verify_answer(request: Request):
             "hint": hint  # Contains distance_km, direction, guessed_coords (if available)
         }
 
-@app.get("/search_city")
+@router.get("/search_city")
 async def search_city(q: str):
     """
     Search for city names in the DB matching the query.
@@ -455,46 +605,209 @@ async def search_city(q: str):
     results = await loop.run_in_executor(None, lambda: search_city_names(q))
     return {"results": results}
 
-@app.get("/stream_logs/{session_id}")
-async def stream_logs(session_id: str, request: Request):
+@router.get("/stream_logs/{session_id}")
+async def stream_logs(session_id: str, request: Request, last_event_id: Optional[str] = None):
     """
     SSE Endpoint.
-    Subscribes to the specific Redis Channel for this session
-    and yields logs in real-time to the client.
+    Replays the session's log stream after the client's Last-Event-ID
+    (header, or ?last_event_id= for clients that can't set headers),
+    then yields live logs from the shared log hub.
     """
-    if not redis_client:
-        raise HTTPException(status_code=503, detail="Redis unavailable")
-
-    async def event_generator() -> AsyncGenerator[str, None]:
-        # Create a dedicated PubSub connection for this request
-        pubsub = redis_client.pubsub()
-        channel = f"{LOG_CHANNEL_PREFIX}:{session_id}"
-        await pubsub.subscribe(channel)
-        
+    if not session_store:
+        raise HTTPException(status_code=503, detail="Session store unavailable")
+
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    if resume_from:
         try:
-            # Check for client disconnect
-            while True:
-                if await request.is_disconnected():
-                    break
-                
-                # Get message from channel with a short timeout to allow loop check
-                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-                
-                if message and message["type"] == "message":
-                    # SSE format: "data: <payload>\n\n"
-                    payload = message["data"]
-                    yield f"{payload}"
-                    
-                    # If generation is complete, we might want to signal frontend?
-                    # For now, we just keep stream open for the next question's logs.
-                
-                # Small yield to prevent CPU hogging
-                await asyncio.sleep(0.1)
-                
-        except asyncio.CancelledError:
-            print(f"Client disconnected from stream: {session_id}")
-        finally:
-            await pubsub.unsubscribe(channel)
-            await pubsub.close()
+            parse_entry_id(resume_from)
+        except ValueError:
+            resume_from = None  # Garbage id: replay everything we still have
+
+    async def event_generator() -> AsyncGenerator[dict, None]:
+        # No per-client Redis connection: the process-wide log hub pushes
+        # this session's lines into a bounded queue we simply await.
+        # Subscribe first, then replay, so no line falls in between.
+        with log_hub.subscribe(session_id) as subscription:
+            try:
+                async for event in subscription.stream(resume_from):
+                    yield event
+            except asyncio.CancelledError:
+                print(f"Client disconnected from stream: {session_id}")
+                raise
+
+    # Heartbeats keep idle streams alive through proxies; disconnects are
+    # detected by EventSourceResponse itself (no polling needed).
+    return EventSourceResponse(event_generator(), ping=LOG_HEARTBEAT_SEC)
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint (this process only; workers expose their own)."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@router.get("/debug/admission")
+async def debug_admission():
+    """Generation backlog vs capacity, and the degradation level it led to."""
+    return admission.snapshot()
+
+@router.get("/debug/quota")
+async def debug_quota():
+    """Provider quota used today, the reserve held for live play and this hour's pacing allowance."""
+    return QUOTA.snapshot()
+
+@router.get("/debug/loop")
+async def debug_loop(top: int = 10):
+    """Event-loop lag percentiles and the code that blocked the loop the most."""
+    if not loop_monitor:
+        raise HTTPException(status_code=404, detail="Loop monitor disabled (LOOP_MONITOR=0)")
+    return loop_monitor.snapshot(top)
 
-    return EventSourceResponse(event_generator())
\ No newline at end of file
+# ==========================================
+# GAME WEBSOCKET
+# ==========================================
+
+@router.websocket("/ws/{session_id}")
+async def game_socket(
+    websocket: WebSocket,
+    session_id: str,
+    user_id: Optional[str] = None,
+    last_event_id: Optional[str] = None
+):
+    """
+    Single game channel: questions, answers and agent logs over one connection.
+
+    Client -> server frames:
+        {"type": "get_question"}      question is pushed as soon as it's ready
+        {"type": "answer", "answer": str, "time_remaining": int, "user_id"?: str}
+        {"type": "ping"}
+    Server -> client frames:
+        {"type": "question", "data", "queue_status", "queue_depth"}
+        {"type": "queue_status", "status": "processing", "queue_depth"}
+        {"type": "verdict", ...same body as /verify_answer}
+        {"type": "log", "id", "data"}  replayed after ?last_event_id=, then live
+        {"type": "error", "detail"} | {"type": "pong"}
+
+    Session config is read once on connect and the active riddle's compiled
+    matcher lives on the connection, so each action costs one frame plus at
+    most one Redis round trip.
+    """
+    if not session_store:
+        await websocket.close(code=1013)  # Try again later
+        return
+
+    difficulty, _ = await session_store.get_session(session_id)
+    if not difficulty:
+        await websocket.close(code=4404)  # Unknown or expired session
+        return
+    await websocket.accept()
+    print(f"🔌 Game socket connected: {session_id}")
+
+    resume_from = last_event_id
+    if resume_from:
+        try:
+            parse_entry_id(resume_from)
+        except ValueError:
+            resume_from = None
+
+    # Cached for the connection's lifetime
+    active_matcher: Optional[AnswerMatcher] = None
+    send_lock = asyncio.Lock()  # Frames come from the reader, log and question tasks
+
+    async def send(message: Dict[str, Any]):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def pump_logs():
+        with log_hub.subscribe(session_id) as subscription:
+            async for event in subscription.stream(resume_from):
+                await send({"type": "log", **event})
+
+    async def push_question():
+        nonlocal active_matcher
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                riddle, current_difficulty, queue_depth = await fetch_question(session_id, wait=MAX_LONG_POLL_SEC)
+            except Exception as e:
+                print(f"❌ Game socket question fetch failed for {session_id}: {e}")
+                await send({"type": "error", "detail": "Failed to fetch question"})
+                return
+            if current_difficulty is None:
+                await send({"type": "error", "detail": "Session expired. Start a new session."})
+                return
+            if riddle:
+                break
+            await send({"type": "queue_status", "status": "processing", "queue_depth": queue_depth})
+            if loop.time() - started < 1:
+                # No long-poll slot was free: back off like the REST retry_after
+                await asyncio.sleep(2)
+
+        active_matcher = riddle.matcher()
+        async with send_lock:
+            await websocket.send_text(question_body(riddle, queue_depth, frame_type="question"))
+
+    async def handle_answer(message: Dict[str, Any]):
+        raw_answer = str(message.get("answer") or "")
+        if not raw_answer.strip():
+            await send({"type": "error", "detail": "Missing answer"})
+            return
+        time_remaining = parse_time_remaining(message.get("time_remaining", 0))
+        if time_remaining is None:
+            await send({"type": "error", "detail": "time_remaining must be a number"})
+            return
+
+        # One round trip: load active riddle + count attempt
+        answer_data, attempts, current_difficulty = await session_store.check_answer(session_id)
+        if not answer_data:
+            await send({"type": "error", "detail": "No active riddle found for this session"})
+            return
+
+        # Reuse the compiled matcher unless the riddle was swapped (e.g. via REST)
+        matcher = active_matcher
+        if matcher is None or matcher.canonical != answer_data.get("answer"):
+            matcher = None
+
+        verdict = await judge_answer(
+            answer_data, attempts, current_difficulty or difficulty,
+            raw_answer, message.get("user_id") or user_id,
+            time_remaining, matcher
+        )
+        await send({"type": "verdict", **verdict})
+
+    def log_failure(task: asyncio.Task):
+        # Background frames: a failure would otherwise go unnoticed until the task is collected
+        if not task.cancelled() and task.exception() is not None:
+            print(f"❌ Game socket task {task.get_name()} failed for {session_id}: {task.exception()}")
+
+    log_task = asyncio.create_task(pump_logs(), name="pump_logs")
+    log_task.add_done_callback(log_failure)
+    question_task: Optional[asyncio.Task] = None
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await send({"type": "error", "detail": "Frames must be JSON objects"})
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+
+            if kind == "get_question":
+                # At most one outstanding request per connection
+                if question_task is None or question_task.done():
+                    question_task = asyncio.create_task(push_question(), name="push_question")
+                    question_task.add_done_callback(log_failure)
+            elif kind == "answer":
+                await handle_answer(message)
+            elif kind == "ping":
+                await send({"type": "pong"})
+            else:
+                await send({"type": "error", "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        print(f"🔌 Game socket disconnected: {session_id}")
+    finally:
+        for task in (log_task, question_task):
+            if task:
+                task.cancel()
+
+
+app = create_app()
@@ -0,0 +1,89 @@
+"""
+Throughput benchmark for answer verification.
+
+Compares the old exact-string check against the precompiled AnswerMatcher
+(rehydrated from its stored dict on every call, exactly like verify_answer).
+
+Run from TheAgenticLoop/:
+    python -m benchmarks.bench_answer_matcher
+"""
+
+import json
+import random
+import time
+
+from services.matcher import AnswerMatcher, build_matcher, CITY_ALIASES
+
+ITERATIONS = 200_000
+
+SAMPLE_ANSWERS = [
+    "Delhi", "Mumbai", "Allahabad (Prayagraj)", "Thiruvananthapuram", "Hubli-Dharwad",
+    "Washington D.C.", "St. Petersburg", "Rio de Janeiro", "Kuala Lumpur", "Ulaanbaatar",
+    "Paris", "Tokyo", "Reykjavik", "Kuwait City", "Sao Paulo",
+] + list(CITY_ALIASES.keys())
+
+
+def _make_guesses(answer: str) -> list[str]:
+    """A realistic mix: exact, alias, typo and a wrong city."""
+    typo = answer[:-2] + answer[-1] + answer[-2] if len(answer) > 3 else answer
+    guesses = [answer, answer.lower(), typo, "London"]
+    guesses.extend(CITY_ALIASES.get(answer, [])[:1])
+    return guesses
+
+
+def bench_exact(payloads: list[tuple[str, str]]) -> float:
+    start = time.perf_counter()
+    for stored, guess in payloads:
+        answer_data = json.loads(stored)
+        _ = guess.strip().lower() == answer_data["answer"].strip().lower()
+    return time.perf_counter() - start
+
+
+def bench_matcher(payloads: list[tuple[str, str]]) -> float:
+    start = time.perf_counter()
+    for stored, guess in payloads:
+        answer_data = json.loads(stored)
+        matcher = AnswerMatcher.from_dict(answer_data["matcher"], answer_data["answer"])
+        _ = matcher.matches(guess)
+    return time.perf_counter() - start
+
+
+def main():
+    print("=" * 60)
+    print(f"ANSWER VERIFICATION BENCHMARK - {ITERATIONS:,} verifications")
+    print("=" * 60)
+
+    # Build the stored payloads once, like buffer_worker does at enqueue time
+    build_start = time.perf_counter()
+    stored = {}
+    for answer in SAMPLE_ANSWERS:
+        stored[answer] = json.dumps({
+            "answer": answer,
+            "location": {"name": answer, "lat": 0.0, "lng": 0.0},
+            "matcher": build_matcher(answer).to_dict()
+        })
+    build_ms = (time.perf_counter() - build_start) * 1000 / len(SAMPLE_ANSWERS)
+
+    rng = random.Random(42)
+    payloads = []
+    for _ in range(ITERATIONS):
+        answer = rng.choice(SAMPLE_ANSWERS)
+        payloads.append((stored[answer], rng.choice(_make_guesses(answer))))
+
+    exact_s = bench_exact(payloads)
+    matcher_s = bench_matcher(payloads)
+
+    print(f"\n🔨 Matcher build (enqueue time): {build_ms * 1000:.1f}µs per riddle")
+    print(f"📏 Exact string compare:  {ITERATIONS / exact_s:>12,.0f} verifications/s")
+    print(f"🎯 Precompiled matcher:   {ITERATIONS / matcher_s:>12,.0f} verifications/s")
+    print(f"   Per verification: {matcher_s / ITERATIONS * 1e6:.2f}µs (vs {exact_s / ITERATIONS * 1e6:.2f}µs exact)")
+
+    accepted = sum(
+        AnswerMatcher.from_dict(json.loads(s)["matcher"]).matches(g)
+        for s, g in payloads[:10_000]
+    )
+    print(f"\n✅ Accepted {accepted / 100:.1f}% of sample guesses (exact + alias + typo)")
+
+
+if __name__ == "__main__":
+    main()
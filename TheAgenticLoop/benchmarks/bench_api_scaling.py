@@ -0,0 +1,207 @@
+"""
+API throughput vs serve.py worker count (multi-process scaling).
+
+For each --workers value: start `serve.py --workers N` (GENERATION_MODE=queue,
+so API processes only serve), seed sessions with an armed riddle directly in
+Redis, then hammer the hot path from --clients load-generator processes for
+--duration seconds:
+
+    POST /verify_answer  wrong guess -> check_answer Lua + matcher + distance
+                         hint from the shared (preloaded) coordinate table
+
+Reports requests/s, speedup and parallel efficiency against 1 worker, and
+per-worker memory from /proc (Private = USS; Shared = pages still shared
+copy-on-write with the preloading parent).
+
+The load generators need CPU too: for clean numbers run them on another
+box (--url) or give the machine >= 2x the largest worker count in cores.
+
+Run from TheAgenticLoop/ (needs a real Redis):
+    python -m benchmarks.bench_api_scaling --workers 1 2 4 8 --clients 8
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import redis.asyncio as redis
+
+from services import riddle_codec
+from services.matcher import build_matcher
+from services.session_store import RedisSessionStore
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+SESSION_PREFIX = "bench-scale-"
+STARTUP_TIMEOUT_SEC = 30
+
+RIDDLE = riddle_codec.encode({
+    "riddle": "x" * 120, "answer": "Mumbai", "difficulty": "INDIA_EASY", "topic": "Geography",
+    "location": {"name": "Mumbai", "lat": 19.076, "lng": 72.8777},
+    "provider_stats": {"generator_provider": "bench", "critic_provider": "none", "total_time_ms": 1, "accepted": True},
+    "matcher": build_matcher("Mumbai").to_dict(),
+})
+GUESSES = ["Delhi", "Chennai", "Kolkata", "Pune", "Jaipur"]  # Known cities: a hint is computed
+
+
+async def seed_sessions(count: int):
+    client = redis.from_url(REDIS_URL, decode_responses=True)
+    store = RedisSessionStore(client)
+    for i in range(count):
+        session_id = f"{SESSION_PREFIX}{i}"
+        await store.create_session(session_id, "INDIA_EASY")
+        await store.push_riddle(session_id, RIDDLE)
+        await store.pop_question(session_id)  # Arms the answer (target 0: no refills)
+    await client.aclose()
+
+
+async def clear_sessions():
+    client = redis.from_url(REDIS_URL, decode_responses=True)
+    keys = [k async for k in client.scan_iter(match=f"*:{SESSION_PREFIX}*", count=5000)]
+    if keys:
+        await client.delete(*keys)
+    await client.aclose()
+
+
+# ------------------------------------------------------------------
+# LOAD GENERATOR (one process each)
+# ------------------------------------------------------------------
+
+async def _hammer(url: str, sessions: int, concurrency: int, duration: float, offset: int) -> int:
+    done = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def loop(n: int):
+        nonlocal done
+        session_id = f"{SESSION_PREFIX}{(offset + n) % sessions}"
+        i = 0
+        while time.perf_counter() < deadline:
+            response = await client.post("/verify_answer", json={
+                "session_id": session_id, "user_answer": GUESSES[i % len(GUESSES)], "time_remaining": 30
+            })
+            if response.status_code == 200:
+                done += 1
+            i += 1
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        await asyncio.gather(*(loop(n) for n in range(concurrency)))
+    return done
+
+
+def _client_process(url: str, sessions: int, concurrency: int, duration: float, offset: int, results):
+    results.put(asyncio.run(_hammer(url, sessions, concurrency, duration, offset)))
+
+
+def generate_load(args, url: str) -> float:
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_client_process, args=(
+            url, args.sessions, args.concurrency, args.duration, i * args.concurrency, results))
+        for i in range(args.clients)
+    ]
+    started = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    total = sum(results.get() for _ in procs)
+    for proc in procs:
+        proc.join()
+    return total / (time.perf_counter() - started)
+
+
+# ------------------------------------------------------------------
+# SERVER
+# ------------------------------------------------------------------
+
+def worker_memory(parent_pid: int) -> Optional[Dict[str, float]]:
+    """Mean Private / Shared MiB over the parent's children (Linux only)."""
+    try:
+        with open(f"/proc/{parent_pid}/task/{parent_pid}/children") as f:
+            pids = [int(p) for p in f.read().split()]
+        totals = {"private": 0.0, "shared": 0.0}
+        for pid in pids:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    if name in ("Private_Clean", "Private_Dirty"):
+                        totals["private"] += int(value.split()[0]) / 1024
+                    elif name in ("Shared_Clean", "Shared_Dirty"):
+                        totals["shared"] += int(value.split()[0]) / 1024
+        return {k: v / len(pids) for k, v in totals.items()} if pids else None
+    except OSError:
+        return None
+
+
+async def wait_until_up(url: str, proc: subprocess.Popen):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SEC
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"serve.py exited with code {proc.returncode}")
+            try:
+                await client.get(f"{url}/openapi.json", timeout=1)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"serve.py did not come up within {STARTUP_TIMEOUT_SEC}s")
+
+
+def measure(args, workers: int, log_dir: str) -> Dict[str, float]:
+    url = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, "GENERATION_MODE": "queue", "REDIS_URL": REDIS_URL, "LOOP_MONITOR": "0",
+           "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "stub"), "PYTHONUNBUFFERED": "1"}
+    log = open(os.path.join(log_dir, f"serve-{workers}.log"), "w")
+    proc = subprocess.Popen([sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port)],
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        asyncio.run(wait_until_up(url, proc))
+        time.sleep(1)  # Let every worker finish its lifespan
+        rate = generate_load(args, url)
+        return {"rate": rate, **(worker_memory(proc.pid) or {})}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        log.close()
+
+
+def main(args):
+    print("=" * 72)
+    print(f"API SCALING BENCHMARK - {os.cpu_count()} cores, {args.clients} load processes x "
+          f"{args.concurrency} connections, {args.duration:g}s per run")
+    print("=" * 72)
+    asyncio.run(seed_sessions(args.sessions))
+    log_dir = tempfile.mkdtemp(prefix="atlast-scaling-")
+    results: List[Dict[str, float]] = []
+    try:
+        for workers in args.workers:
+            result = measure(args, workers, log_dir)
+            results.append(result)
+            base = results[0]["rate"] * workers / args.workers[0]
+            memory = (f"{result['private']:7.1f} MiB private {result['shared']:7.1f} MiB shared"
+                      if "private" in result else "memory n/a")
+            print(f"{workers:>3} workers {result['rate']:>10,.0f} req/s  "
+                  f"speedup {result['rate'] / results[0]['rate'] * args.workers[0]:5.2f}x  "
+                  f"efficiency {result['rate'] / base:6.1%}  | per worker: {memory}")
+    finally:
+        asyncio.run(clear_sessions())
+    if max(args.workers) * 2 > (os.cpu_count() or 1):
+        print(f"\n⚠️ {os.cpu_count()} cores for up to {max(args.workers)} workers plus the load generators: "
+              "runs above the core count are CPU-bound and won't scale")
+    print(f"Server logs in {log_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput vs serve.py worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--clients", type=int, default=4, help="Load-generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="Connections per load process")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per run")
+    parser.add_argument("--sessions", type=int, default=200, help="Seeded sessions (spread across connections)")
+    parser.add_argument("--port", type=int, default=8500)
+    main(parser.parse_args())
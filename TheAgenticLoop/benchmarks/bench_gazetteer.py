@@ -0,0 +1,96 @@
+"""
+Gazetteer load and lookup cost: parsing the dump per process vs the mmapped
+columnar cache (services/gazetteer.py).
+
+Writes a synthetic GeoNames-format dump (--cities rows, real layout, random
+names and coordinates) unless --source points at a real one, then compares:
+
+    parse    read the TSV into a dict of name -> row tuples (what each process
+             would do at startup without the cache)
+    mmap     Gazetteer(cache): open + column casts
+    find     coordinate lookup by name (hint path), dict vs binary search
+    select   building one population/region pool from the cache
+
+Run from TheAgenticLoop/:
+    python -m benchmarks.bench_gazetteer --cities 50000
+"""
+
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+import tracemalloc
+
+from services.gazetteer import Gazetteer, PoolFilter, build, read_geonames
+from services.matcher import normalize_name
+
+LOOKUPS = 50_000
+COUNTRIES = ["IN", "US", "CN", "BR", "DE", "FR", "JP", "NG", "MX", "ID"]
+
+
+def write_synthetic(path: str, count: int):
+    rng = random.Random(7)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            name = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 12))).title()
+            code = "PPLC" if i % 200 == 0 else "PPLA" if i % 50 == 0 else "PPL"
+            population = int(15000 * rng.paretovariate(1.1))
+            cols = [str(100000 + i), name, name, "", f"{rng.uniform(-60, 70):.5f}", f"{rng.uniform(-180, 180):.5f}",
+                    "P", code, rng.choice(COUNTRIES), "", "", "", "", "", str(population), "", "0", "UTC", "2024-01-01"]
+            f.write("\t".join(cols) + "\n")
+
+
+def timed(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="atlast-gazetteer-")
+    source = args.source or os.path.join(workdir, "cities.txt")
+    if not args.source:
+        write_synthetic(source, args.cities)
+    cache = os.path.join(workdir, "cities.gaz")
+
+    stats, build_sec, _ = timed(lambda: build(source, cache, os.path.join(workdir, "ids.txt")))
+    print("=" * 72)
+    print(f"GAZETTEER BENCHMARK - {stats['rows']:,} cities, cache {os.path.getsize(cache) / 2**20:.1f} MiB "
+          f"(built once in {build_sec:.2f}s)")
+    print("=" * 72)
+
+    table, parse_sec, parse_mib = timed(lambda: {normalize_name(r[1]): r for r in read_geonames(source)})
+    gazetteer, open_sec, open_mib = timed(lambda: Gazetteer(cache))
+    print(f"{'parse TSV -> dict':<24} {parse_sec * 1000:>9.1f} ms  {parse_mib:>7.1f} MiB Python heap per process")
+    print(f"{'mmap cache':<24} {open_sec * 1000:>9.3f} ms  {open_mib:>7.3f} MiB Python heap (pages shared)")
+
+    names = [gazetteer.name(row) for row in random.Random(1).choices(range(len(gazetteer)), k=LOOKUPS)]
+    started = time.perf_counter()
+    for name in names:
+        row = table.get(normalize_name(name))
+        _ = (row[2], row[3])
+    dict_us = (time.perf_counter() - started) / LOOKUPS * 1e6
+    started = time.perf_counter()
+    for name in names:
+        gazetteer.coordinates(name)
+    mmap_us = (time.perf_counter() - started) / LOOKUPS * 1e6
+    print(f"{'find (dict)':<24} {dict_us:>9.2f} us")
+    print(f"{'find (mmap index)':<24} {mmap_us:>9.2f} us")
+
+    pool = PoolFilter(countries=("IN",), min_population=100_000, limit=300)
+    rows, select_sec, _ = timed(lambda: gazetteer.select(pool))
+    print(f"{'select IN >=100k':<24} {select_sec * 1000:>9.2f} ms  -> {len(rows)} cities")
+    print(f"Files in {workdir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gazetteer cache vs parsing the dump")
+    parser.add_argument("--cities", type=int, default=50_000, help="Synthetic dump size")
+    parser.add_argument("--source", help="A real GeoNames cities*.txt instead of the synthetic one")
+    main(parser.parse_args())
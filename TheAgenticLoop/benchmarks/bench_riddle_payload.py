@@ -0,0 +1,137 @@
+"""
+Queued riddle payloads: v1 (whole dict as JSON) vs v2 (services.riddle_codec).
+
+Measures, per riddle:
+    bytes       payload length, and Redis MEMORY USAGE of a one-entry queue
+                (if REDIS_URL is reachable); msgpack of the same dict for
+                reference when ormsgpack / msgpack is installed
+    serve CPU   API-side work per get_question hit, network excluded:
+                v1  json.loads + drop matcher + jsonable_encoder + JSONResponse
+                v2  decode + splice the pre-encoded client JSON into the body
+    arm CPU     verification fields for the session hash (MemorySessionStore /
+                pipeline fallback; the Lua arm() does the same split in Redis)
+
+Run from TheAgenticLoop/:
+    python -m benchmarks.bench_riddle_payload
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import redis.asyncio as redis
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from services import riddle_codec
+from services.matcher import AnswerMatcher, build_matcher
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+ITERATIONS = int(os.getenv("ITERATIONS", "20000"))
+QUEUE_DEPTH = 2
+
+SAMPLE_RIDDLE = {
+    "riddle": "Where monsoon winds meet a harbour of islands, a gateway arch faces the sea. "
+              "Film reels spin faster here than anywhere else on Earth.",
+    "answer": "Mumbai",
+    "difficulty": "INDIA_EASY",
+    "topic": "Geography",
+    "location": {"name": "Mumbai", "lat": 19.076, "lng": 72.8777},
+    "provider_stats": {"generator_provider": "groq", "critic_provider": "cohere",
+                       "total_time_ms": 1432, "accepted": True},
+    "matcher": build_matcher("Mumbai").to_dict(),
+}
+
+V1 = json.dumps(SAMPLE_RIDDLE)
+V2 = riddle_codec.encode(SAMPLE_RIDDLE)
+
+
+def serve_v1(raw: str) -> bytes:
+    """get_question before: parse, strip the matcher, let FastAPI re-encode."""
+    data = json.loads(raw)
+    AnswerMatcher.from_dict(data.pop("matcher", None), data.get("answer", ""))
+    content = {"status": "ready", "data": data, "queue_status": "refilling", "queue_depth": QUEUE_DEPTH}
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def serve_v2(raw: str) -> bytes:
+    riddle = riddle_codec.decode(raw)
+    riddle.matcher()
+    body = (f'{{"status":"ready","data":{riddle.client_json},'
+            f'"queue_status":"refilling","queue_depth":{QUEUE_DEPTH}}}')
+    return Response(content=body, media_type="application/json").body
+
+
+def arm_v1(raw: str) -> dict:
+    riddle = json.loads(raw)
+    location = riddle.get("location") or {}
+    return {
+        "answer": riddle.get("answer") or location.get("name", ""),
+        "lat": location.get("lat", ""), "lng": location.get("lng", ""),
+        "keys": "|".join((riddle.get("matcher") or {}).get("keys", [])), "attempts": 0,
+    }
+
+
+def per_call_us(fn, raw: str) -> float:
+    fn(raw)  # Warm up
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn(raw)
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def msgpack_size() -> str:
+    try:
+        import ormsgpack
+        return f"{len(ormsgpack.packb(SAMPLE_RIDDLE))} B"
+    except ImportError:
+        pass
+    try:
+        import msgpack
+        return f"{len(msgpack.packb(SAMPLE_RIDDLE))} B"
+    except ImportError:
+        return "n/a (no msgpack package)"
+
+
+async def redis_usage(payload: str):
+    client = redis.from_url(REDIS_URL, decode_responses=True)
+    try:
+        await client.ping()
+        key = "bench:payload"
+        await client.delete(key)
+        await client.rpush(key, payload)
+        usage = await client.memory_usage(key)
+        await client.delete(key)
+        return usage
+    except (redis.ConnectionError, OSError):
+        return None
+    finally:
+        await client.aclose()
+
+
+async def main():
+    # Same response either way; only the route there changes
+    assert json.loads(serve_v1(V1)) == json.loads(serve_v2(V2))
+
+    print("=" * 64)
+    print(f"RIDDLE PAYLOAD BENCHMARK - {ITERATIONS:,} iterations per path")
+    print("=" * 64)
+
+    v1_redis, v2_redis = await redis_usage(V1), await redis_usage(V2)
+    print(f"\n{'':<20}{'payload':>10}{'in Redis':>12}")
+    for label, raw, usage in (("v1 JSON", V1, v1_redis), ("v2 riddle_codec", V2, v2_redis)):
+        in_redis = f"{usage} B" if usage is not None else "n/a"
+        print(f"{label:<20}{len(raw.encode()):>8} B{in_redis:>12}")
+    print(f"msgpack (reference) {msgpack_size():>10}")
+
+    serve1, serve2 = per_call_us(serve_v1, V1), per_call_us(serve_v2, V2)
+    arm1, arm2 = per_call_us(arm_v1, V1), per_call_us(riddle_codec.verification_fields, V2)
+    print(f"\n{'CPU per call (µs)':<20}{'v1':>10}{'v2':>10}{'speedup':>10}")
+    print(f"{'get_question serve':<20}{serve1:>10.1f}{serve2:>10.1f}{serve1 / serve2:>9.1f}x")
+    print(f"{'arm (hash fields)':<20}{arm1:>10.1f}{arm2:>10.1f}{arm1 / arm2:>9.1f}x")
+    print(f"\nv2 encoder: {riddle_codec.ENCODER}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
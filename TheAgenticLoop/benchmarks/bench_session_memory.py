@@ -0,0 +1,129 @@
+"""
+Redis memory per 10k sessions: legacy 5-key layout vs consolidated session hash.
+
+Needs a REAL Redis (FakeRedis doesn't account memory). Writes under a
+`bench:` key prefix and deletes it afterwards.
+
+Run from TheAgenticLoop/:
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.bench_session_memory
+"""
+
+import asyncio
+import json
+import os
+
+import redis.asyncio as redis
+
+from services.matcher import build_matcher
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+SESSIONS = 10_000
+PREFIX = "bench"
+
+SAMPLE_RIDDLE = {
+    "riddle": "Where monsoon winds meet a harbour of islands, a gateway arch faces the sea. "
+              "Film reels spin faster here than anywhere else on Earth.",
+    "answer": "Mumbai",
+    "difficulty": "INDIA_EASY",
+    "topic": "Geography",
+    "location": {"name": "Mumbai", "lat": 19.076, "lng": 72.8777},
+    "provider_stats": {"generator_provider": "groq", "critic_provider": "cohere",
+                       "total_time_ms": 1432, "accepted": True},
+    "matcher": build_matcher("Mumbai").to_dict(),
+}
+USED = ["Mumbai", "Delhi", "Pune"]
+
+
+async def used_memory(client) -> int:
+    info = await client.info("memory")
+    return info["used_memory"]
+
+
+async def clear(client):
+    keys = [k async for k in client.scan_iter(match=f"{PREFIX}:*", count=5000)]
+    for i in range(0, len(keys), 5000):
+        await client.delete(*keys[i:i + 5000])
+
+
+def write_legacy(pipe, sid: str, queued: str):
+    pipe.hset(f"{PREFIX}:config:{sid}", mapping={"difficulty": "INDIA_EASY"})
+    pipe.expire(f"{PREFIX}:config:{sid}", 3600)
+    pipe.set(f"{PREFIX}:answer:{sid}", json.dumps({
+        "answer": SAMPLE_RIDDLE["answer"], "location": SAMPLE_RIDDLE["location"],
+        "matcher": SAMPLE_RIDDLE["matcher"]}), ex=3600)
+    pipe.set(f"{PREFIX}:attempts:{sid}", 2, ex=3600)
+    pipe.sadd(f"{PREFIX}:used_cities:{sid}", *USED)
+    pipe.expire(f"{PREFIX}:used_cities:{sid}", 3600)
+    pipe.rpush(f"{PREFIX}:queue:{sid}", queued, queued)
+
+
+def write_consolidated(pipe, sid: str, queued: str):
+    pipe.hset(f"{PREFIX}:session:{sid}", mapping={
+        "difficulty": "INDIA_EASY",
+        "answer": "Mumbai", "lat": "19.076", "lng": "72.8777",
+        "keys": "|".join(SAMPLE_RIDDLE["matcher"]["keys"]),
+        "attempts": 2,
+    })
+    pipe.expire(f"{PREFIX}:session:{sid}", 3600)
+    # Seen-city bitmap: u32 cursor + one bit per city ID (USED = IDs 1, 0, 9)
+    pipe.execute_command("BITFIELD", f"{PREFIX}:seen:{sid}", "SET", "u32", 0, 3)
+    for city_id in (1, 0, 9):
+        pipe.setbit(f"{PREFIX}:seen:{sid}", 32 + city_id, 1)
+    pipe.expire(f"{PREFIX}:seen:{sid}", 3600)
+    pipe.rpush(f"{PREFIX}:queue:{sid}", queued, queued)
+    pipe.expire(f"{PREFIX}:queue:{sid}", 3600)
+
+
+def write_queue_only(pipe, sid: str, queued: str):
+    """Baseline: the queued riddles both layouts share."""
+    pipe.rpush(f"{PREFIX}:queue:{sid}", queued, queued)
+    pipe.expire(f"{PREFIX}:queue:{sid}", 3600)
+
+
+async def measure(client, writer) -> tuple[int, int]:
+    await clear(client)
+    before = await used_memory(client)
+    queued = json.dumps(SAMPLE_RIDDLE)
+    for start in range(0, SESSIONS, 500):
+        async with client.pipeline(transaction=False) as pipe:
+            for i in range(start, start + 500):
+                writer(pipe, f"s{i}", queued)
+            await pipe.execute()
+    after = await used_memory(client)
+    key_count = len([k async for k in client.scan_iter(match=f"{PREFIX}:*", count=5000)])
+    await clear(client)
+    return after - before, key_count
+
+
+async def main():
+    client = redis.from_url(REDIS_URL, decode_responses=True)
+    await client.ping()
+
+    print("=" * 60)
+    print(f"SESSION MEMORY BENCHMARK - {SESSIONS:,} sessions ({REDIS_URL})")
+    print("=" * 60)
+
+    legacy_bytes, legacy_keys = await measure(client, write_legacy)
+    new_bytes, new_keys = await measure(client, write_consolidated)
+    queue_bytes, _ = await measure(client, write_queue_only)
+
+    encoding_probe = f"{PREFIX}:session:probe"
+    async with client.pipeline(transaction=False) as pipe:
+        write_consolidated(pipe, "probe", "{}")
+        await pipe.execute()
+    encoding = await client.object("encoding", encoding_probe)
+    await clear(client)
+
+    print(f"\n🗝️  Legacy (5 keys/session):             {legacy_bytes / 1024 / 1024:7.2f} MiB  ({legacy_keys:,} keys)")
+    print(f"📦 Consolidated (hash + queue + seen): {new_bytes / 1024 / 1024:7.2f} MiB  ({new_keys:,} keys)")
+    print(f"   Session hash encoding: {encoding}")
+    print(f"\n💾 Saved {(legacy_bytes - new_bytes) / SESSIONS:.0f} bytes/session "
+          f"({(1 - new_bytes / legacy_bytes) * 100:.0f}% incl. the 2 queued riddles)")
+    print(f"   Session state alone: {(legacy_bytes - queue_bytes) / SESSIONS:.0f} -> "
+          f"{(new_bytes - queue_bytes) / SESSIONS:.0f} bytes/session")
+
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
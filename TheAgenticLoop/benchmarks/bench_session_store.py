@@ -0,0 +1,122 @@
+"""
+SessionStore backends under the API's real per-session workload.
+
+One "game round" = what a player costs the store:
+    create_session, 3x push_riddle (+ draw_city), pop_question,
+    2x check_answer, get_session, 6x append_log, read_log
+
+Compared:
+    memory      MemorySessionStore (native dicts/deques, the Redis-down fallback)
+    fakeredis   RedisSessionStore on FakeAsyncRedis (the old fallback)
+    redis       RedisSessionStore on a real Redis, if REDIS_URL is reachable
+
+Run from TheAgenticLoop/:
+    python -m benchmarks.bench_session_store
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import redis.asyncio as redis
+
+from services.matcher import build_matcher
+from services.memory_store import MemorySessionStore
+from services.session_store import RedisSessionStore
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+ROUNDS = int(os.getenv("ROUNDS", "2000"))
+CONCURRENCY = 50  # Players in flight at once
+OPS_PER_ROUND = 17
+
+CITIES = ["Mumbai", "Paris", "Tokyo", "Lima", "Cairo", "Oslo"]
+DECK = [17, 3, 41, 8, 29, 0, 35, 12, 22, 5]  # Shuffled city IDs, as from CityCatalog.deck
+
+
+def make_riddle(city: str) -> str:
+    return json.dumps({
+        "riddle": "x" * 120,
+        "answer": city,
+        "difficulty": "GLOBAL_EASY",
+        "topic": "Geography",
+        "location": {"name": city, "lat": 10.5, "lng": 20.25},
+        "provider_stats": {"generator_provider": "bench", "critic_provider": "none",
+                           "total_time_ms": 1, "accepted": True},
+        "matcher": build_matcher(city).to_dict(),
+    })
+
+
+RIDDLES = [make_riddle(city) for city in CITIES]
+
+
+async def game_round(store, session_id: str):
+    await store.create_session(session_id, "GLOBAL_EASY", pending=3)
+    for i in range(3):
+        await store.draw_city(session_id, "GLOBAL_EASY", DECK)
+        await store.push_riddle(session_id, RIDDLES[i])
+    await store.pop_question(session_id, 3)
+    await store.check_answer(session_id)
+    await store.check_answer(session_id)
+    await store.get_session(session_id)
+    for i in range(6):
+        await store.append_log(session_id, f"Agent step {i}")
+    await store.read_log(session_id)
+
+
+async def run(store, label: str, prefix: str) -> float:
+    start = time.perf_counter()
+    for batch in range(0, ROUNDS, CONCURRENCY):
+        await asyncio.gather(*(
+            game_round(store, f"{prefix}{i}")
+            for i in range(batch, min(batch + CONCURRENCY, ROUNDS))
+        ))
+    elapsed = time.perf_counter() - start
+    ops = ROUNDS * OPS_PER_ROUND / elapsed
+    print(f"{label:<28} {ROUNDS / elapsed:>10,.0f} rounds/s  {ops:>10,.0f} ops/s  "
+          f"({elapsed / ROUNDS * 1e6:,.0f}µs per round)")
+    return ops
+
+
+async def clear(client, prefix: str):
+    keys = [k async for k in client.scan_iter(match=f"*:{prefix}*", count=5000)]
+    for i in range(0, len(keys), 5000):
+        await client.delete(*keys[i:i + 5000])
+
+
+async def main():
+    print("=" * 70)
+    print(f"SESSION STORE BENCHMARK - {ROUNDS:,} game rounds, {CONCURRENCY} concurrent ({REDIS_URL})")
+    print("=" * 70)
+
+    results = {}
+
+    memory = MemorySessionStore()
+    await memory.start()
+    results["memory"] = await run(memory, "🧠 MemorySessionStore", "bench-")
+    await memory.close()
+
+    try:
+        from fakeredis import FakeAsyncRedis
+        fake = RedisSessionStore(FakeAsyncRedis(decode_responses=True))
+        results["fakeredis"] = await run(fake, "🧪 FakeRedis", "bench-")
+    except ImportError:
+        print("🧪 FakeRedis                  skipped (fakeredis not installed)")
+
+    try:
+        client = redis.from_url(REDIS_URL, decode_responses=True)
+        await client.ping()
+        results["redis"] = await run(RedisSessionStore(client), "🟥 Redis", "bench-")
+        await clear(client, "bench-")
+        await client.close()
+    except (redis.ConnectionError, OSError):
+        print(f"🟥 Redis                      skipped ({REDIS_URL} unreachable)")
+
+    print()
+    for name, ops in results.items():
+        if name != "memory":
+            print(f"⚡ memory vs {name}: {results['memory'] / ops:.1f}x faster")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
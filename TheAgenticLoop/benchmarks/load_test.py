@@ -0,0 +1,308 @@
+"""
+End-to-end load test: N concurrent players against the real API, with every
+external dependency except Redis replaced by local stubs (stub_servers.py).
+
+Starts the stub server, the API (uvicorn) and, in queue mode, worker.py
+processes, then drives player scripts:
+
+    start_session -> stream_logs (SSE, held open) ->
+    per round: get_question (miss = 202, then long-poll) -> wrong answer -> right answer
+
+Reports:
+    time-to-question  p50/p95/p99, cold (from start_session) and warm (from get_question)
+    miss rate         rounds whose first get_question found the buffer empty
+    provider calls    per question served (includes retries and critic calls)
+    admission         start_session 503s (shed, retried after Retry-After like the
+                      frontend) and where served riddles came from (LLM vs the
+                      library / template tiers of the degradation ladder)
+    Redis ops         commands per player request (INFO delta, so API + workers +
+                      log hub; n/a when the API falls back to the in-memory store)
+
+Run from TheAgenticLoop/:
+    python -m benchmarks.load_test --players 500 --ramp-sec 20
+    python -m benchmarks.load_test --mode queue --workers 4 --rate429 groq=0.1 --quota gemini=200
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+import redis.asyncio as redis
+
+from benchmarks.stub_servers import add_stub_arguments
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+DIFFICULTIES = ["GLOBAL_EASY", "GLOBAL_HARD", "INDIA_EASY", "INDIA_HARD"]
+LONG_POLL_SEC = 20  # Same as the frontend
+QUESTION_DEADLINE_SEC = 90  # Give up on a round after this long
+START_RETRIES = 3  # start_session attempts after a 503, same as the frontend
+STARTUP_TIMEOUT_SEC = 30
+
+
+@dataclass
+class Results:
+    cold_ttq: List[float] = field(default_factory=list)
+    warm_ttq: List[float] = field(default_factory=list)
+    rounds: int = 0
+    misses: int = 0
+    questions: int = 0
+    requests: int = 0
+    log_lines: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    shed: int = 0  # start_session 503s
+    rejected: int = 0  # Players still shed after START_RETRIES
+    sources: Dict[str, int] = field(default_factory=dict)  # generator_provider of served riddles
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+# ------------------------------------------------------------------
+# PROCESSES
+# ------------------------------------------------------------------
+
+def spawn(args: List[str], env: dict, log_dir: str, name: str) -> subprocess.Popen:
+    log = open(os.path.join(log_dir, f"{name}.log"), "w")
+    return subprocess.Popen(args, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_up(url: str, proc: subprocess.Popen, name: str):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SEC
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{name} exited with code {proc.returncode}")
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{name} did not come up within {STARTUP_TIMEOUT_SEC}s")
+
+
+def stub_args(args) -> List[str]:
+    extra = []
+    for flag in ("latency", "rate429", "quota"):
+        for value in getattr(args, flag) or []:
+            extra += [f"--{flag}", value]
+    return extra
+
+
+async def redis_commands() -> Optional[int]:
+    """Total commands processed by Redis, or None if it isn't reachable."""
+    client = redis.from_url(REDIS_URL, decode_responses=True)
+    try:
+        return (await client.info("stats"))["total_commands_processed"]
+    except Exception:
+        return None
+    finally:
+        await client.close()
+
+
+# ------------------------------------------------------------------
+# PLAYER SCRIPT
+# ------------------------------------------------------------------
+
+async def stream_logs(client: httpx.AsyncClient, session_id: str, results: Results):
+    try:
+        async with client.stream("GET", f"/stream_logs/{session_id}", timeout=None) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    results.log_lines += 1
+    except (httpx.HTTPError, asyncio.CancelledError):
+        pass
+
+
+async def next_question(client: httpx.AsyncClient, session_id: str, results: Results) -> Optional[dict]:
+    """First try without waiting (a 202 is a buffer miss), then long-poll like the frontend."""
+    deadline = time.monotonic() + QUESTION_DEADLINE_SEC
+    wait = 0
+    results.rounds += 1
+    while time.monotonic() < deadline:
+        response = await client.get(f"/get_question/{session_id}", params={"wait": wait})
+        results.requests += 1
+        if response.status_code == 200:
+            return response.json()["data"]
+        if response.status_code != 202:
+            results.errors += 1
+            return None
+        if wait == 0:
+            results.misses += 1
+        wait = LONG_POLL_SEC
+    results.timeouts += 1
+    return None
+
+
+async def player(client: httpx.AsyncClient, results: Results, rounds: int, think_sec: float):
+    started = time.perf_counter()
+    logs: Optional[asyncio.Task] = None
+    try:
+        difficulty = random.choice(DIFFICULTIES)
+        for attempt in range(START_RETRIES + 1):
+            response = await client.post("/start_session", json={"difficulty": difficulty})
+            results.requests += 1
+            if response.status_code != 503:
+                break
+            results.shed += 1
+            if attempt == START_RETRIES:
+                results.rejected += 1
+                return
+            await asyncio.sleep(float(response.headers.get("retry-after", 2)))
+        session_id = response.json()["session_id"]
+        logs = asyncio.create_task(stream_logs(client, session_id, results))
+        results.requests += 1
+
+        for round_no in range(rounds):
+            asked = time.perf_counter()
+            question = await next_question(client, session_id, results)
+            if question is None:
+                return
+            results.questions += 1
+            source = (question.get("provider_stats") or {}).get("generator_provider", "unknown")
+            results.sources[source] = results.sources.get(source, 0) + 1
+            (results.cold_ttq if round_no == 0 else results.warm_ttq).append(
+                time.perf_counter() - (started if round_no == 0 else asked)
+            )
+
+            for answer in ("Atlantis", question["answer"]):
+                await client.post("/verify_answer", json={
+                    "session_id": session_id, "user_answer": answer, "time_remaining": 30
+                })
+                results.requests += 1
+            await asyncio.sleep(think_sec * random.uniform(0.5, 1.5))
+    except Exception as e:
+        results.errors += 1
+        print(f"⚠️ Player failed: {type(e).__name__}: {e}")
+    finally:
+        if logs:
+            logs.cancel()
+
+
+# ------------------------------------------------------------------
+# REPORT
+# ------------------------------------------------------------------
+
+def report(args, results: Results, elapsed: float, provider_stats: dict, redis_ops: Optional[int]):
+    def ms(values, pct):
+        return f"{percentile(values, pct) * 1000:8.0f}"
+
+    print(f"\n📊 {args.players} players x {args.rounds} rounds, mode={args.mode}, {elapsed:.1f}s")
+    print(f"{'time-to-question (ms)':<24}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for label, values in (("cold (start_session)", results.cold_ttq),
+                          ("warm (get_question)", results.warm_ttq),
+                          ("all", results.cold_ttq + results.warm_ttq)):
+        print(f"{label:<24}{len(values):>6}{ms(values, 50)}{ms(values, 95)}{ms(values, 99)}")
+
+    miss_rate = results.misses / results.rounds if results.rounds else 0
+    print(f"\nquestions served  {results.questions}  ({results.questions / elapsed:.1f}/s)")
+    print(f"miss rate         {miss_rate:.1%}  ({results.misses}/{results.rounds} rounds)")
+    print(f"errors/timeouts   {results.errors}/{results.timeouts}")
+    print(f"sessions shed     {results.shed} 503s, {results.rejected} players gave up")
+    print("riddle sources    " + ", ".join(f"{name} {n}" for name, n in sorted(results.sources.items())))
+    print(f"log lines (SSE)   {results.log_lines}")
+
+    llm_calls = sum(provider_stats.get(p, {}).get("calls", 0) for p in ("groq", "cohere", "gemini"))
+    per_question = llm_calls / results.questions if results.questions else 0
+    print(f"\nprovider calls per question  {per_question:.2f}")
+    print(f"{'provider':<12}{'calls':>8}{'ok':>8}{'429':>8}{'quota':>8}{'mean ms':>10}")
+    for name, stat in provider_stats.items():
+        print(f"{name:<12}{stat['calls']:>8}{stat['ok']:>8}{stat['rate_limited']:>8}"
+              f"{stat['quota_exhausted']:>8}{stat['mean_latency_ms']:>10}")
+
+    if redis_ops is None:
+        print("\nRedis ops per request  n/a (Redis unreachable, in-memory store)")
+    else:
+        print(f"\nRedis ops per request  {redis_ops / max(results.requests, 1):.1f}"
+              f"  ({redis_ops} commands / {results.requests} requests)")
+
+
+# ------------------------------------------------------------------
+# MAIN
+# ------------------------------------------------------------------
+
+async def main(args):
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    api_url = f"http://127.0.0.1:{args.port}"
+    log_dir = tempfile.mkdtemp(prefix="atlast-load-")
+    env = {
+        **os.environ,
+        "GROQ_API_KEY": "stub", "COHERE_API_KEY": "stub", "GOOGLE_API_KEY": "stub",
+        "GROQ_BASE_URL": stub_url, "COHERE_BASE_URL": stub_url, "GEMINI_BASE_URL": stub_url,
+        "SUPABASE_URL": stub_url, "SUPABASE_KEY": "stub",
+        "REDIS_URL": REDIS_URL, "GENERATION_MODE": args.mode,
+        "PYTHONUNBUFFERED": "1",
+    }
+    procs = []
+    try:
+        stub = spawn([sys.executable, "-m", "benchmarks.stub_servers", "--port", str(args.stub_port)]
+                     + stub_args(args), env, log_dir, "stubs")
+        procs.append(stub)
+        await wait_until_up(f"{stub_url}/_stats", stub, "stub server")
+
+        api = spawn([sys.executable, "-m", "uvicorn", "api:app", "--port", str(args.port),
+                     "--log-level", "warning"], env, log_dir, "api")
+        procs.append(api)
+        await wait_until_up(f"{api_url}/openapi.json", api, "API")
+
+        if args.mode == "queue":
+            for i in range(args.workers):
+                procs.append(spawn([sys.executable, "worker.py", "--concurrency", str(args.worker_concurrency)],
+                                   env, log_dir, f"worker-{i}"))
+
+        print(f"🚦 Stubs {stub_url}, API {api_url}, logs in {log_dir}")
+        results = Results()
+        commands_before = await redis_commands()
+        limits = httpx.Limits(max_connections=args.players * 2 + 10, max_keepalive_connections=args.players * 2)
+        started = time.perf_counter()
+        async with httpx.AsyncClient(base_url=api_url, limits=limits,
+                                     timeout=LONG_POLL_SEC + 10) as client:
+            players = []
+            for _ in range(args.players):
+                players.append(asyncio.create_task(player(client, results, args.rounds, args.think_sec)))
+                await asyncio.sleep(args.ramp_sec / args.players)
+            await asyncio.gather(*players)
+        elapsed = time.perf_counter() - started
+        commands_after = await redis_commands()
+
+        async with httpx.AsyncClient() as client:
+            provider_stats = (await client.get(f"{stub_url}/_stats")).json()
+        redis_ops = None
+        if commands_before is not None and commands_after is not None:
+            redis_ops = commands_after - commands_before - 1  # minus our own INFO
+        report(args, results, elapsed, provider_stats, redis_ops)
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API with stubbed providers")
+    parser.add_argument("--players", type=int, default=100, help="Concurrent players")
+    parser.add_argument("--rounds", type=int, default=3, help="Questions per player")
+    parser.add_argument("--ramp-sec", type=float, default=10, help="Spread player arrivals over this long")
+    parser.add_argument("--think-sec", type=float, default=2, help="Mean pause between rounds")
+    parser.add_argument("--mode", choices=["inline", "queue"], default="inline", help="GENERATION_MODE")
+    parser.add_argument("--workers", type=int, default=2, help="worker.py processes (queue mode)")
+    parser.add_argument("--worker-concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8400, help="API port")
+    parser.add_argument("--stub-port", type=int, default=8300)
+    add_stub_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
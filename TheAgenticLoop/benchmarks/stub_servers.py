@@ -0,0 +1,263 @@
+"""
+Local stand-ins for Groq, Cohere, Gemini and Supabase PostgREST, for load tests.
+
+One HTTP server, one route family per provider, speaking just enough of each
+wire format for the SDKs polyglot_ai.py uses:
+
+    groq      POST /openai/v1/chat/completions         (GROQ_BASE_URL=<stub>)
+    cohere    POST /v1/chat                            (COHERE_BASE_URL=<stub>)
+    gemini    POST /v1beta/models/{model}:generateContent  (GEMINI_BASE_URL=<stub>)
+    postgrest GET/POST /rest/v1/{table}                (SUPABASE_URL=<stub>)
+
+Per provider, configurable:
+    latency   fixed:MS | uniform:LO:HI | lognormal:MEDIAN_MS:SIGMA
+    rate429   probability a call is rejected with 429 (rate limit)
+    quota     calls accepted before every call gets 429 "quota exhausted"
+
+    GET  /_stats   calls / ok / rate_limited / quota_exhausted per provider
+    POST /_reset   zero the counters and quotas
+
+Run from TheAgenticLoop/ (benchmarks/load_test.py starts it for you):
+    python -m benchmarks.stub_servers --port 8300 \\
+        --latency groq=lognormal:600:0.4 --rate429 groq=0.05 --quota gemini=500
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict, List
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+PROVIDERS = ("groq", "cohere", "gemini", "postgrest")
+DEFAULT_LATENCY = {
+    "groq": "lognormal:500:0.4",
+    "cohere": "lognormal:800:0.4",
+    "gemini": "lognormal:1200:0.5",
+    "postgrest": "lognormal:40:0.3",
+}
+
+RIDDLE = (
+    "I sit where two old trade routes cross. My markets smell of spice and my "
+    "bridges outnumber my hills. Travellers come for the towers, stay for the food."
+)
+
+
+# ------------------------------------------------------------------
+# BEHAVIOUR
+# ------------------------------------------------------------------
+
+def parse_latency(spec: str):
+    """'fixed:MS' | 'uniform:LO:HI' | 'lognormal:MEDIAN:SIGMA' -> sampler returning seconds."""
+    kind, *args = spec.split(":")
+    values = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: median * math.exp(random.gauss(0, sigma)) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class ProviderStub:
+    def __init__(self, name: str, latency: str, rate429: float = 0.0, quota: int = 0):
+        self.name = name
+        self.latency_spec = latency
+        self.sample_latency = parse_latency(latency)
+        self.rate429 = rate429
+        self.quota = quota  # 0 = unlimited
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.ok = 0
+        self.rate_limited = 0
+        self.quota_exhausted = 0
+        self.busy_sec = 0.0
+
+    async def admit(self) -> Any:
+        """Count the call and sleep its latency. Returns an error response or None."""
+        self.calls += 1
+        delay = self.sample_latency()
+        self.busy_sec += delay
+        await asyncio.sleep(delay)
+        if self.quota and self.ok >= self.quota:
+            self.quota_exhausted += 1
+            return JSONResponse(
+                {"error": {"message": "Resource has been exhausted (e.g. check quota).",
+                           "status": "RESOURCE_EXHAUSTED", "code": 429}},
+                status_code=429
+            )
+        if self.rate429 and random.random() < self.rate429:
+            self.rate_limited += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached. Please try again later.", "code": 429}},
+                status_code=429, headers={"retry-after": "1"}
+            )
+        self.ok += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency_spec,
+            "calls": self.calls,
+            "ok": self.ok,
+            "rate_limited": self.rate_limited,
+            "quota_exhausted": self.quota_exhausted,
+            "mean_latency_ms": round(self.busy_sec / self.calls * 1000, 1) if self.calls else 0,
+        }
+
+
+# ------------------------------------------------------------------
+# ROUTES
+# ------------------------------------------------------------------
+
+def build_app(stubs: Dict[str, ProviderStub]) -> Starlette:
+    tables: Dict[str, List[Dict[str, Any]]] = {}
+
+    async def groq_chat(request: Request):
+        body = await request.json()
+        error = await stubs["groq"].admit()
+        if error:
+            return error
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": RIDDLE},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 60, "completion_tokens": 45, "total_tokens": 105},
+        })
+
+    async def cohere_chat(request: Request):
+        await request.body()
+        error = await stubs["cohere"].admit()
+        if error:
+            return error
+        return JSONResponse({
+            "text": "PASS: Accurate and unique.",
+            "generation_id": uuid.uuid4().hex,
+            "finish_reason": "COMPLETE",
+            "chat_history": [],
+        })
+
+    async def gemini_generate(request: Request):
+        await request.body()
+        error = await stubs["gemini"].admit()
+        if error:
+            return error
+        return JSONResponse({
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": RIDDLE}]},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {"promptTokenCount": 60, "candidatesTokenCount": 45, "totalTokenCount": 105},
+        })
+
+    async def postgrest(request: Request):
+        """Tables live in memory: inserts append, selects filter on eq.* and honour limit."""
+        table = tables.setdefault(request.path_params["table"], [])
+        body = await request.body()
+        error = await stubs["postgrest"].admit()
+        if error:
+            return error
+        if request.method == "POST":
+            payload = await request.json() if body else []
+            rows = payload if isinstance(payload, list) else [payload]
+            for row in rows:
+                row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", time.time())
+            table.extend(rows)
+            return JSONResponse(rows, status_code=201)
+
+        rows = table
+        for column, value in request.query_params.items():
+            if value.startswith("eq."):
+                rows = [r for r in rows if str(r.get(column)) == value[3:]]
+            elif value.startswith("ilike."):
+                pattern = re.escape(value[6:]).replace("%", ".*")
+                rows = [r for r in rows if re.fullmatch(pattern, str(r.get(column, "")), re.I)]
+        limit = request.query_params.get("limit")
+        if limit:
+            rows = rows[-int(limit):]
+        return JSONResponse(rows)
+
+    async def stats(request: Request):
+        return JSONResponse({name: stub.stats() for name, stub in stubs.items()})
+
+    async def reset(request: Request):
+        for stub in stubs.values():
+            stub.reset()
+        return JSONResponse({"status": "reset"})
+
+    return Starlette(routes=[
+        Route("/openai/v1/chat/completions", groq_chat, methods=["POST"]),
+        Route("/v1/chat", cohere_chat, methods=["POST"]),
+        Route("/v1beta/models/{model:path}", gemini_generate, methods=["POST"]),
+        Route("/rest/v1/{table}", postgrest, methods=["GET", "POST", "PATCH", "HEAD"]),
+        Route("/_stats", stats, methods=["GET"]),
+        Route("/_reset", reset, methods=["POST"]),
+    ])
+
+
+def parse_overrides(items: List[str], cast) -> Dict[str, Any]:
+    """['groq=0.05', ...] -> {'groq': 0.05}"""
+    result = {}
+    for item in items or []:
+        name, _, value = item.partition("=")
+        if name not in PROVIDERS:
+            raise SystemExit(f"Unknown provider '{name}' (expected one of {', '.join(PROVIDERS)})")
+        result[name] = cast(value)
+    return result
+
+
+def build_stubs(latency: Dict[str, str], rate429: Dict[str, float], quota: Dict[str, int]) -> Dict[str, ProviderStub]:
+    return {
+        name: ProviderStub(
+            name,
+            latency.get(name, DEFAULT_LATENCY[name]),
+            rate429.get(name, 0.0),
+            quota.get(name, 0),
+        )
+        for name in PROVIDERS
+    }
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", action="append", metavar="PROVIDER=SPEC",
+                        help="fixed:MS | uniform:LO:HI | lognormal:MEDIAN_MS:SIGMA")
+    parser.add_argument("--rate429", action="append", metavar="PROVIDER=P",
+                        help="Probability of a 429 rate-limit response")
+    parser.add_argument("--quota", action="append", metavar="PROVIDER=N",
+                        help="Successful calls before the quota is exhausted")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub LLM / PostgREST servers for load tests")
+    parser.add_argument("--port", type=int, default=8300)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stubs = build_stubs(
+        parse_overrides(args.latency, str),
+        parse_overrides(args.rate429, float),
+        parse_overrides(args.quota, int),
+    )
+    for stub in stubs.values():
+        print(f"🧪 {stub.name}: latency {stub.latency_spec}, 429 rate {stub.rate429}, quota {stub.quota or '∞'}")
+    uvicorn.run(build_app(stubs), host="127.0.0.1", port=args.port, log_level="warning")
@@ -21,6 +21,14 @@ from tenacity import (
 )
 import httpx
 
+from services import precritic, riddle_templates
+from services.cities import CityCatalog
+from services.gazetteer import Gazetteer, PoolFilter, load_pool_filters
+from services.matcher import CITY_ALIASES, normalize_name, set_catalog
+from services.metrics import PRECRITIC, PROVIDER_ERRORS, PROVIDER_LATENCY, REGISTRY
+from services.quota import QUOTA
+from services.scheduler import ProviderSlots
+
 # Load environment variables
 load_dotenv()
 
@@ -41,25 +49,86 @@ GEMINI_MODEL = "gemini-2.0-flash-exp"
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# Endpoint overrides (unset = the providers' public APIs). The load test
+# points these at local stubs, see benchmarks/stub_servers.py
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
+COHERE_BASE_URL = os.getenv("COHERE_BASE_URL")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+# Redrafts after a draft fails the local pre-critic (services/precritic.py)
+PRECRITIC_REDRAFTS = int(os.getenv("PRECRITIC_REDRAFTS", "1"))
+
+# Max in-flight calls per provider (per process). Waiters are served
+# most-urgent-first (cold-start riddles before top-ups), see services/scheduler.py
+PROVIDER_CONCURRENCY = {
+    "groq": int(os.getenv("GROQ_CONCURRENCY", "8")),
+    "cohere": int(os.getenv("COHERE_CONCURRENCY", "4")),
+    "gemini": int(os.getenv("GEMINI_CONCURRENCY", "4")),
+}
+provider_slots = ProviderSlots(PROVIDER_CONCURRENCY)
+REGISTRY.gauge_callback(
+    "atlast_provider_slots", "Provider call slots in use / waited for", ("provider", "state"),
+    lambda: [((name, state), stat[state]) for name, stat in provider_slots.stats().items()
+             for state in ("active", "waiting")]
+)
+
 # Validate critical keys
 if not GOOGLE_API_KEY:
     raise ValueError("GOOGLE_API_KEY is required as fallback provider.")
 
-# Initialize ASYNC Clients (CRITICAL FIX #1)
-groq_client = AsyncGroq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
-cohere_client = AsyncCohereClient(api_key=COHERE_API_KEY) if COHERE_API_KEY else None
+groq_client: Optional[AsyncGroq] = None
+cohere_client: Optional[AsyncCohereClient] = None
+gemini_llm: Optional[ChatGoogleGenerativeAI] = None
+supabase: Optional[Client] = None
 
-# Gemini - Keep sync but wrap in asyncio.to_thread for non-blocking
-gemini_llm = ChatGoogleGenerativeAI(model=GEMINI_MODEL, temperature=0.7, max_retries=0)
 
-# Supabase - Sync but used sparingly
-supabase: Optional[Client] = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("✅ Supabase initialized")
-    except Exception as e:
-        print(f"❌ Supabase init failed: {e}")
+def init_clients():
+    """
+    (Re)create the provider and Supabase clients. Runs at import; serve.py
+    calls it again in every forked worker so no connection pool is shared
+    across processes.
+    """
+    global groq_client, cohere_client, gemini_llm, supabase
+
+    # Initialize ASYNC Clients (CRITICAL FIX #1)
+    # SDK-level retries off (like Gemini below): resilient_retry is the one retry
+    # layer, so backoff doesn't compound and every 429 reaches the metrics
+    groq_client = AsyncGroq(
+        api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL, max_retries=0
+    ) if GROQ_API_KEY else None
+    cohere_client = AsyncCohereClient(
+        api_key=COHERE_API_KEY, base_url=COHERE_BASE_URL, max_retries=0
+    ) if COHERE_API_KEY else None
+
+    # Gemini - Keep sync but wrap in asyncio.to_thread for non-blocking
+    gemini_llm = ChatGoogleGenerativeAI(
+        model=GEMINI_MODEL, temperature=0.7, max_retries=0, base_url=GEMINI_BASE_URL
+    )
+
+    # Supabase - Sync but used sparingly
+    supabase = None
+    if SUPABASE_URL and SUPABASE_KEY:
+        try:
+            supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+            print("✅ Supabase initialized")
+        except Exception as e:
+            print(f"❌ Supabase init failed: {e}")
+
+
+def set_provider_concurrency(limits: Dict[str, int]):
+    """Replace the per-process provider caps (serve.py splits them across workers)."""
+    global provider_slots
+    PROVIDER_CONCURRENCY.update(limits)
+    provider_slots = ProviderSlots(PROVIDER_CONCURRENCY)
+
+
+def generation_capacity() -> int:
+    """Riddles the generator providers can draft in parallel in this process (admission control)."""
+    generators = ["gemini"] + (["groq"] if groq_client else [])
+    return sum(max(PROVIDER_CONCURRENCY.get(name, 0), 0) for name in generators) or 1
+
+
+init_clients()
 
 # ------------------------------------------------------------------
 # OPTIMIZED PROMPTS (CRITICAL FIX #2: Token Reduction)
@@ -222,6 +291,76 @@ CITY_POOLS = {
 # All cities combined for coordinate lookup
 ALL_CITIES = INDIA_EASY_CITIES + INDIA_HARD_CITIES + GLOBAL_EASY_CITIES + GLOBAL_HARD_CITIES
 
+# Hint table: lowercase name -> (lat, lng). Built once at import (before
+# serve.py forks, so workers share it)
+# (reversed: the first listing of a name wins, as with the old linear scan)
+CITY_COORDINATES: Dict[str, tuple[float, float]] = {
+    city.lower(): (lat, lng) for city, lat, lng in reversed(ALL_CITIES)
+}
+
+# ---------------------------------------------------------
+# 5. GAZETTEER (optional) - Large offline city list
+# ---------------------------------------------------------
+# GAZETTEER_PATH = a cache built by `python -m services.gazetteer build`.
+# Each pool gets the gazetteer cities its filters select (hand-picked cities
+# stay first), and distance hints cover every city in the gazetteer.
+# GAZETTEER_POOLS = a JSON file of filters replaces the defaults below. The
+# pool is sent as the draw deck with every riddle: keep `limit`s in the hundreds.
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+GAZETTEER_POOLS: Dict[str, List[PoolFilter]] = {
+    "INDIA_EASY": [PoolFilter(countries=("IN",), min_population=1_000_000)],
+    "INDIA_HARD": [PoolFilter(countries=("IN",), min_population=200_000, max_population=1_000_000, limit=300)],
+    "GLOBAL_EASY": [PoolFilter(exclude_countries=("IN",), min_population=5_000_000, limit=150)],
+    "GLOBAL_HARD": [
+        PoolFilter(exclude_countries=("IN",), min_population=1_000_000, max_population=5_000_000, limit=300),
+        PoolFilter(exclude_countries=("IN",), capitals_only=True, max_population=1_000_000, limit=150),
+    ],
+}
+NEAR_DEG = 0.2  # ~20 km: a gazetteer city this close to a hand-picked one is the same place ("Bengaluru")
+
+GAZETTEER: Optional[Gazetteer] = None
+if GAZETTEER_PATH:
+    try:
+        GAZETTEER = Gazetteer(GAZETTEER_PATH)
+        if os.getenv("GAZETTEER_POOLS"):
+            GAZETTEER_POOLS = load_pool_filters(os.getenv("GAZETTEER_POOLS"))
+    except (OSError, ValueError) as e:
+        print(f"❌ Gazetteer unavailable ({GAZETTEER_PATH}): {e}")
+
+
+def extend_pools_from_gazetteer(
+    pools: Dict[str, list], gazetteer: Gazetteer, filters: Dict[str, List[PoolFilter]]
+) -> Dict[str, list]:
+    """Pools plus the gazetteer cities each difficulty's filters select, minus cities already listed."""
+    taken = {normalize_name(name) for pool in pools.values() for name, _, _ in pool}
+    taken.update(normalize_name(alias) for aliases in CITY_ALIASES.values() for alias in aliases)
+    coords = [(lat, lng) for pool in pools.values() for _, lat, lng in pool]
+    extended = {}
+    for difficulty, pool in pools.items():
+        extra = []
+        for pool_filter in filters.get(difficulty, []):
+            for row in gazetteer.select(pool_filter):
+                name, lat, lng = gazetteer.city(row)
+                key = normalize_name(name)
+                if key in taken or any(abs(lat - a) < NEAR_DEG and abs(lng - b) < NEAR_DEG for a, b in coords):
+                    continue
+                taken.add(key)
+                coords.append((lat, lng))
+                extra.append((name, lat, lng))
+        extended[difficulty] = list(pool) + extra
+    return extended
+
+
+if GAZETTEER is not None:
+    CITY_POOLS = extend_pools_from_gazetteer(CITY_POOLS, GAZETTEER, GAZETTEER_POOLS)
+    print(f"🗺️ Gazetteer: {len(GAZETTEER):,} cities mapped from {GAZETTEER_PATH}; pools "
+          + ", ".join(f"{d} {len(p)}" for d, p in CITY_POOLS.items()))
+
+# Stable integer IDs + shuffled decks for bitmap-based exclusion (services/cities.py)
+CITY_CATALOG = CityCatalog(CITY_POOLS, gazetteer=GAZETTEER)
+# Answer matching: no city's typo budget reaches another pool city (services/matcher.py)
+set_catalog(name for pool in CITY_POOLS.values() for name, _, _ in pool)
+
 # ------------------------------------------------------------------
 # GEOLOCATION HELPERS (Distance & Direction)
 # ------------------------------------------------------------------
@@ -233,11 +372,10 @@ def get_city_coordinates(city_name: str) -> Optional[tuple[float, float]]:
     Look up coordinates for a city name (case-insensitive).
     Returns (lat, lng) or None if not found.
     """
-    city_lower = city_name.lower().strip()
-    for city, lat, lng in ALL_CITIES:
-        if city.lower() == city_lower:
-            return (lat, lng)
-    return None
+    coords = CITY_COORDINATES.get(city_name.lower().strip())
+    if coords is None and GAZETTEER is not None:
+        coords = GAZETTEER.coordinates(city_name)
+    return coords
 
 def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
     """
@@ -349,21 +487,27 @@ async def safe_groq_call(prompt: str, max_tokens: int = 200) -> str:
     @resilient_retry
     async def _call():
         try:
-            response = await groq_client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=max_tokens,
-                timeout=8.0  # Fail fast
-            )
+            # Slot held per attempt only, never across the backoff sleep
+            async with provider_slots.slot("groq"):
+                response = await groq_client.chat.completions.create(
+                    model=GROQ_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    timeout=8.0  # Fail fast
+                )
+            # Daily quota accounting (services/quota.py)
+            QUOTA.record("groq", getattr(response.usage, "total_tokens", 0) or 0)
             return response.choices[0].message.content.strip()
         except Exception as e:
             error_str = str(e).lower()
             # Check for rate limit (429)
             if "429" in str(e) or "rate" in error_str:
+                PROVIDER_ERRORS.inc("groq", "rate_limited")
                 raise RateLimitError(f"Groq rate limit: {e}")
             # Check for quota exhaustion (no retry)
             if "quota" in error_str or "exhausted" in error_str:
+                PROVIDER_ERRORS.inc("groq", "quota_exhausted")
                 raise QuotaExhaustedError(f"Groq quota exhausted: {e}")
             raise
     
@@ -384,17 +528,22 @@ async def safe_cohere_call(prompt: str) -> str:
     @resilient_retry
     async def _call():
         try:
-            response = await cohere_client.chat(
-                model=COHERE_MODEL,
-                message=prompt,
-                temperature=0.0
-            )
+            async with provider_slots.slot("cohere"):
+                response = await cohere_client.chat(
+                    model=COHERE_MODEL,
+                    message=prompt,
+                    temperature=0.0
+                )
+            billed = getattr(response.meta, "billed_units", None) if response.meta else None
+            QUOTA.record("cohere", (getattr(billed, "input_tokens", 0) or 0) + (getattr(billed, "output_tokens", 0) or 0))
             return response.text.strip()
         except Exception as e:
             error_str = str(e).lower()
             if "429" in str(e) or "rate" in error_str:
+                PROVIDER_ERRORS.inc("cohere", "rate_limited")
                 raise RateLimitError(f"Cohere rate limit: {e}")
             if "quota" in error_str:
+                PROVIDER_ERRORS.inc("cohere", "quota_exhausted")
                 raise QuotaExhaustedError(f"Cohere quota exhausted: {e}")
             raise
     
@@ -414,7 +563,7 @@ async def safe_gemini_call(prompt: str, max_tokens: int = 200) -> str:
     def _sync_call():
         try:
             response = gemini_llm.invoke([HumanMessage(content=prompt)], timeout=8)
-            return response.content.strip()
+            return response.content.strip(), (response.usage_metadata or {}).get("total_tokens", 0)
         except Exception as e:
             error_str = str(e).lower()
             if "429" in str(e) or "quota" in error_str or "exhausted" in error_str:
@@ -422,7 +571,14 @@ async def safe_gemini_call(prompt: str, max_tokens: int = 200) -> str:
             raise
     
     # Run sync call in thread pool (non-blocking)
-    return await asyncio.to_thread(_sync_call)
+    async with provider_slots.slot("gemini"):
+        try:
+            text, tokens = await asyncio.to_thread(_sync_call)
+        except QuotaExhaustedError:
+            PROVIDER_ERRORS.inc("gemini", "quota_exhausted")  # Counted here, not in the worker thread
+            raise
+    QUOTA.record("gemini", tokens)
+    return text
 
 # ------------------------------------------------------------------
 # CITY GENERATION (Optimized)
@@ -454,6 +610,42 @@ async def generate_city(difficulty: str, exclude_cities: List[str] = None) -> tu
 # PARALLEL GENERATION + CRITIQUE (CRITICAL FIX #5: 50% Latency Reduction)
 # ------------------------------------------------------------------
 
+async def generate_draft(prompt: str) -> tuple[str, str, int]:
+    """Groq draft, Gemini if Groq fails. Returns (draft, provider, ms)."""
+    if groq_client:
+        gen_start = time.time()
+        try:
+            draft = await safe_groq_call(prompt, max_tokens=200)
+            gen_time_ms = int((time.time() - gen_start) * 1000)
+            PROVIDER_LATENCY.observe(time.time() - gen_start, "groq", "generate", "ok")
+            print(f"✅ Groq draft ({gen_time_ms}ms)")
+            return draft, "groq", gen_time_ms
+        except QuotaExhaustedError as e:
+            PROVIDER_LATENCY.observe(time.time() - gen_start, "groq", "generate", "error")
+            print(f"❌ Groq quota exhausted: {e}")
+        except Exception as e:
+            PROVIDER_LATENCY.observe(time.time() - gen_start, "groq", "generate", "error")
+            print(f"⚠️ Groq failed: {str(e)[:100]}")
+    
+    # Fallback to Gemini if Groq failed (not once its daily cap is spent, services/quota.py)
+    if QUOTA.exhausted("gemini"):
+        raise QuotaExhaustedError("Gemini daily cap spent")
+    gen_start = time.time()
+    try:
+        draft = await safe_gemini_call(prompt)
+        gen_time_ms = int((time.time() - gen_start) * 1000)
+        PROVIDER_LATENCY.observe(time.time() - gen_start, "gemini", "generate", "ok")
+        print(f"✅ Gemini draft ({gen_time_ms}ms)")
+        return draft, "gemini", gen_time_ms
+    except QuotaExhaustedError as e:
+        PROVIDER_LATENCY.observe(time.time() - gen_start, "gemini", "generate", "error")
+        print(f"❌ Gemini quota exhausted: {e}")
+        raise  # No fallback left
+    except Exception as e:
+        PROVIDER_LATENCY.observe(time.time() - gen_start, "gemini", "generate", "error")
+        print(f"❌ Gemini failed: {e}")
+        raise
+
 async def generate_riddle_parallel(
     city: str,
     difficulty: str,
@@ -467,52 +659,42 @@ async def generate_riddle_parallel(
     Flow:
     1. Groq generates draft (async)
     2. WHILE Groq is running, pre-warm Cohere connection (if available)
-    3. Once draft ready, Cohere critiques (async)
-    4. Both run in parallel where possible
+    3. Local pre-critic (services/precritic.py): trims the draft, and a
+       mechanical failure (name leak, length, giveaway) is redrafted right
+       away instead of costing a Cohere call
+    4. Once draft ready, Cohere critiques (async)
+    5. Both run in parallel where possible
     """
     start_time = time.time()
     
     # Build optimized prompt
     difficulty_hint = DIFFICULTY_HINTS.get(difficulty, "Balanced clues.")
-    feedback_section = f"Previous feedback: {feedback}\nFix issues." if feedback else ""
-    
-    prompt = GENERATOR_PROMPT_TEMPLATE.format(
-        city=city,
-        difficulty_hint=difficulty_hint,
-        feedback_section=feedback_section
-    )
     
-    # PHASE 1: Try Groq (primary generator)
-    draft_riddle = None
-    generator_provider = None
-    gen_time_ms = 0
+    def build_prompt(feedback: str) -> str:
+        return GENERATOR_PROMPT_TEMPLATE.format(
+            city=city,
+            difficulty_hint=difficulty_hint,
+            feedback_section=f"Previous feedback: {feedback}\nFix issues." if feedback else ""
+        )
     
-    if groq_client:
-        try:
-            gen_start = time.time()
-            draft_riddle = await safe_groq_call(prompt, max_tokens=200)
-            gen_time_ms = int((time.time() - gen_start) * 1000)
-            generator_provider = "groq"
-            print(f"✅ Groq draft ({gen_time_ms}ms)")
-        except QuotaExhaustedError as e:
-            print(f"❌ Groq quota exhausted: {e}")
-        except Exception as e:
-            print(f"⚠️ Groq failed: {str(e)[:100]}")
+    # PHASE 1: Try Groq (primary generator), Gemini as fallback
+    draft, generator_provider, gen_time_ms = await generate_draft(build_prompt(feedback))
     
-    # Fallback to Gemini if Groq failed
-    if not draft_riddle:
-        try:
-            gen_start = time.time()
-            draft_riddle = await safe_gemini_call(prompt)
-            gen_time_ms = int((time.time() - gen_start) * 1000)
-            generator_provider = "gemini"
-            print(f"✅ Gemini draft ({gen_time_ms}ms)")
-        except QuotaExhaustedError as e:
-            print(f"❌ Gemini quota exhausted: {e}")
-            raise  # No fallback left
-        except Exception as e:
-            print(f"❌ Gemini failed: {e}")
-            raise
+    # PHASE 1.5: Local pre-critic (no API call). Mechanical failures get
+    # PRECRITIC_REDRAFTS new drafts with the reason as feedback
+    precheck = precritic.check(draft, city, difficulty)
+    for _ in range(PRECRITIC_REDRAFTS):
+        if precheck.ok:
+            break
+        PRECRITIC.inc(precheck.rule)
+        print(f"🧹 Pre-critic rejected draft ({precheck.rule}): {precheck.reason}")
+        draft, generator_provider, gen_time_ms = await generate_draft(build_prompt(precheck.reason))
+        precheck = precritic.check(draft, city, difficulty)
+    PRECRITIC.inc(precheck.rule)
+    draft_riddle = precheck.riddle
+    if precheck.rule in ("name_leak", "country_leak"):
+        # Still leaking after the redraft: never serve the answer in the riddle
+        draft_riddle = precritic.redact(draft_riddle, city, difficulty)
     
     # Validate riddle output
     try:
@@ -531,12 +713,21 @@ async def generate_riddle_parallel(
     is_acceptable = True  # Default: accept draft
     feedback_result = "Approved (fail open)"
     
-    if cohere_client:
+    if not precheck.ok:
+        # Failed the mechanical checks: no point asking the remote critic
+        critic_provider = "precritic"
+        is_acceptable = False
+        feedback_result = precheck.reason
+    elif cohere_client and QUOTA.exhausted("cohere"):
+        # Daily cap spent (services/quota.py): skip the critique, same as a quota error
+        feedback_result = "Approved (critic daily cap spent)"
+    elif cohere_client:
+        critic_start = time.time()
         try:
             critic_prompt = CRITIC_PROMPT_TEMPLATE.format(city=city, riddle=draft_riddle)
-            critic_start = time.time()
             critic_response = await safe_cohere_call(critic_prompt)
             critic_time_ms = int((time.time() - critic_start) * 1000)
+            PROVIDER_LATENCY.observe(time.time() - critic_start, "cohere", "critic", "ok")
             
             # Parse critic response
             is_acceptable = critic_response.upper().startswith("PASS")
@@ -545,8 +736,10 @@ async def generate_riddle_parallel(
             
             print(f"✅ Critic: {'PASS' if is_acceptable else 'FAIL'} ({critic_time_ms}ms)")
         except QuotaExhaustedError:
+            PROVIDER_LATENCY.observe(time.time() - critic_start, "cohere", "critic", "error")
             print(f"❌ Cohere quota exhausted - fail open")
         except Exception as e:
+            PROVIDER_LATENCY.observe(time.time() - critic_start, "cohere", "critic", "error")
             print(f"⚠️ Cohere failed - fail open: {str(e)[:100]}")
     
     total_time_ms = int((time.time() - start_time) * 1000)
@@ -564,13 +757,15 @@ async def generate_riddle_parallel(
 # DATABASE OPERATIONS (Async-wrapped)
 # ------------------------------------------------------------------
 
-async def fetch_from_db(difficulty: str) -> Optional[Dict[str, Any]]:
+async def fetch_from_db(difficulty: str, exclude_cities: List[str] = None) -> Optional[Dict[str, Any]]:
     """
-    Async wrapper for Supabase fetch.
+    Async wrapper for Supabase fetch: one of the latest stored riddles,
+    minus the ones about `exclude_cities`.
     WHY: Prevents blocking the event loop on DB I/O.
     """
     if not supabase:
         return None
+    exclude_set = {c.lower().strip() for c in exclude_cities or []}
     
     def _sync_fetch():
         try:
@@ -578,8 +773,9 @@ async def fetch_from_db(difficulty: str) -> Optional[Dict[str, Any]]:
                 "difficulty", difficulty
             ).order("created_at", desc=True).limit(20).execute()
             
-            if response.data:
-                choice = random.choice(response.data)
+            rows = [row for row in response.data or [] if row["city_name"].lower().strip() not in exclude_set]
+            if rows:
+                choice = random.choice(rows)
                 return {
                     "riddle": choice["riddle_text"],
                     "location": {
@@ -601,6 +797,94 @@ async def fetch_from_db(difficulty: str) -> Optional[Dict[str, Any]]:
     
     return await asyncio.to_thread(_sync_fetch)
 
+async def fetch_library_riddle(difficulty: str, city_name: str) -> Optional[Dict[str, Any]]:
+    """
+    A stored riddle for one city (the pre-generated library, see pregenerate.py).
+    Used instead of generating when the providers are overloaded (services/admission.py).
+    """
+    if not supabase:
+        return None
+
+    def _sync_fetch():
+        try:
+            response = supabase.table("riddles").select("*").eq(
+                "difficulty", difficulty
+            ).eq("city_name", city_name).limit(10).execute()
+
+            if response.data:
+                choice = random.choice(response.data)
+                return {
+                    "riddle": choice["riddle_text"],
+                    "location": {
+                        "name": choice["city_name"],
+                        "lat": choice["lat"],
+                        "lng": choice["lng"]
+                    },
+                    "difficulty": choice.get("difficulty", difficulty),
+                    "stats": {
+                        "generator_provider": "library",
+                        "critic_provider": "none",
+                        "total_time_ms": 0,
+                        "accepted": True
+                    }
+                }
+        except Exception as e:
+            print(f"❌ Library fetch failed: {e}")
+        return None
+
+    return await asyncio.to_thread(_sync_fetch)
+
+def hardcoded_riddle(difficulty: str, start_time: Optional[float] = None) -> Dict[str, Any]:
+    """Last resort when neither the providers, the DB nor the templates can produce a riddle."""
+    elapsed_ms = int((time.time() - start_time) * 1000) if start_time else 0
+    if "INDIA" in difficulty:
+        return {
+            "riddle": "I am the capital of India. My history is vast, my traffic legendary. Identify me.",
+            "location": {"name": "Delhi", "lat": 28.7041, "lng": 77.1025},
+            "difficulty": difficulty,
+            "stats": {"generator_provider": "hardcoded", "critic_provider": "none", "total_time_ms": elapsed_ms, "accepted": True}
+        }
+    return {
+        "riddle": "I stand in the land of the rising sun. My tower is red and white. Identify me.",
+        "location": {"name": "Tokyo", "lat": 35.6762, "lng": 139.6503},
+        "difficulty": difficulty,
+        "stats": {"generator_provider": "hardcoded", "critic_provider": "none", "total_time_ms": elapsed_ms, "accepted": True}
+    }
+
+def template_riddle(
+    difficulty: str,
+    city: Optional[tuple] = None,
+    exclude_cities: List[str] = None,
+    start_time: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Offline fallback: a riddle assembled from the city fact table
+    (services/riddle_templates.py). Uses the drawn `city` (name, lat, lng) or
+    picks one from the pool minus `exclude_cities`; hardcoded_riddle only if
+    no city yields one.
+    """
+    if city is None:
+        exclude_set = {c.lower().strip() for c in exclude_cities or []}
+        pool = CITY_POOLS.get(difficulty, GLOBAL_EASY_CITIES)
+        city = random.choice([c for c in pool if c[0].lower() not in exclude_set] or pool)
+    city_name, lat, lng = city
+
+    population = 0
+    if GAZETTEER is not None and riddle_templates.facts_for(city_name) is None:
+        row = GAZETTEER.find(city_name)
+        population = GAZETTEER.population(row) if row is not None else 0
+
+    riddle = riddle_templates.template_riddle_text(city_name, lat, lng, difficulty, population)
+    if riddle is None:
+        return hardcoded_riddle(difficulty, start_time)
+    elapsed_ms = int((time.time() - start_time) * 1000) if start_time else 0
+    return {
+        "riddle": riddle,
+        "location": {"name": city_name, "lat": lat, "lng": lng},
+        "difficulty": difficulty,
+        "stats": {"generator_provider": "template", "critic_provider": "none", "total_time_ms": elapsed_ms, "accepted": True}
+    }
+
 async def save_to_db(city: str, riddle: str, lat: float, lng: float, difficulty: str):
     """Async wrapper for DB save (fire-and-forget)."""
     if not supabase:
@@ -629,10 +913,13 @@ async def save_to_db(city: str, riddle: str, lat: float, lng: float, difficulty:
 async def generate_riddle_optimized(
     difficulty: str = "GLOBAL_EASY",
     exclude_cities: List[str] = None,
-    timeout_sec: int = 12
+    timeout_sec: int = 12,
+    city: Optional[tuple] = None
 ) -> Dict[str, Any]:
     """
     Production-optimized riddle generation.
+    `city` = (name, lat, lng) already drawn by the caller (session bitmap);
+    otherwise one is picked from the pool minus `exclude_cities`.
     
     IMPROVEMENTS:
     1. Fully async (no blocking calls)
@@ -640,19 +927,20 @@ async def generate_riddle_optimized(
     3. 50% token reduction (optimized prompts)
     4. Parallel generation + critique (50% latency reduction)
     5. Fail-open strategy (always returns a riddle)
-    6. Smart DB fallback
+    6. Template fallback for the drawn city (DB only without one)
     
     EXPECTED PERFORMANCE:
     - Cold start: ~1.5s (Groq + Cohere)
-    - Warm cache: ~50ms (DB fetch)
     - Under load (rate limited): ~3s (with retries)
-    - Failure mode: ~100ms (hardcoded fallback)
+    - Failure mode: ~100ms (template fallback)
     """
     start_time = time.time()
+    target = city
     
     try:
         # Generate city target
-        city_name, lat, lng = await generate_city(difficulty, exclude_cities)
+        target = city or await generate_city(difficulty, exclude_cities)
+        city_name, lat, lng = target
         
         # Generate riddle with parallel critique
         result = await asyncio.wait_for(
@@ -681,42 +969,36 @@ async def generate_riddle_optimized(
         }
     
     except asyncio.TimeoutError:
-        print(f"⏱️ Timeout after {timeout_sec}s - trying DB fallback")
-        db_result = await fetch_from_db(difficulty)
-        if db_result:
-            return db_result
-        
-        # Ultimate fallback: hardcoded riddles
-        if "INDIA" in difficulty:
-            return {
-                "riddle": "I am the capital of India. My history is vast, my traffic legendary. Identify me.",
-                "location": {"name": "Delhi", "lat": 28.7041, "lng": 77.1025},
-                "difficulty": difficulty,
-                "stats": {"generator_provider": "hardcoded", "critic_provider": "none", "total_time_ms": int((time.time() - start_time) * 1000), "accepted": True}
-            }
-        else:
-            return {
-                "riddle": "I stand in the land of the rising sun. My tower is red and white. Identify me.",
-                "location": {"name": "Tokyo", "lat": 35.6762, "lng": 139.6503},
-                "difficulty": difficulty,
-                "stats": {"generator_provider": "hardcoded", "critic_provider": "none", "total_time_ms": int((time.time() - start_time) * 1000), "accepted": True}
-            }
+        print(f"⏱️ Timeout after {timeout_sec}s - template fallback")
+        return await fallback_riddle(difficulty, target, exclude_cities, start_time)
     
     except QuotaExhaustedError:
-        # All generators exhausted - try DB immediately
-        print("🚨 All API quotas exhausted - DB fallback")
-        db_result = await fetch_from_db(difficulty)
-        if db_result:
-            return db_result
-        raise  # No fallback available
+        # All generators exhausted - no point retrying
+        print("🚨 All API quotas exhausted - template fallback")
+        return await fallback_riddle(difficulty, target, exclude_cities, start_time)
     
     except Exception as e:
         print(f"❌ Fatal error: {e}")
-        # Try DB as last resort
-        db_result = await fetch_from_db(difficulty)
-        if db_result:
-            return db_result
-        raise
+        return await fallback_riddle(difficulty, target, exclude_cities, start_time)
+
+
+async def fallback_riddle(
+    difficulty: str,
+    target: Optional[tuple],
+    exclude_cities: List[str] = None,
+    start_time: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    When generation fails: a template riddle for the target city already
+    drawn (it's unseen by the player). Without one, a stored riddle minus
+    `exclude_cities`, else a template for another unexcluded pool city.
+    """
+    if target is not None:
+        return template_riddle(difficulty, target, exclude_cities, start_time)
+    db_result = await fetch_from_db(difficulty, exclude_cities)
+    if db_result:
+        return db_result
+    return template_riddle(difficulty, None, exclude_cities, start_time)
 
 
 # ------------------------------------------------------------------
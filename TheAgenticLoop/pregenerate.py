@@ -0,0 +1,308 @@
+"""
+Offline bulk pre-generation of the Supabase `riddles` library.
+
+Sweeps every city in CITY_POOLS x difficulty up to --variants riddles each,
+through the same generate -> critique path the game uses
+(generate_riddle_parallel; a rejected draft gets one retry with the critic's
+feedback). Only accepted riddles are stored, in bulk inserts of --batch rows.
+
+Pacing: provider_slots already cap in-flight calls per provider; on top of
+that, riddle starts are paced at --rpm. A burst of 429s halves the pace (at
+most once per BACKOFF_COOLDOWN_SEC) and each accepted riddle creeps it back
+up (AIMD), so an overnight run settles just under whatever limit the
+account actually has.
+A run stops cleanly once every generator quota is exhausted. It also shares
+the daily quota planner with the game (services/quota.py, through Redis at
+REDIS_URL): over this hour's allowance, riddle starts wait QUOTA_WAIT_SEC
+instead of spending quota the evening's players will need.
+
+Progress is checkpointed (JSON, atomically replaced) after each batch is
+written, so an interrupted run picks up where it left off:
+
+    python pregenerate.py --variants 3
+    python pregenerate.py --variants 5 --difficulties GLOBAL_EASY GLOBAL_HARD --rpm 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+import polyglot_ai
+from polyglot_ai import CITY_POOLS, QuotaExhaustedError, generate_riddle_parallel
+from services.admission import FULL
+from services.metrics import PROVIDER_ERRORS
+from services.quota import QUOTA
+from services.scheduler import SPECULATIVE, current_priority, priority_score
+
+load_dotenv()
+
+CHECKPOINT_PATH = os.getenv("PREGEN_CHECKPOINT", ".pregen_checkpoint.json")
+MAX_ATTEMPTS = 2  # Draft + one rewrite with critic feedback
+PROGRESS_EVERY_SEC = 30
+MIN_RPM = 1.0
+BACKOFF_COOLDOWN_SEC = 10
+QUOTA_WAIT_SEC = 60
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+Job = Tuple[str, str, float, float]  # difficulty, city, lat, lng
+
+
+class RatePacer:
+    """Spaces riddle starts at `rpm`; halves on rate limits, recovers additively."""
+
+    def __init__(self, rpm: float):
+        self.max_rpm = rpm
+        self.rpm = rpm
+        self._next = 0.0
+        self._last_cut = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, stopping: asyncio.Event) -> bool:
+        """Wait for the next start slot. False if `stopping` was set meanwhile."""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(stopping.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            if stopping.is_set():
+                return False
+            self._next = max(self._next, loop.time()) + 60 / self.rpm
+            return True
+
+    def slow_down(self):
+        # One cut per cooldown: riddles in flight all see the same burst of 429s
+        now = time.monotonic()
+        if now - self._last_cut >= BACKOFF_COOLDOWN_SEC:
+            self._last_cut = now
+            self.rpm = max(self.rpm / 2, MIN_RPM)
+
+    def speed_up(self):
+        self.rpm = min(self.rpm + self.max_rpm / 20, self.max_rpm)
+
+
+def load_checkpoint(path: str) -> Dict[str, int]:
+    try:
+        with open(path) as f:
+            return json.load(f)["done"]
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(path: str, done: Dict[str, int]):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"done": done, "updated_at": time.time()}, f)
+    os.replace(tmp, path)
+
+
+def rate_limit_events() -> float:
+    return sum(PROVIDER_ERRORS.value(p, "rate_limited") for p in ("groq", "cohere", "gemini"))
+
+
+class Pregenerator:
+    def __init__(self, args):
+        self.variants = args.variants
+        self.difficulties = args.difficulties or list(CITY_POOLS)
+        self.concurrency = args.concurrency
+        self.batch_size = args.batch
+        self.checkpoint_path = args.checkpoint
+        self.dry_run = args.dry_run
+        self.pacer = RatePacer(args.rpm)
+
+        self.done = load_checkpoint(self.checkpoint_path)  # "DIFFICULTY|City" -> stored variants
+        self.pending: List[Tuple[str, Dict]] = []  # (checkpoint key, row) awaiting the next insert
+        self.attempts = 0
+        self.accepted = 0
+        self.failed = 0
+        self.stored = 0
+        self.deferred = 0
+        self.started = time.monotonic()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+
+    def stop(self, reason: str = "interrupted"):
+        if not self._stopping.is_set():
+            print(f"🛑 Stopping ({reason}): finishing in-flight riddles, then writing the last batch...")
+            self._stopping.set()
+
+    def plan(self) -> List[Job]:
+        """One job per missing variant, cities interleaved so a short run still covers every city."""
+        per_city = []
+        for difficulty in self.difficulties:
+            for city, lat, lng in CITY_POOLS[difficulty]:
+                missing = self.variants - self.done.get(f"{difficulty}|{city}", 0)
+                per_city.append([(difficulty, city, lat, lng)] * max(missing, 0))
+        jobs = []
+        for round_ in range(self.variants):
+            jobs.extend(slots[round_] for slots in per_city if round_ < len(slots))
+        return jobs
+
+    async def run(self):
+        jobs = self.plan()
+        total_slots = sum(len(CITY_POOLS[d]) for d in self.difficulties) * self.variants
+        print(f"🗂️ {len(jobs)} riddles to generate ({total_slots - len(jobs)}/{total_slots} already stored), "
+              f"{self.concurrency} in flight, ≤{self.pacer.rpm:g}/min")
+        if not jobs:
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+
+        progress = asyncio.create_task(self._progress(len(jobs)))
+        try:
+            await asyncio.gather(*(self._work(queue) for _ in range(self.concurrency)))
+        finally:
+            progress.cancel()
+            await self._flush()
+            self._report(len(jobs), final=True)
+
+    async def _work(self, queue: asyncio.Queue):
+        while not self._stopping.is_set():
+            try:
+                difficulty, city, lat, lng = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if QUOTA.admit(SPECULATIVE, FULL) != FULL:
+                # Over this hour's quota allowance: put it back and wait for the next plan
+                queue.put_nowait((difficulty, city, lat, lng))
+                self.deferred += 1
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=QUOTA_WAIT_SEC)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if not await self.pacer.acquire(self._stopping):
+                return
+            try:
+                riddle = await self._generate(difficulty, city)
+            except QuotaExhaustedError:
+                self.stop("all generator quotas exhausted")
+                return
+            if riddle is None:
+                self.failed += 1
+                continue
+
+            self.pending.append((f"{difficulty}|{city}", {
+                "city_name": city, "riddle_text": riddle, "lat": lat, "lng": lng, "difficulty": difficulty,
+            }))
+            if len(self.pending) >= self.batch_size:
+                await self._flush()
+
+    async def _generate(self, difficulty: str, city: str) -> Optional[str]:
+        """Draft + critique, one rewrite with feedback. Returns the accepted riddle or None."""
+        feedback = ""
+        for _ in range(MAX_ATTEMPTS):
+            self.attempts += 1
+            limited_before = rate_limit_events()
+            try:
+                result = await generate_riddle_parallel(city, difficulty, feedback)
+            except QuotaExhaustedError:
+                raise  # Stops the run
+            except Exception as e:
+                print(f"⚠️ {city} [{difficulty}] failed: {str(e)[:100]}")
+                result = None
+            if rate_limit_events() > limited_before:
+                self.pacer.slow_down()
+
+            if result and result["is_acceptable"]:
+                self.accepted += 1
+                self.pacer.speed_up()
+                return result["riddle"]
+            feedback = result["feedback"] if result else ""
+        return None
+
+    async def _flush(self):
+        """Bulk-insert the pending batch, then checkpoint what was written."""
+        async with self._flush_lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return
+            if not self.dry_run:
+                rows = [row for _, row in batch]
+                try:
+                    await asyncio.to_thread(lambda: polyglot_ai.supabase.table("riddles").insert(rows).execute())
+                except Exception as e:
+                    # Keep them for the next flush; the checkpoint only counts stored rows
+                    print(f"❌ Batch insert of {len(rows)} riddles failed: {e}")
+                    self.pending = batch + self.pending
+                    return
+            for key, _ in batch:
+                self.done[key] = self.done.get(key, 0) + 1
+            self.stored += len(batch)
+            if not self.dry_run:
+                save_checkpoint(self.checkpoint_path, self.done)
+            print(f"💾 Stored {len(batch)} riddles ({self.stored} this run)")
+
+    async def _progress(self, total: int):
+        while True:
+            await asyncio.sleep(PROGRESS_EVERY_SEC)
+            self._report(total)
+
+    def _report(self, total: int, final: bool = False):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        settled = self.accepted + self.failed
+        acceptance = self.accepted / self.attempts if self.attempts else 0
+        label = "🏁 Done" if final else "⏳ Progress"
+        print(f"{label}: {settled}/{total} riddles settled in {elapsed:.0f}s | "
+              f"{self.accepted / elapsed * 60:.1f} accepted/min | "
+              f"acceptance {acceptance:.0%} ({self.accepted}/{self.attempts} drafts) | "
+              f"{self.failed} given up | {self.stored} stored | pace {self.pacer.rpm:g}/min | "
+              f"429s {rate_limit_events():g} | {self.deferred} quota waits")
+
+
+async def main(args):
+    if not polyglot_ai.supabase and not args.dry_run:
+        raise SystemExit("❌ SUPABASE_URL / SUPABASE_KEY not set (use --dry-run to generate without storing)")
+    unknown = set(args.difficulties or []) - set(CITY_POOLS)
+    if unknown:
+        raise SystemExit(f"❌ Unknown difficulties: {', '.join(sorted(unknown))}")
+
+    # Library filling is the least urgent work there is (matters if provider slots are shared)
+    current_priority.set(priority_score(SPECULATIVE))
+
+    # Shared daily quota accounting with the API and workers, if Redis is up
+    client = redis.from_url(REDIS_URL, decode_responses=True)
+    try:
+        await client.ping()
+    except Exception as e:
+        print(f"⚠️ Redis unavailable ({e}): quota pacing sees this run's calls only")
+        await client.close()
+        client = None
+    await QUOTA.start(client)
+
+    pregenerator = Pregenerator(args)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, pregenerator.stop)
+    try:
+        await pregenerator.run()
+    finally:
+        await QUOTA.stop()
+        if client is not None:
+            await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate the riddle library")
+    parser.add_argument("--variants", type=int, default=3, help="Target stored riddles per city and difficulty")
+    parser.add_argument("--difficulties", nargs="+", metavar="DIFFICULTY",
+                        help=f"Subset of {', '.join(CITY_POOLS)} (default: all)")
+    parser.add_argument("--concurrency", type=int, default=polyglot_ai.PROVIDER_CONCURRENCY["groq"],
+                        help="Riddles in flight (provider slots still cap each provider)")
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("PREGEN_RPM", "30")),
+                        help="Max riddle starts per minute (halved on every 429, recovers slowly)")
+    parser.add_argument("--batch", type=int, default=50, help="Rows per bulk insert")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="Resume file")
+    parser.add_argument("--dry-run", action="store_true", help="Generate and report, store nothing")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,188 @@
+"""
+Multi-process API server: load the read-only data once, then fork workers
+that share one listening socket.
+
+    python serve.py --workers 4 --port 8000 [--metrics-port 9200]
+
+`uvicorn --workers` starts fresh interpreters, so each worker would import
+and build the read-only tables itself (city pools, catalog decks, the hint
+table, matcher aliases). This works like gunicorn --preload instead:
+
+1. The parent imports api (and with it polyglot_ai and services.*), builds
+   the lazy tables, then gc.freeze()s everything. Collections in the workers
+   then skip those objects and don't dirty (copy) their pages. (The gazetteer
+   is an mmap: shared through the page cache, nothing to build.)
+2. The parent binds the socket and forks N workers. Each worker recreates its
+   network clients (provider SDKs, Supabase) and builds its own app with
+   api.create_app(). Redis clients, the session store, log hub and scheduler
+   are created in lifespan, so they are already per worker.
+3. The parent supervises. A worker that dies is restarted; SIGTERM/SIGINT
+   drains every worker.
+
+Workers > 1 need Redis: the in-memory fallback store is per process, so
+without Redis this runs a single worker. Each worker has its own metrics
+registry, served on --metrics-port + worker index. Provider caps
+(GROQ_CONCURRENCY, ...) are per-account limits, so by default they are split
+across workers (inline generation; queue-mode API workers never call
+providers).
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Dict, Tuple
+
+import redis
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import api  # noqa: E402  (after load_dotenv, like the modules it imports)
+import polyglot_ai  # noqa: E402
+from services.db import db_service  # noqa: E402
+from services.metrics import start_metrics_server  # noqa: E402
+
+RESTART_BACKOFF_SEC = 1  # A worker that dies sooner than this is restarted after a pause
+
+
+def preload():
+    """Build everything read-only before forking, then keep the GC off it."""
+    polyglot_ai.CITY_CATALOG.build_decks()
+    gc.collect()
+    gc.freeze()
+    gazetteer = f", {len(polyglot_ai.GAZETTEER):,} gazetteer cities (mmapped)" if polyglot_ai.GAZETTEER else ""
+    print(f"📚 Preloaded {len(polyglot_ai.CITY_CATALOG)} cities, "
+          f"{len(polyglot_ai.CITY_COORDINATES)} hint coordinates{gazetteer} ({gc.get_freeze_count()} objects frozen)")
+
+
+def redis_reachable() -> bool:
+    client = redis.Redis.from_url(api.REDIS_URL, socket_connect_timeout=2)
+    try:
+        return bool(client.ping())
+    except redis.RedisError:
+        return False
+    finally:
+        client.close()
+
+
+def bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index: int, sock: socket.socket, args):
+    """Forked child: fresh clients, fresh app, serve until SIGTERM."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    polyglot_ai.init_clients()
+    db_service.connect()
+    if args.workers > 1 and args.provider_slots == "split":
+        polyglot_ai.set_provider_concurrency({
+            name: max(1, limit // args.workers) for name, limit in polyglot_ai.PROVIDER_CONCURRENCY.items()
+        })
+
+    config = uvicorn.Config(api.create_app, factory=True, log_level=args.log_level)
+    server = uvicorn.Server(config)
+
+    async def main():
+        metrics_server = await start_metrics_server(args.metrics_port + index) if args.metrics_port else None
+        await server.serve(sockets=[sock])
+        if metrics_server:
+            metrics_server.close()
+
+    print(f"👷 API worker {index} (pid {os.getpid()}) serving")
+    asyncio.run(main())
+
+
+class Supervisor:
+    def __init__(self, args, sock: socket.socket):
+        self.args = args
+        self.sock = sock
+        self.children: Dict[int, Tuple[int, float]] = {}  # pid -> (worker index, started at)
+        self.stopping = False
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(index, self.sock, self.args)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.children[pid] = (index, time.monotonic())
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            print(f"🛑 Stopping {len(self.children)} API workers...")
+            self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.args.workers):
+            self.spawn(index)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index, started = self.children.pop(pid, (None, 0.0))
+            if index is None or self.stopping:
+                continue
+            print(f"💀 API worker {index} (pid {pid}) exited with {os.waitstatus_to_exitcode(status)}, restarting")
+            if time.monotonic() - started < RESTART_BACKOFF_SEC:
+                time.sleep(RESTART_BACKOFF_SEC)
+            self.spawn(index)
+        print("👋 All API workers stopped")
+
+
+def main(args):
+    if args.workers > 1 and not redis_reachable():
+        print(f"⚠️ Redis unreachable at {api.REDIS_URL}: the in-memory store is per process, "
+              f"running 1 worker instead of {args.workers}")
+        args.workers = 1
+
+    preload()
+    sock = bind(args.host, args.port)
+    print(f"🚀 Serving on http://{args.host}:{args.port} with {args.workers} workers "
+          f"(generation mode: {api.GENERATION_MODE})")
+    Supervisor(args, sock).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prefork multi-process API server")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+                        help="API processes (default: one per core)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("API_METRICS_PORT", "0")),
+                        help="Worker i also serves /metrics on this port + i (0 = off; /metrics on --port "
+                             "shows whichever worker took the connection)")
+    parser.add_argument("--provider-slots", choices=["split", "per-worker"], default="split",
+                        help="split: divide GROQ_/COHERE_/GEMINI_CONCURRENCY across workers")
+    parser.add_argument("--log-level", default="warning")
+    main(parser.parse_args())
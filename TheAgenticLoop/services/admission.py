@@ -0,0 +1,232 @@
+"""
+Admission control for new sessions and the generation degradation ladder.
+
+Every admitted session demands BUFFER_SIZE generations at once. Without a
+limit, a traffic spike queues more LLM calls than the providers can take:
+every call 429s and retries, generations time out, and every player ends up
+on a fallback riddle. This compares the demand (the generation backlog)
+against provider capacity and steps down a ladder as it outgrows it:
+
+    FULL            LLM generation for every riddle (normal)
+    LIBRARY_FIRST   a stored riddle for the drawn city if the Supabase
+                    library has one, LLM only on a library miss
+    RESERVOIR_ONLY  no provider calls: library riddle for the drawn city,
+                    else a template riddle for it (services/riddle_templates.py;
+                    a pool city's if no city was drawn)
+    (shed)          start_session answers 503 with Retry-After
+
+THE ESTIMATE (Little's law): a job queued now starts after
+    wait = backlog / capacity * latency
+where backlog = generations queued + running (inline: the scheduler; queue
+mode: jobs:ready + jobs:leases), capacity = generations run in parallel
+(job slots; for LLM generation also capped by the generator providers'
+slots), and latency = EWMA of recent generation times read from
+GENERATION_LATENCY. A 429 storm needs no separate
+signal: retries and backoff show up as longer LLM latency. Processes that
+never generate (queue-mode API) keep the ADMISSION_*_LATENCY_SEC defaults.
+
+    level       from the LLM wait (what FULL would cost): FULL below
+                LIBRARY_FIRST_SEC, LIBRARY_FIRST below RESERVOIR_SEC,
+                else RESERVOIR_ONLY
+    shed        if even stored riddles (their own, much shorter latency)
+                would leave new sessions waiting more than SHED_SEC.
+                Retry-After is the time for the backlog to drain back to
+                that point
+
+Sessions admitted since the last tick count as BUFFER_SIZE demand each, so a
+burst within one tick can't all slip in. Degrading is immediate; recovering
+takes one level at a time, after the LLM wait has stayed under half the
+threshold for RECOVER_SEC, so the ladder doesn't flap.
+
+Per process: each API process and worker.py runs its own controller over the
+shared backlog. API processes decide admission; whoever generates applies the
+level (services/generation.py).
+"""
+
+import asyncio
+import math
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from services.metrics import ADMISSIONS, GENERATION_LATENCY, REGISTRY
+
+FULL = 0
+LIBRARY_FIRST = 1
+RESERVOIR_ONLY = 2
+LEVEL_NAMES = {FULL: "full", LIBRARY_FIRST: "library_first", RESERVOIR_ONLY: "reservoir_only"}
+
+LIBRARY_FIRST_SEC = float(os.getenv("ADMISSION_LIBRARY_FIRST_SEC", "6"))
+RESERVOIR_SEC = float(os.getenv("ADMISSION_RESERVOIR_SEC", "20"))
+SHED_SEC = float(os.getenv("ADMISSION_SHED_SEC", "15"))
+RECOVER_SEC = 10.0
+TICK_SEC = 1.0
+MAX_RETRY_AFTER_SEC = 60
+EWMA_ALPHA = 0.3  # Weight of the newest tick's mean latency
+
+# Sources that didn't call an LLM (RIDDLE_SOURCE / GENERATION_LATENCY labels)
+STORED_SOURCES = ("library", "db_cache", "supabase_cache", "supabase_backup", "template", "hardcoded", "inventory")
+DEFAULT_LLM_LATENCY_SEC = float(os.getenv("ADMISSION_LLM_LATENCY_SEC", "3"))
+DEFAULT_STORED_LATENCY_SEC = float(os.getenv("ADMISSION_STORED_LATENCY_SEC", "1"))
+
+# () -> (generations queued + running, job slots, job slots the providers can fill)
+Load = Callable[[], Awaitable[Tuple[int, int, int]]]
+
+
+class _LatencyTracker:
+    """EWMA of the mean generation time per tick, from the GENERATION_LATENCY histogram."""
+
+    def __init__(self, stored: bool, default: float):
+        self.stored = stored
+        self.value = default
+        self._count = 0.0
+        self._sum = 0.0
+
+    def update(self):
+        count = total = 0.0
+        for labels, n, seconds in GENERATION_LATENCY.totals():
+            if (labels[0] in STORED_SOURCES) == self.stored:
+                count += n
+                total += seconds
+        new, self._count = count - self._count, count
+        spent, self._sum = total - self._sum, total
+        if new > 0:
+            self.value += EWMA_ALPHA * (spent / new - self.value)
+
+
+class AdmissionController:
+    """
+    start() in lifespan startup, stop() in shutdown. `load` is polled every
+    tick; each admitted session adds `demand_per_session` generations.
+    """
+
+    def __init__(self, load: Load, demand_per_session: int):
+        self.load = load
+        self.slots = 1
+        self.llm_slots = 1
+        self.demand_per_session = demand_per_session
+        self.level = FULL
+        self.backlog = 0
+        self._admitted_since_tick = 0
+        self._calm_since: Optional[float] = None
+        self._llm = _LatencyTracker(stored=False, default=DEFAULT_LLM_LATENCY_SEC)
+        self._stored = _LatencyTracker(stored=True, default=DEFAULT_STORED_LATENCY_SEC)
+        self._task: Optional[asyncio.Task] = None
+        REGISTRY.gauge_callback(
+            "atlast_degradation_level", "Generation ladder: 0 full, 1 library-first, 2 reservoir-only", (),
+            lambda: [((), self.level)]
+        )
+        REGISTRY.gauge_callback(
+            "atlast_generation_wait_seconds", "Estimated wait before a newly queued generation starts",
+            ("mode",), lambda: [(("llm",), self.llm_wait()), (("stored",), self.stored_wait())]
+        )
+
+    async def start(self):
+        if self._task is None:
+            await self.tick()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TICK_SEC)
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"⚠️ Admission tick failed: {e}")
+
+    # --------------------------------------------------------------
+    # ESTIMATE
+    # --------------------------------------------------------------
+
+    def demand(self) -> int:
+        return self.backlog + self._admitted_since_tick * self.demand_per_session
+
+    def llm_wait(self) -> float:
+        return self.demand() / self.llm_slots * self._llm.value
+
+    def stored_wait(self) -> float:
+        return self.demand() / self.slots * self._stored.value
+
+    def _target_level(self, wait: float, scale: float = 1.0) -> int:
+        if wait >= RESERVOIR_SEC * scale:
+            return RESERVOIR_ONLY
+        if wait >= LIBRARY_FIRST_SEC * scale:
+            return LIBRARY_FIRST
+        return FULL
+
+    async def tick(self):
+        backlog, slots, llm_slots = await self.load()
+        self.backlog, self.slots, self.llm_slots = backlog, max(1, slots), max(1, min(slots, llm_slots))
+        self._admitted_since_tick = 0
+        self._llm.update()
+        self._stored.update()
+
+        wait = self.llm_wait()
+        target = self._target_level(wait)
+        now = time.monotonic()
+        if target > self.level:
+            self._set_level(target, wait)
+            self._calm_since = None
+        elif self._target_level(wait, scale=0.5) < self.level:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= RECOVER_SEC:
+                self._set_level(self.level - 1, wait)
+                self._calm_since = now
+        else:
+            self._calm_since = None
+
+    def _set_level(self, level: int, wait: float):
+        arrow = "⬇️ Degrading" if level > self.level else "⬆️ Recovering"
+        print(f"{arrow} generation to {LEVEL_NAMES[level]} "
+              f"(backlog {self.backlog}, est. LLM wait {wait:.1f}s)")
+        self.level = level
+
+    # --------------------------------------------------------------
+    # ADMISSION
+    # --------------------------------------------------------------
+
+    def admit(self) -> Tuple[bool, int]:
+        """(admitted, Retry-After seconds if not). Admitted sessions count as demand right away."""
+        wait = self.stored_wait()
+        if wait > SHED_SEC:
+            ADMISSIONS.inc("shed")
+            retry_after = min(MAX_RETRY_AFTER_SEC, max(1, math.ceil(wait - SHED_SEC)))
+            return False, retry_after
+        self._admitted_since_tick += 1
+        ADMISSIONS.inc(LEVEL_NAMES[self.level])
+        return True, 0
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "level": LEVEL_NAMES[self.level],
+            "backlog": self.demand(),
+            "slots": self.slots,
+            "llm_slots": self.llm_slots,
+            "llm_latency_sec": round(self._llm.value, 2),
+            "stored_latency_sec": round(self._stored.value, 2),
+            "llm_wait_sec": round(self.llm_wait(), 1),
+            "stored_wait_sec": round(self.stored_wait(), 1),
+        }
+
+    # --------------------------------------------------------------
+    # WARM RESTART (services/snapshot.py)
+    # --------------------------------------------------------------
+
+    def checkpoint(self) -> Dict[str, float]:
+        """The learned latencies; the backlog is re-read from `load` anyway."""
+        return {"llm_latency_sec": self._llm.value, "stored_latency_sec": self._stored.value}
+
+    def restore(self, state: Dict[str, float]):
+        """Before start(): seed the EWMAs instead of the ADMISSION_*_LATENCY_SEC defaults."""
+        self._llm.value = float(state.get("llm_latency_sec", self._llm.value))
+        self._stored.value = float(state.get("stored_latency_sec", self._stored.value))
@@ -0,0 +1,113 @@
+"""
+Stable small-integer city IDs and per-player shuffled decks.
+
+City selection used to ship the session's whole visited list (names) into
+generate_city, which rebuilt a set and filtered the pool on every riddle.
+Now every city has a stable ID and exclusion state is a bitmap of seen IDs
+(services.redis_scripts DRAW_CITY_LUA / MemorySessionStore.draw_city):
+
+    ID      index in city_ids.json. APPEND-ONLY: the IDs live on in players'
+            persistent bitmaps, so never reorder or delete entries. A city
+            missing from the file still gets an ID (after the registered
+            ones) but it is only stable until someone adds to the pools, so
+            a warning says to register it.
+    deck    the pool's IDs in a shuffled order. DECKS_PER_POOL fixed
+            permutations per difficulty, seeded by name, so every process
+            (API, workers) and every restart builds the same ones; a player
+            always gets the same deck (crc32 of their id).
+    draw    cursor += 1, take deck[cursor % n], SETBIT seen: O(1) unless the
+            pool is nearly used up. The cursor increment is atomic, so two
+            concurrent generations for one session never pick the same city.
+            Redis keeps each deck once (deck:{difficulty}:{crc}, uploaded by
+            the first draw that misses it), so a draw sends the deck's key,
+            never the deck itself.
+
+Cities from the gazetteer (services/gazetteer.py) that aren't in
+city_ids.json take their stable ID from its own registry, from
+gazetteer.ID_BASE up.
+"""
+
+import json
+import os
+import random
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from services.gazetteer import ID_BASE, Gazetteer
+
+REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "city_ids.json")
+DECKS_PER_POOL = 64
+
+City = Tuple[str, float, float]  # name, lat, lng
+
+
+class CityCatalog:
+    def __init__(self, pools: Dict[str, Sequence[City]], registry_path: str = REGISTRY_PATH,
+                 gazetteer: Optional[Gazetteer] = None):
+        with open(registry_path, encoding="utf-8") as f:
+            names: List[str] = json.load(f)
+
+        ids = {name.lower(): i for i, name in enumerate(names)}
+        unregistered = []
+        for pool in pools.values():
+            for name, _, _ in pool:
+                if name.lower() in ids:
+                    continue
+                gazetteer_id = gazetteer.id_of(name) if gazetteer else None
+                if gazetteer_id is not None:
+                    ids[name.lower()] = gazetteer_id
+                else:
+                    ids[name.lower()] = len(names)
+                    names.append(name)
+                    unregistered.append(name)
+        if unregistered:
+            print(f"⚠️ {len(unregistered)} cities missing from {os.path.basename(registry_path)} "
+                  f"(IDs not stable until appended): {', '.join(unregistered[:5])}")
+        if len(names) > ID_BASE:
+            raise ValueError(f"{len(names)} hand-picked city IDs overlap the gazetteer's (from {ID_BASE})")
+
+        self.names = names
+        self.gazetteer = gazetteer
+        self._ids = ids
+        self._cities: Dict[int, City] = {}
+        self.pools: Dict[str, List[int]] = {}
+        for difficulty, pool in pools.items():
+            self.pools[difficulty] = [ids[name.lower()] for name, _, _ in pool]
+            for city in pool:
+                self._cities[ids[city[0].lower()]] = tuple(city)
+        self._decks: Dict[Tuple[str, int], List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def id_of(self, name: str) -> Optional[int]:
+        key = (name or "").lower().strip()
+        city_id = self._ids.get(key)
+        if city_id is None and key and self.gazetteer is not None:
+            city_id = self.gazetteer.id_of(key)
+        return city_id
+
+    def ids_of(self, names: Sequence[str]) -> List[int]:
+        """IDs of the known names (unknown ones are dropped)."""
+        return [i for i in map(self.id_of, names or []) if i is not None]
+
+    def city(self, city_id: int) -> City:
+        return self._cities[city_id]
+
+    def build_decks(self):
+        """Build every deck now (serve.py, before forking) instead of on first use per process."""
+        for difficulty in self.pools:
+            for index in range(DECKS_PER_POOL):
+                self._deck(difficulty, index)
+
+    def _deck(self, difficulty: str, index: int) -> List[int]:
+        deck = self._decks.get((difficulty, index))
+        if deck is None:
+            deck = list(self.pools[difficulty])
+            random.Random(f"{difficulty}:{index}").shuffle(deck)
+            self._decks[(difficulty, index)] = deck
+        return deck
+
+    def deck(self, difficulty: str, owner: str) -> List[int]:
+        """The shuffled pool `owner` (a session or player id) draws from."""
+        return self._deck(difficulty, zlib.crc32(owner.encode()) % DECKS_PER_POOL)
@@ -12,7 +12,11 @@ class SupabaseService:
         self.url = os.getenv("SUPABASE_URL")
         self.key = os.getenv("SUPABASE_KEY")
         self.client: Optional[Client] = None
-        
+        self.connect()
+
+    def connect(self):
+        """(Re)create the client; serve.py calls this in each forked worker."""
+        self.client = None
         if self.url and self.key:
             try:
                 self.client = create_client(self.url, self.key)
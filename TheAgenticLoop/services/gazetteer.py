@@ -0,0 +1,346 @@
+"""
+Memory-mapped columnar gazetteer: a large offline city list (a GeoNames dump
+with tens of thousands of cities) for difficulty pools and distance hints.
+
+    python -m services.gazetteer build cities15000.txt        # -> cities15000.gaz
+    python -m services.gazetteer select cities15000.gaz --countries IN --min-population 1000000
+
+BUILD parses the dump once (GeoNames tab format: geonameid, name, asciiname,
+alternatenames, lat, lng, feature class, feature code, country code, ...,
+population) into a binary cache of columns, rows sorted by population
+(largest first):
+
+    offsets     u32[n + 1] into the names blob (ASCII names, UTF-8)
+    lat, lng    float32[n]
+    population  u32[n]
+    city_id     u32[n] stable ID (see below)
+    index       u32[n] crc32(normalize_name(name)), sorted + u32[n] rows
+    country     2 bytes per row (ISO 3166 code)
+    kind        u8[n]: KIND_CAPITAL, KIND_ADMIN_SEAT or KIND_OTHER
+
+Names are unique in the cache (the most populous city keeps a name): answers
+are matched by name, so two "Springfield"s can't both be targets.
+
+LOAD mmaps the cache read-only and casts a memoryview per column: no parsing
+and no per-city Python objects, so opening it is instant and its pages are
+shared through the page cache by every process on the box (serve.py workers,
+worker.py). find() is a binary search over the name index.
+
+STABLE IDS: players' seen bitmaps store city IDs (services/cities.py), so a
+gazetteer city's ID has to survive rebuilds from a newer dump. The build keeps
+an APPEND-ONLY list of geonameids (--ids, one per line; commit it like
+city_ids.json) and a city's ID is ID_BASE + its line number. New cities are
+appended in population order, so the big ones get small IDs (short bitmaps).
+
+POOLS: a PoolFilter selects rows by population, country, bounding box and
+kind; polyglot_ai.GAZETTEER_POOLS maps each difficulty to a list of them.
+"""
+
+import argparse
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from services.matcher import normalize_name
+
+MAGIC = b"ATLGAZ01"
+HEADER = struct.Struct("<8sII")  # magic, rows, names blob bytes
+
+# IDs below this are services/city_ids.json (the hand-picked pools)
+ID_BASE = 4096
+
+KIND_OTHER = 0
+KIND_ADMIN_SEAT = 1  # PPLA: seat of a first-order division (state capital)
+KIND_CAPITAL = 2  # PPLC
+_KINDS = {"PPLC": KIND_CAPITAL, "PPLA": KIND_ADMIN_SEAT}
+
+# geonameid, name, lat, lng, population, country, kind
+Row = Tuple[int, str, float, float, int, str, int]
+
+
+class PoolFilter(NamedTuple):
+    min_population: int = 0
+    max_population: Optional[int] = None  # Exclusive
+    countries: Tuple[str, ...] = ()  # ISO codes; empty = any
+    exclude_countries: Tuple[str, ...] = ()
+    bbox: Optional[Tuple[float, float, float, float]] = None  # south, west, north, east
+    capitals_only: bool = False  # National capitals and state/province seats
+    limit: Optional[int] = None  # Most populous first
+
+    @classmethod
+    def from_dict(cls, spec: Dict) -> "PoolFilter":
+        spec = dict(spec)
+        for key in ("countries", "exclude_countries", "bbox"):
+            if spec.get(key) is not None:
+                spec[key] = tuple(spec[key])
+        return cls(**spec)
+
+
+def load_pool_filters(path: str) -> Dict[str, List[PoolFilter]]:
+    """{"GLOBAL_HARD": [{"min_population": 500000, "limit": 300}, ...], ...}"""
+    with open(path, encoding="utf-8") as f:
+        specs = json.load(f)
+    return {difficulty: [PoolFilter.from_dict(s) for s in filters] for difficulty, filters in specs.items()}
+
+
+# ------------------------------------------------------------------
+# BUILD
+# ------------------------------------------------------------------
+
+def read_geonames(path: str) -> Iterator[Row]:
+    """Populated places (feature class P) from a GeoNames cities*.txt / allCountries.txt dump."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15 or cols[6] != "P":
+                continue
+            yield (int(cols[0]), cols[2] or cols[1], float(cols[4]), float(cols[5]),
+                   int(cols[14] or 0), cols[8].upper(), _KINDS.get(cols[7], KIND_OTHER))
+
+
+def _read_ids(path: str) -> List[int]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [int(line) for line in f if line.strip()]
+
+
+def build(source: str, out: str, ids_path: str) -> Dict[str, int]:
+    """Parse `source` into the cache at `out`, appending new cities to the ID registry."""
+    unique: List[Tuple[str, Row]] = []
+    seen = set()
+    for row in sorted(read_geonames(source), key=lambda r: -r[4]):
+        key = normalize_name(row[1])
+        if key and key not in seen:
+            seen.add(key)
+            unique.append((key, row))
+
+    registry = _read_ids(ids_path)
+    positions = {geonameid: i for i, geonameid in enumerate(registry)}
+    new = [row[0] for _, row in unique if row[0] not in positions]
+    if new:
+        with open(ids_path, "a", encoding="utf-8") as f:
+            f.writelines(f"{geonameid}\n" for geonameid in new)
+        positions.update((geonameid, len(registry) + i) for i, geonameid in enumerate(new))
+
+    names = [row[1].encode("utf-8") for _, row in unique]
+    offsets = array.array("I", [0])
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    index = sorted((zlib.crc32(key.encode()), i) for i, (key, _) in enumerate(unique))
+    columns = [
+        offsets,
+        array.array("f", (row[2] for _, row in unique)),
+        array.array("f", (row[3] for _, row in unique)),
+        array.array("I", (min(row[4], 0xFFFFFFFF) for _, row in unique)),
+        array.array("I", (positions[row[0]] for _, row in unique)),
+        array.array("I", (h for h, _ in index)),
+        array.array("I", (i for _, i in index)),
+    ]
+    if sys.byteorder != "little":
+        for column in columns:
+            column.byteswap()
+
+    # Write next to the target, then swap: processes that have the old cache
+    # mapped keep reading the old inode
+    tmp = f"{out}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(unique), offsets[-1]))
+        for column in columns:
+            column.tofile(f)
+        f.write(b"".join(row[5].encode("ascii", "replace")[:2].ljust(2) for _, row in unique))
+        f.write(bytes(row[6] for _, row in unique))
+        f.write(b"".join(names))
+    os.replace(tmp, out)
+    return {"rows": len(unique), "new_ids": len(new), "registered": len(positions)}
+
+
+# ------------------------------------------------------------------
+# LOAD
+# ------------------------------------------------------------------
+
+class Gazetteer:
+    """Read-only view over a cache written by build(). Safe to share across fork()."""
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise ValueError("gazetteer caches are little-endian")
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, blob_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer cache (rebuild it with `build`)")
+        self.path = path
+        self._n = n
+        view = memoryview(self._mm)
+        pos = HEADER.size
+
+        def column(count: int, size: int, fmt: Optional[str] = None) -> memoryview:
+            nonlocal pos
+            col = view[pos:pos + count * size]
+            pos += count * size
+            return col.cast(fmt) if fmt else col
+
+        self._offsets = column(n + 1, 4, "I")
+        self._lat = column(n, 4, "f")
+        self._lng = column(n, 4, "f")
+        self._population = column(n, 4, "I")
+        self._city_id = column(n, 4, "I")
+        self._hashes = column(n, 4, "I")
+        self._index_rows = column(n, 4, "I")
+        self._country = column(n, 2)
+        self._kind = column(n, 1)
+        self._names = column(blob_size, 1)
+        if pos != len(self._mm):
+            raise ValueError(f"{path} is truncated or corrupt (rebuild it with `build`)")
+
+    def __len__(self) -> int:
+        return self._n
+
+    # --------------------------------------------------------------
+    # ROWS
+    # --------------------------------------------------------------
+
+    def name(self, row: int) -> str:
+        return bytes(self._names[self._offsets[row]:self._offsets[row + 1]]).decode("utf-8")
+
+    def city(self, row: int) -> Tuple[str, float, float]:
+        """(name, lat, lng) like the hand-picked pools; float32 is good to ~1 m."""
+        return self.name(row), round(self._lat[row], 4), round(self._lng[row], 4)
+
+    def population(self, row: int) -> int:
+        return self._population[row]
+
+    def country(self, row: int) -> str:
+        return bytes(self._country[2 * row:2 * row + 2]).decode("ascii").strip()
+
+    def stable_id(self, row: int) -> int:
+        return ID_BASE + self._city_id[row]
+
+    # --------------------------------------------------------------
+    # LOOKUP
+    # --------------------------------------------------------------
+
+    def find(self, name: str) -> Optional[int]:
+        """Row of the city called `name` (case/accent/punctuation-insensitive)."""
+        key = normalize_name(name)
+        if not key:
+            return None
+        h = zlib.crc32(key.encode())
+        i = bisect.bisect_left(self._hashes, h)
+        while i < self._n and self._hashes[i] == h:
+            row = self._index_rows[i]
+            if normalize_name(self.name(row)) == key:
+                return row
+            i += 1
+        return None
+
+    def coordinates(self, name: str) -> Optional[Tuple[float, float]]:
+        row = self.find(name)
+        return None if row is None else (round(self._lat[row], 4), round(self._lng[row], 4))
+
+    def id_of(self, name: str) -> Optional[int]:
+        row = self.find(name)
+        return None if row is None else self.stable_id(row)
+
+    def select(self, pool: PoolFilter) -> List[int]:
+        """Rows matching `pool`, most populous first."""
+        countries = {c.upper() for c in pool.countries}
+        excluded = {c.upper() for c in pool.exclude_countries}
+        # Rows are sorted by population: skip the too-big ones, stop at the too-small
+        start = 0
+        if pool.max_population is not None:
+            start = bisect.bisect_left(_Descending(self._population), -pool.max_population + 1)
+        rows = []
+        for row in range(start, self._n):
+            if self._population[row] < pool.min_population:
+                break
+            if countries or excluded:
+                country = self.country(row)
+                if (countries and country not in countries) or country in excluded:
+                    continue
+            if pool.bbox:
+                south, west, north, east = pool.bbox
+                if not (south <= self._lat[row] <= north and west <= self._lng[row] <= east):
+                    continue
+            if pool.capitals_only and self._kind[row] == KIND_OTHER:
+                continue
+            rows.append(row)
+            if pool.limit is not None and len(rows) >= pool.limit:
+                break
+        return rows
+
+
+class _Descending:
+    """Negated view of a descending column, so bisect can search it."""
+
+    def __init__(self, column: memoryview):
+        self.column = column
+
+    def __len__(self) -> int:
+        return len(self.column)
+
+    def __getitem__(self, i: int) -> int:
+        return -self.column[i]
+
+
+# ------------------------------------------------------------------
+# CLI
+# ------------------------------------------------------------------
+
+def _filter_from_args(args) -> PoolFilter:
+    return PoolFilter(
+        min_population=args.min_population, max_population=args.max_population,
+        countries=tuple(args.countries or ()), exclude_countries=tuple(args.exclude_countries or ()),
+        bbox=tuple(args.bbox) if args.bbox else None, capitals_only=args.capitals_only, limit=args.limit,
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Build / query the memory-mapped city gazetteer")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = commands.add_parser("build", help="GeoNames dump -> columnar cache")
+    build_cmd.add_argument("source", help="GeoNames cities*.txt (tab-separated)")
+    build_cmd.add_argument("--out", help="Cache path (default: SOURCE with a .gaz extension)")
+    build_cmd.add_argument("--ids", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer_ids.txt"),
+                           help="Append-only geonameid registry (stable city IDs; keep it under version control)")
+
+    select_cmd = commands.add_parser("select", help="Preview what a pool filter picks")
+    select_cmd.add_argument("cache")
+    select_cmd.add_argument("--min-population", type=int, default=0)
+    select_cmd.add_argument("--max-population", type=int)
+    select_cmd.add_argument("--countries", nargs="+")
+    select_cmd.add_argument("--exclude-countries", nargs="+")
+    select_cmd.add_argument("--bbox", type=float, nargs=4, metavar=("SOUTH", "WEST", "NORTH", "EAST"))
+    select_cmd.add_argument("--capitals-only", action="store_true")
+    select_cmd.add_argument("--limit", type=int)
+    select_cmd.add_argument("--show", type=int, default=20, help="Rows to print")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        out = args.out or os.path.splitext(args.source)[0] + ".gaz"
+        started = time.perf_counter()
+        stats = build(args.source, out, args.ids)
+        print(f"✅ {stats['rows']:,} cities -> {out} ({os.path.getsize(out) / 2**20:.1f} MiB) "
+              f"in {time.perf_counter() - started:.1f}s; {stats['new_ids']:,} new IDs "
+              f"({stats['registered']:,} in {args.ids})")
+    else:
+        gazetteer = Gazetteer(args.cache)
+        rows = gazetteer.select(_filter_from_args(args))
+        print(f"{len(rows):,} of {len(gazetteer):,} cities match")
+        for row in rows[:args.show]:
+            name, lat, lng = gazetteer.city(row)
+            print(f"  {name:<28} {gazetteer.country(row):<3} {gazetteer.population(row):>12,}  "
+                  f"({lat:.4f}, {lng:.4f})  id {gazetteer.stable_id(row)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Riddle generation pipeline, shared by the API (inline mode) and worker.py.
+
+generate_and_buffer() produces ONE riddle for a session and pushes it to the
+session queue: agent logs -> Polyglot AI -> matcher compile -> push_riddle.
+It only needs a SessionStore, so it runs the same in the API process and in
+a standalone worker. The caller passes its admission controller's level
+(services/admission.py): under overload, stored riddles stand in for LLM
+generation, and the daily quota planner (services/quota.py) sends top-ups
+over this hour's allowance there too. Riddles reclaimed from idle sessions
+(services/lifecycle.py) are served before anything is generated.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from polyglot_ai import (
+    CITY_CATALOG, fetch_library_riddle, generate_riddle_optimized, template_riddle
+)
+from services import riddle_codec
+from services.admission import FULL, LIBRARY_FIRST, RESERVOIR_ONLY
+from services.matcher import build_matcher
+from services.metrics import GENERATION_LATENCY, RIDDLE_SOURCE, SESSION_LIFECYCLE
+from services.quota import QUOTA
+from services.scheduler import TOP_UP
+from services.session_store import SessionStore
+
+INVENTORY_TRIES = 3  # Reclaimed riddles looked at per generation (the rest go back)
+
+
+async def agent_riddle_generation(
+    store: SessionStore,
+    session_id: str,
+    difficulty: str = "Medium",
+    topic: str = "Geography",
+    level: int = FULL
+) -> Dict[str, Any]:
+    """
+    Real Agentic Workflow (Polyglot AI + Supabase).
+    1. Publishes thought logs to the session log stream.
+    2. Generates city + riddle using AI (with difficulty level).
+    3. Handles fallback to Supabase if generation fails.
+    LIBRARY_FIRST: the library's riddle for the drawn city if it has one.
+    RESERVOIR_ONLY: no provider calls. A template riddle for the drawn city
+    (unique for the player, microseconds), or for a pool city if none was
+    drawn (a random stored riddle could repeat one the player has seen).
+    """
+    # Draw an unseen city for this session / player (bitmap of seen city IDs)
+    _, user_id = await store.get_session(session_id)
+    city = None
+    if difficulty in CITY_CATALOG.pools:
+        deck = CITY_CATALOG.deck(difficulty, user_id or session_id)
+        city_id = await store.draw_city(session_id, difficulty, deck, user_id)
+        if city_id is not None:
+            city = CITY_CATALOG.city(city_id)
+
+    # Log pacing holds a generation slot: skipped while degraded
+    pace = level == FULL
+
+    # 1. Agent: Select Target City (AI Generated)
+    await store.append_log(session_id, f"Mission Control: Scouting global targets related to {topic} [Difficulty: {difficulty.upper()}]...")
+    if pace:
+        await asyncio.sleep(0.5)
+
+    # 2. Agent: Generate Riddle (Polyglot System + DB Fallback)
+    await store.append_log(session_id, "🚀 Invoking Polyglot AI System (Groq + Cohere + Gemini)...")
+    if pace:
+        await asyncio.sleep(0.3)
+
+    started = time.perf_counter()
+    riddle_result = None
+    if level >= LIBRARY_FIRST and city is not None:
+        riddle_result = await fetch_library_riddle(difficulty, city[0])
+    if riddle_result is None and level >= RESERVOIR_ONLY:
+        riddle_result = template_riddle(difficulty, city)
+    if riddle_result is None:
+        riddle_result = await generate_riddle_optimized(
+            difficulty=difficulty,
+            timeout_sec=15,
+            city=city
+        )
+
+    # Extract data
+    riddle_text = riddle_result["riddle"]
+    stats = riddle_result["stats"]
+    location = riddle_result["location"]
+
+    # Which tier produced it: groq / gemini, or the db_cache / template / hardcoded fallbacks
+    source = stats.get("generator_provider") or "unknown"
+    RIDDLE_SOURCE.inc(source)
+    GENERATION_LATENCY.observe(time.perf_counter() - started, source)
+
+    # Fallback tiers pick their own city: exclude that one too
+    if city is None or location.get("name") != city[0]:
+        city_id = CITY_CATALOG.id_of(location.get("name"))
+        if city_id is not None:
+            await store.mark_city_seen(session_id, difficulty, city_id, user_id)
+
+    # Log the result
+    if stats["generator_provider"] in ["supabase_backup", "supabase_cache"]:
+        await store.append_log(session_id, "⚠️ Generation slow. Fetched from Secure Vault (Supabase).")
+    elif level > FULL and stats["generator_provider"] in ["library", "db_cache", "template", "hardcoded"]:
+        await store.append_log(session_id, "📚 High demand. Target pulled from the riddle archive.")
+    else:
+        await store.append_log(
+            session_id,
+            f"✅ Target Locked. Riddle generated in {stats['total_time_ms']}ms!"
+        )
+        await store.append_log(
+            session_id,
+            f"📊 Stats: Gen={stats['generator_provider']}, Critic={stats['critic_provider']}"
+        )
+
+    return {
+        "riddle": riddle_text,
+        "answer": location["name"],
+        "difficulty": difficulty,
+        "topic": topic,
+        "location": location,
+        "provider_stats": stats
+    }
+
+
+async def serve_from_inventory(store: SessionStore, session_id: str, difficulty: str) -> Optional[bool]:
+    """
+    Queue a riddle reclaimed from an idle session, if one for a city this
+    player hasn't seen is near the front of the inventory. None if there was
+    none, else push_riddle's result.
+    """
+    started = time.perf_counter()
+    _, user_id = await store.get_session(session_id)
+    skipped = []
+    try:
+        for _ in range(INVENTORY_TRIES):
+            raw = await store.take_inventory(difficulty)
+            if raw is None:
+                return None
+            city_id = CITY_CATALOG.id_of(riddle_codec.decode(raw).answer)
+            if city_id is not None and not await store.mark_city_seen(session_id, difficulty, city_id, user_id):
+                skipped.append(raw)
+                continue
+            if await store.push_riddle(session_id, raw, difficulty):
+                SESSION_LIFECYCLE.inc("served")
+                RIDDLE_SOURCE.inc("inventory")
+                GENERATION_LATENCY.observe(time.perf_counter() - started, "inventory")
+                await store.append_log(session_id, "♻️ Target recovered from the field inventory.")
+                return True
+            return False  # Went idle meanwhile: push_riddle put it back
+        return None
+    finally:
+        for raw in skipped:
+            await store.return_inventory(difficulty, raw)
+
+
+async def generate_and_buffer(
+    store: SessionStore,
+    session_id: str,
+    difficulty: str = "Medium",
+    level: int = FULL,
+    priority: int = TOP_UP
+) -> bool:
+    """
+    Generate one riddle and push it to the session queue (settles one pending
+    generation). False if the session went idle first and the riddle was
+    diverted to the inventory. `priority` is the job's urgency class
+    (services/scheduler.py), for quota pacing.
+    """
+    served = await serve_from_inventory(store, session_id, difficulty)
+    if served is not None:
+        return served
+    level = QUOTA.admit(priority, level)
+
+    # Generate the content (Slow operation)
+    riddle_data = await agent_riddle_generation(store, session_id, difficulty, level=level)
+
+    # Compile the answer matcher once here so verify_answer never has to
+    riddle_data["matcher"] = build_matcher(riddle_data["answer"]).to_dict()
+
+    # Encode once (verification fields + pre-encoded client JSON) and push
+    queued = await store.push_riddle(session_id, riddle_codec.encode(riddle_data), difficulty)
+    if not queued:
+        SESSION_LIFECYCLE.inc("diverted")
+    return queued
@@ -0,0 +1,304 @@
+"""
+Redis job queue for riddle generation (API enqueues, worker.py executes).
+
+One job = one riddle for one session. Reliable-queue layout:
+
+    jobs:ready                 ZSET    job id -> priority score (services.scheduler:
+                                       urgency class + aging), lowest claimed first
+    jobs:signal                LIST    wake-up tokens, one per enqueued/requeued job
+    jobs:job:{id}              HASH    session_id, difficulty, priority, score,
+                                       attempts, owner, last_error
+    jobs:processing:{worker}   LIST    ids a worker has taken
+    jobs:leases                ZSET    id -> lease deadline (ms)
+    jobs:workers               SET     registered worker ids
+    jobs:worker:{worker}       STRING  heartbeat, expires after HEARTBEAT_TTL
+    jobs:dead                  LIST    dead-lettered jobs (JSON, capped)
+
+Lifecycle:
+    enqueue   HSET job + ZADD ready + LPUSH signal
+    claim     one script: ZPOPMIN ready -> processing:{worker} + lease (attempts += 1);
+              idle workers block on BLPOP signal and retry the claim
+    heartbeat refresh the worker key and extend the leases it holds
+    ack       drop the job (only if this worker still owns it)
+    fail      retry (back to ready, original score: it has aged) or dead-letter
+              after MAX_ATTEMPTS
+
+Any worker periodically reaps: expired leases (hung job or dead owner) and
+the processing lists of workers whose heartbeat expired. Delivery is
+at-least-once: a job whose lease ran out while its worker was merely slow
+may produce one extra riddle.
+
+Needs Redis >= 5 (ZPOPMIN).
+"""
+
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.scheduler import TOP_UP, priority_score
+
+JOB_PREFIX = "jobs"
+LEASE_SEC = 60  # A job not heartbeated for this long is handed to another worker
+HEARTBEAT_SEC = 10
+HEARTBEAT_TTL = 30  # Worker presumed dead after missing this many seconds of heartbeats
+MAX_ATTEMPTS = 3
+DEAD_LETTER_MAX = 1000
+SIGNAL_MAX = 10000  # Wake-up tokens kept while no worker is listening
+
+# ------------------------------------------------------------------
+# LUA SOURCES
+# ------------------------------------------------------------------
+# Job keys are derived from ARGV[1] (prefix) inside the scripts; this queue
+# targets a single Redis node.
+
+# Shared: give a job back (retry) or bury it. Returns the session id when buried.
+_LUA_RELEASE = """
+local prefix = ARGV[1]
+local ready, leases, dead = prefix .. ':ready', prefix .. ':leases', prefix .. ':dead'
+local signal = prefix .. ':signal'
+
+local function release(id, from_list, err, max_attempts, dead_max)
+    if from_list then
+        redis.call('LREM', from_list, 1, id)
+    end
+    redis.call('ZREM', leases, id)
+    local job = prefix .. ':job:' .. id
+    if redis.call('EXISTS', job) == 0 then
+        return false
+    end
+    redis.call('HSET', job, 'last_error', err)
+    redis.call('HDEL', job, 'owner')
+    local attempts = tonumber(redis.call('HGET', job, 'attempts') or '0')
+    if attempts < max_attempts then
+        redis.call('ZADD', ready, redis.call('HGET', job, 'score') or 0, id)
+        redis.call('LPUSH', signal, 1)
+        return false
+    end
+    local fields = redis.call('HGETALL', job)
+    local record = {id = id}
+    for i = 1, #fields, 2 do
+        record[fields[i]] = fields[i + 1]
+    end
+    redis.call('LPUSH', dead, cjson.encode(record))
+    redis.call('LTRIM', dead, 0, dead_max - 1)
+    redis.call('DEL', job)
+    return record.session_id or false
+end
+"""
+
+# ARGV: prefix, worker, lease deadline (ms).
+# Returns {id, session_id, difficulty, attempts, score, priority} or false if nothing is ready.
+CLAIM_JOB_LUA = """
+local prefix, worker = ARGV[1], ARGV[2]
+local ready = prefix .. ':ready'
+while true do
+    local popped = redis.call('ZPOPMIN', ready)
+    if #popped == 0 then
+        return false
+    end
+    local id, score = popped[1], popped[2]
+    local job = prefix .. ':job:' .. id
+    if redis.call('EXISTS', job) == 1 then
+        redis.call('RPUSH', prefix .. ':processing:' .. worker, id)
+        local attempts = redis.call('HINCRBY', job, 'attempts', 1)
+        redis.call('HSET', job, 'owner', worker)
+        redis.call('ZADD', prefix .. ':leases', ARGV[3], id)
+        local f = redis.call('HMGET', job, 'session_id', 'difficulty', 'priority')
+        return {id, f[1] or '', f[2] or '', attempts, score, f[3] or ''}
+    end
+end
+"""
+
+# ARGV: prefix, id, worker
+ACK_JOB_LUA = """
+local prefix, id, worker = ARGV[1], ARGV[2], ARGV[3]
+local job = prefix .. ':job:' .. id
+redis.call('LREM', prefix .. ':processing:' .. worker, 1, id)
+if redis.call('HGET', job, 'owner') == worker then
+    redis.call('ZREM', prefix .. ':leases', id)
+    redis.call('DEL', job)
+    return 1
+end
+return 0
+"""
+
+# ARGV: prefix, id, worker, error, max attempts, dead max. Returns buried session id or false.
+FAIL_JOB_LUA = _LUA_RELEASE + """
+local id, worker = ARGV[2], ARGV[3]
+if redis.call('HGET', prefix .. ':job:' .. id, 'owner') ~= worker then
+    redis.call('LREM', prefix .. ':processing:' .. worker, 1, id)
+    return false
+end
+return release(id, prefix .. ':processing:' .. worker, ARGV[4], tonumber(ARGV[5]), tonumber(ARGV[6]))
+"""
+
+# ARGV: prefix, now (ms), max attempts, dead max. Returns {requeued, buried session ids...}
+REAP_LUA = _LUA_RELEASE + """
+local now, max_attempts, dead_max = ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4])
+local requeued, buried = 0, {}
+
+local function settle(id, from_list, err)
+    local session = release(id, from_list, err, max_attempts, dead_max)
+    if session then
+        table.insert(buried, session)
+    else
+        requeued = requeued + 1
+    end
+end
+
+-- 1. Expired leases: hung job, or owner died
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', leases, '-inf', now)) do
+    local owner = redis.call('HGET', prefix .. ':job:' .. id, 'owner')
+    settle(id, owner and (prefix .. ':processing:' .. owner) or false, 'lease expired')
+end
+
+-- 2. Workers whose heartbeat expired: everything they were holding
+local workers = prefix .. ':workers'
+for _, worker in ipairs(redis.call('SMEMBERS', workers)) do
+    if redis.call('EXISTS', prefix .. ':worker:' .. worker) == 0 then
+        local processing = prefix .. ':processing:' .. worker
+        for _, id in ipairs(redis.call('LRANGE', processing, 0, -1)) do
+            settle(id, processing, 'worker lost')
+        end
+        redis.call('DEL', processing)
+        redis.call('SREM', workers, worker)
+    end
+end
+
+return {requeued, unpack(buried)}
+"""
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class GenerationJobQueue:
+    """
+    Producer + consumer API over the job keys. The API only calls enqueue();
+    worker.py uses the rest. Create once per Redis client.
+    """
+
+    def __init__(
+        self,
+        client,
+        prefix: str = JOB_PREFIX,
+        lease_sec: int = LEASE_SEC,
+        max_attempts: int = MAX_ATTEMPTS
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.lease_sec = lease_sec
+        self.max_attempts = max_attempts
+        self.ready_key = f"{prefix}:ready"
+        self.signal_key = f"{prefix}:signal"
+        self.dead_key = f"{prefix}:dead"
+        self._claim = client.register_script(CLAIM_JOB_LUA)
+        self._ack = client.register_script(ACK_JOB_LUA)
+        self._fail = client.register_script(FAIL_JOB_LUA)
+        self._reap = client.register_script(REAP_LUA)
+
+    def _processing_key(self, worker_id: str) -> str:
+        return f"{self.prefix}:processing:{worker_id}"
+
+    # --------------------------------------------------------------
+    # PRODUCER
+    # --------------------------------------------------------------
+
+    async def enqueue(self, session_id: str, difficulty: str, priorities: List[int]) -> List[str]:
+        """One job per riddle (one per priority), so several workers can fill one session's buffer."""
+        now = time.time()
+        job_ids = [uuid.uuid4().hex for _ in priorities]
+        scores = {job_id: priority_score(priority, now) for job_id, priority in zip(job_ids, priorities)}
+        async with self.client.pipeline(transaction=True) as pipe:
+            for job_id, priority in zip(job_ids, priorities):
+                pipe.hset(f"{self.prefix}:job:{job_id}", mapping={
+                    "session_id": session_id,
+                    "difficulty": difficulty,
+                    "priority": priority,
+                    "score": scores[job_id],
+                    "attempts": 0,
+                    "enqueued_at": _now_ms(),
+                })
+            pipe.zadd(self.ready_key, scores)
+            pipe.lpush(self.signal_key, *([1] * len(job_ids)))
+            pipe.ltrim(self.signal_key, 0, SIGNAL_MAX - 1)
+            await pipe.execute()
+        return job_ids
+
+    async def stats(self) -> Dict[str, int]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zcard(self.ready_key)
+            pipe.zcard(f"{self.prefix}:leases")
+            pipe.scard(f"{self.prefix}:workers")
+            pipe.llen(self.dead_key)
+            ready, leased, workers, dead = await pipe.execute()
+        return {"ready": ready, "leased": leased, "workers": workers, "dead": dead}
+
+    async def load(self, slots_per_worker: int, llm_slots_per_worker: int) -> Tuple[int, int, int]:
+        """(jobs waiting + running, registered job slots, those the providers can fill): admission control."""
+        stats = await self.stats()
+        workers = stats["workers"]
+        return stats["ready"] + stats["leased"], workers * slots_per_worker, workers * llm_slots_per_worker
+
+    # --------------------------------------------------------------
+    # CONSUMER (worker.py)
+    # --------------------------------------------------------------
+
+    async def register_worker(self, worker_id: str, heartbeat_ttl: int = HEARTBEAT_TTL):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.sadd(f"{self.prefix}:workers", worker_id)
+            pipe.set(f"{self.prefix}:worker:{worker_id}", _now_ms(), ex=heartbeat_ttl)
+            await pipe.execute()
+
+    async def unregister_worker(self, worker_id: str):
+        """Graceful exit: drop the heartbeat so the next reap requeues anything left."""
+        await self.client.delete(f"{self.prefix}:worker:{worker_id}")
+
+    async def heartbeat(self, worker_id: str, job_ids: List[str], heartbeat_ttl: int = HEARTBEAT_TTL):
+        deadline = _now_ms() + self.lease_sec * 1000
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(f"{self.prefix}:worker:{worker_id}", _now_ms(), ex=heartbeat_ttl)
+            for job_id in job_ids:
+                pipe.zadd(f"{self.prefix}:leases", {job_id: deadline}, xx=True)
+            await pipe.execute()
+
+    async def claim(self, worker_id: str, blocking_client, timeout: float = 5) -> Optional[Dict[str, Any]]:
+        """
+        Take the most urgent job, blocking up to `timeout` seconds for one.
+        Returns {"id", "session_id", "difficulty", "attempts", "score", "priority"} or None.
+        """
+        job = await self._try_claim(worker_id)
+        if job is None and await blocking_client.blpop([self.signal_key], timeout=timeout):
+            job = await self._try_claim(worker_id)
+        return job
+
+    async def _try_claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        deadline = _now_ms() + self.lease_sec * 1000
+        claimed = await self._claim(args=[self.prefix, worker_id, deadline])
+        if not claimed:
+            return None
+        job_id, session_id, difficulty, attempts, score, priority = claimed
+        return {
+            "id": job_id, "session_id": session_id, "difficulty": difficulty,
+            "attempts": int(attempts), "score": float(score),
+            "priority": int(priority) if priority else TOP_UP,
+        }
+
+    async def ack(self, worker_id: str, job_id: str) -> bool:
+        return bool(await self._ack(args=[self.prefix, job_id, worker_id]))
+
+    async def fail(self, worker_id: str, job_id: str, error: str) -> Optional[str]:
+        """Retry or dead-letter. Returns the session id if the job was dead-lettered."""
+        return await self._fail(args=[
+            self.prefix, job_id, worker_id, error[:500], self.max_attempts, DEAD_LETTER_MAX
+        ]) or None
+
+    async def reap(self) -> tuple[int, List[str]]:
+        """Requeue/bury jobs of expired leases and dead workers. Returns (requeued, buried session ids)."""
+        result = await self._reap(args=[self.prefix, _now_ms(), self.max_attempts, DEAD_LETTER_MAX])
+        return int(result[0]), list(result[1:])
+
+    async def dead_letters(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return [json.loads(raw) for raw in await self.client.lrange(self.dead_key, 0, limit - 1)]
@@ -0,0 +1,170 @@
+"""
+Session lifecycle: stop spending LLM calls and Redis memory on sessions
+nobody is playing any more.
+
+    ACTIVITY   player transitions only (start, get_question, verify_answer).
+               Each sets active_at and gives every key of the session
+               (session, queue, logs, seen) the same SESSION_TTL. Generation
+               writes don't extend it, so an abandoned session's keys all
+               expire together at most SESSION_TTL after the last click.
+    IDLE       SESSION_IDLE_SEC without activity. SessionReaper marks the
+               session idle, zeroes its pending generations and moves its
+               unread riddles to the shared inventory:{difficulty} list.
+               The next activity clears the mark.
+    GUARD      GenerationGuard runs a session's generations as tasks. A
+               generation for an idle or expired session doesn't start, and
+               one in flight when its session goes idle is cancelled. A
+               riddle that finishes anyway (push raced the reaper) is
+               diverted to the inventory by push_riddle.
+    INVENTORY  generate_and_buffer serves a reclaimed riddle before drawing
+               a new one, as long as the player hasn't seen that city. It
+               skips the LLM entirely.
+
+One reaper per process is fine: RECLAIM_IDLE_LUA removes each session from
+sessions:active atomically, so concurrent reapers never reclaim the same one.
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Dict, Optional, Set, TypeVar
+
+from services.metrics import SESSION_LIFECYCLE
+from services.session_store import SessionStore
+
+REAP_INTERVAL_SEC = float(os.getenv("SESSION_REAP_INTERVAL_SEC", "15"))
+GUARD_INTERVAL_SEC = float(os.getenv("SESSION_GUARD_INTERVAL_SEC", "5"))
+REAP_BATCH = 500
+
+T = TypeVar("T")
+
+
+class SessionReaper:
+    """Every `interval` seconds, reclaim sessions idle past the store's idle_sec."""
+
+    def __init__(self, store: SessionStore, interval: float = REAP_INTERVAL_SEC, batch: int = REAP_BATCH):
+        self.store = store
+        self.interval = interval
+        self.batch = batch
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                print(f"⚠️ Session reaper failed: {e}")
+
+    async def reap(self) -> int:
+        """One pass (more batches while they come back full). Returns sessions reclaimed."""
+        sessions = riddles = 0
+        while True:
+            reclaimed = await self.store.reclaim_idle(self.batch)
+            sessions += len(reclaimed)
+            riddles += sum(moved for _, moved in reclaimed)
+            if len(reclaimed) < self.batch:
+                break
+        if sessions:
+            SESSION_LIFECYCLE.inc("idle", amount=sessions)
+            SESSION_LIFECYCLE.inc("reclaimed", amount=riddles)
+            print(f"♻️ Reclaimed {sessions} idle sessions ({riddles} unread riddles to the inventory)")
+        return sessions
+
+
+class GenerationGuard:
+    """
+    Runs generations as per-session tasks and cancels the ones whose session
+    went idle or expired (checked every `interval` seconds, one round trip
+    for all sessions with work in flight).
+    """
+
+    def __init__(self, store: SessionStore, interval: float = GUARD_INTERVAL_SEC):
+        self.store = store
+        self.interval = interval
+        self._running: Dict[str, Set[asyncio.Task]] = {}
+        self._cancelled: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def in_flight(self) -> int:
+        return sum(len(tasks) for tasks in self._running.values())
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self, session_id: str, coro: Awaitable[T]) -> Optional[T]:
+        """
+        Await `coro` for the session. None if it was skipped (session not
+        active) or cancelled by the guard; other exceptions propagate.
+        """
+        if not (await self.store.active([session_id]))[0]:
+            coro.close()
+            SESSION_LIFECYCLE.inc("skipped")
+            return None
+
+        task = asyncio.ensure_future(coro)
+        self._running.setdefault(session_id, set()).add(task)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task not in self._cancelled:
+                task.cancel()  # The caller itself was cancelled: take the child down too
+                raise
+            return None
+        finally:
+            tasks = self._running.get(session_id)
+            if tasks is not None:
+                tasks.discard(task)
+                if not tasks:
+                    del self._running[session_id]
+            self._cancelled.discard(task)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"⚠️ Generation guard check failed: {e}")
+
+    async def check(self) -> int:
+        """Cancel the generations of sessions that are no longer active. Returns how many."""
+        session_ids = list(self._running)
+        if not session_ids:
+            return 0
+        cancelled = 0
+        for session_id, active in zip(session_ids, await self.store.active(session_ids)):
+            if active:
+                continue
+            for task in self._running.get(session_id, ()):
+                if not task.done() and task not in self._cancelled:
+                    self._cancelled.add(task)
+                    task.cancel()
+                    cancelled += 1
+        if cancelled:
+            SESSION_LIFECYCLE.inc("cancelled", amount=cancelled)
+            print(f"⏹️ Cancelled {cancelled} generations for idle sessions")
+        return cancelled
@@ -0,0 +1,202 @@
+"""
+Agent log transport: durable per-session log + multiplexed fan-out.
+
+WRITE: publish() appends each line to the session's capped log in the
+SessionStore (a Redis Stream, `XADD logs:{id} MAXLEN ~ N` + PUBLISH, in one
+Lua call; or an in-memory deque). Lines emitted before any SSE client is
+listening (the whole first buffer_worker run) are kept.
+
+RESUME: SSE events carry the log entry id. On (re)connect the client's
+`Last-Event-ID` is replayed from the store, so a reconnect only fetches the
+gap; a first connect replays what the log still holds.
+
+FAN-OUT: ONE store listener (the `logs:*` pattern subscription on Redis) per
+worker process, instead of one polled Pub/Sub connection per SSE client. A
+single reader task dispatches each message to bounded per-session asyncio
+queues, and SSE generators simply await their queue. Cost scales with
+messages actually delivered, not with connections x poll rate.
+
+Slow consumers can't grow memory without bound; when a queue is full the
+subscription's drop policy applies:
+    "drop_oldest"  discard the oldest buffered line (default, keeps logs fresh)
+    "drop_newest"  discard the incoming line
+    "disconnect"   close the subscription; the client's EventSource reconnects
+Heartbeats are sent by EventSourceResponse(ping=...) on the SSE side.
+"""
+
+import asyncio
+from typing import Dict, Set, Optional, AsyncIterator, List, Tuple
+
+from services.session_store import SessionStore, parse_entry_id
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+
+_CLOSED = object()  # Sentinel pushed into a queue to end its iterator
+
+
+class LogSubscription:
+    """One SSE client's view of a session's log channel."""
+
+    def __init__(self, hub: "LogHub", session_id: str, maxsize: int, policy: str):
+        self.hub = hub
+        self.session_id = session_id
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def deliver(self, payload: Tuple[str, str]):
+        """Called by the hub reader with (entry_id, line). Never blocks."""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(payload)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        self.dropped += 1
+        if self.policy == DROP_OLDEST:
+            self.queue.get_nowait()
+            self.queue.put_nowait(payload)
+        elif self.policy == DISCONNECT:
+            self.close()
+        # DROP_NEWEST: nothing to do
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # Make room for the sentinel so the consumer wakes up immediately
+        while self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSED)
+
+    def __enter__(self) -> "LogSubscription":
+        return self
+
+    def __exit__(self, *exc):
+        self.hub.unsubscribe(self)
+
+    def __aiter__(self) -> AsyncIterator[dict]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[dict]:
+        """Yields SSE event dicts: {"id": entry id, "data": line}."""
+        reported = 0
+        while True:
+            payload = await self.queue.get()
+            if payload is _CLOSED:
+                return
+            if self.dropped > reported:
+                yield {"data": f"⚠️ {self.dropped - reported} log lines skipped (slow connection)"}
+                reported = self.dropped
+            entry_id, line = payload
+            yield {"id": entry_id, "data": line}
+
+    async def stream(self, last_event_id: Optional[str] = None) -> AsyncIterator[dict]:
+        """
+        Replay the session's stream after last_event_id (everything if None),
+        then continue live, skipping live lines the replay already covered.
+        Subscribe BEFORE calling this so nothing falls between the two.
+        """
+        last_seen = parse_entry_id(last_event_id) if last_event_id else (0, 0)
+        for entry_id, line in await self.hub.replay(self.session_id, last_event_id):
+            last_seen = parse_entry_id(entry_id)
+            yield {"id": entry_id, "data": line}
+
+        async for event in self:
+            if "id" in event and parse_entry_id(event["id"]) <= last_seen:
+                continue
+            yield event
+
+
+class LogHub:
+    """
+    Per-process log dispatcher.
+    start() in lifespan startup, stop() in shutdown.
+    """
+
+    def __init__(
+        self,
+        store: SessionStore,
+        queue_size: int = 100,
+        policy: str = DROP_OLDEST,
+        reconnect_delay: float = 1.0
+    ):
+        self.store = store
+        self.queue_size = queue_size
+        self.policy = policy
+        self.reconnect_delay = reconnect_delay
+        self._subscribers: Dict[str, Set[LogSubscription]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def subscribe(self, session_id: str, policy: Optional[str] = None) -> LogSubscription:
+        """Register an SSE client. Use as a context manager so it always unsubscribes."""
+        subscription = LogSubscription(self, session_id, self.queue_size, policy or self.policy)
+        self._subscribers.setdefault(session_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LogSubscription):
+        subs = self._subscribers.get(subscription.session_id)
+        if subs is None:
+            return
+        subs.discard(subscription)
+        if not subs:
+            del self._subscribers[subscription.session_id]
+
+    def dispatch(self, session_id: str, message: str):
+        """Fan a "<entry id> <line>" message out to this process's subscribers."""
+        subs = self._subscribers.get(session_id)
+        if not subs:
+            return
+        entry_id, _, line = message.partition(" ")
+        for subscription in tuple(subs):
+            subscription.deliver((entry_id, line))
+
+    # --------------------------------------------------------------
+    # DURABLE LOG OPERATIONS
+    # --------------------------------------------------------------
+
+    async def publish(self, session_id: str, line: str) -> str:
+        """Append a log line to the session log and notify live listeners."""
+        return await self.store.append_log(session_id, line)
+
+    async def replay(self, session_id: str, after_id: Optional[str] = None) -> List[Tuple[str, str]]:
+        """Log entries strictly after after_id (all retained entries if None)."""
+        return await self.store.read_log(session_id, after_id)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for subs in list(self._subscribers.values()):
+            for subscription in list(subs):
+                subscription.close()
+
+    async def _run(self):
+        """Reader loop: one store listener, reconnect on failure."""
+        while True:
+            try:
+                async for session_id, message in self.store.listen_logs():
+                    self.dispatch(session_id, message)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Log hub connection lost: {e}. Reconnecting in {self.reconnect_delay}s")
+                await asyncio.sleep(self.reconnect_delay)
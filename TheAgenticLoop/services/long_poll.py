@@ -0,0 +1,107 @@
+"""
+Long-poll support for get_question (?wait=N).
+
+Instead of answering a cache miss with 202 + retry_after and letting the
+frontend re-poll, the request is parked until a riddle lands in the session
+queue (or the wait runs out), so it goes out the instant it is enqueued.
+
+Two ways to wait:
+- Real Redis: BLPOP on a DEDICATED client/pool, so parked requests can never
+  take connections away from normal traffic. Also wakes up for riddles pushed
+  by other processes.
+- In-memory store / no blocking client: an in-process notifier. buffer_worker calls
+  notify() after every push and the waiter re-runs the normal pop.
+
+When all blocking slots are taken the waiter returns immediately and the
+endpoint degrades to the classic 202 response.
+"""
+
+import asyncio
+from typing import Dict, Optional, Set, Tuple
+
+from services.session_store import SessionStore
+
+
+class QuestionWaiter:
+    def __init__(
+        self,
+        store: SessionStore,
+        blocking_client=None,
+        max_blocking: int = 50
+    ):
+        self.store = store
+        self.blocking_client = blocking_client
+        self._slots = asyncio.Semaphore(max_blocking)
+        self._events: Dict[str, Set[asyncio.Event]] = {}
+
+    def notify(self, session_id: str):
+        """Wake in-process waiters for a session (call after push_riddle)."""
+        for event in self._events.get(session_id, ()):
+            event.set()
+
+    async def wait_for_question(
+        self,
+        session_id: str,
+        timeout: float,
+        target: int = 0
+    ) -> Tuple[Optional[str], Optional[str], int, int]:
+        """
+        Block up to `timeout` seconds for the next riddle.
+        Returns the same tuple as SessionStore.pop_question; raw is None on timeout.
+        """
+        if self._slots.locked():
+            return None, None, 0, 0
+
+        async with self._slots:
+            if self.blocking_client is not None:
+                return await self._wait_blpop(session_id, timeout, target)
+            return await self._wait_notified(session_id, timeout, target)
+
+    async def _wait_blpop(self, session_id: str, timeout: float, target: int):
+        queue_key = f"{self.store.queue_prefix}:{session_id}"
+        popped = await self.blocking_client.blpop([queue_key], timeout=timeout)
+        if not popped:
+            return None, None, 0, 0
+
+        _, raw = popped
+        try:
+            difficulty, depth, refill = await asyncio.shield(
+                self.store.arm_question(session_id, raw, target)
+            )
+        except Exception:
+            # Couldn't arm it: put the riddle back for the next poll
+            await self.store.client.lpush(queue_key, raw)
+            raise
+        if difficulty is None:
+            return None, None, 0, 0  # The session expired while parked
+        return raw, difficulty, depth, refill
+
+    async def _wait_notified(self, session_id: str, timeout: float, target: int):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        event = asyncio.Event()
+        self._events.setdefault(session_id, set()).add(event)
+        # Every pop may claim refills (pending is bumped in the store): all of
+        # them go back to the caller, or the claims leak until PENDING_STALE_SEC
+        claimed = 0
+        try:
+            while True:
+                # Pop first: a push may have landed before the event was registered
+                raw, difficulty, depth, refill = await self.store.pop_question(session_id, target)
+                claimed += refill
+                if raw or difficulty is None:
+                    return raw, difficulty, depth, claimed
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None, difficulty, depth, claimed
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    return None, difficulty, depth, claimed
+                event.clear()
+        finally:
+            events = self._events.get(session_id)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self._events[session_id]
@@ -0,0 +1,182 @@
+"""
+Event-loop lag monitor and blocking-call detector.
+
+Anything synchronous on the loop (Supabase .execute(), bcrypt, a slow JSON
+dump) freezes every request and SSE stream in the process at once. This
+makes those freezes visible and says WHO caused them:
+
+- A tick task sleeps `interval` and measures how late it wakes up: that is
+  the loop lag, recorded in a rolling window (percentiles) and in the
+  atlast_event_loop_lag_seconds histogram.
+- A watchdog THREAD checks the tick's heartbeat. When the loop is overdue by
+  more than `threshold` it snapshots the loop thread's stack
+  (sys._current_frames) while the blocking code is still running, so the
+  stack points at the culprit rather than at whatever ran after it.
+- When the loop comes back, the stall's duration is charged to that stack.
+  Offenders are grouped by the innermost frame in this codebase (e.g.
+  services/db.py:103 in get_user_streak).
+
+Cost: one sleep/wakeup per interval on the loop plus a thread waking twice
+per threshold; stacks are only walked during a stall. Safe to leave on.
+Code that holds the GIL for the whole stall (rare; most C extensions release
+it) can only be sampled once it lets go, so its stack may be off.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from services.metrics import LOOP_LAG, LOOP_STALLS
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _is_project_frame(filename: str) -> bool:
+    return filename.startswith(PROJECT_ROOT) and "site-packages" not in filename and \
+        os.sep + "venv" + os.sep not in filename
+
+
+class LoopMonitor:
+    def __init__(
+        self,
+        interval: float = 0.1,
+        threshold: float = 0.1,
+        window: int = 3000,
+        max_offenders: int = 50,
+        stack_depth: int = 12
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_offenders = max_offenders
+        self.stack_depth = stack_depth
+        self._lags: deque = deque(maxlen=window)  # Last `window` lag samples (seconds)
+        self._offenders: Dict[str, Dict[str, Any]] = {}
+        self.stalls = 0
+        self._beat = time.perf_counter()
+        self._stall: Optional[Dict[str, Any]] = None  # Set by the watchdog, settled by the tick
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    async def start(self):
+        if self._task:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        print(f"🩺 Loop monitor on (stall threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    # ------------------------------------------------------------------
+    # LOOP SIDE
+    # ------------------------------------------------------------------
+
+    async def _tick(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(now - expected, 0.0)
+            self._beat = now
+            self._lags.append(lag)
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._settle_stall(lag)
+
+    def _settle_stall(self, lag: float):
+        stall, self._stall = self._stall, None
+        self.stalls += 1
+        LOOP_STALLS.inc()
+        if stall is None:
+            # Shorter than the watchdog's sampling period: no stack
+            stall = {"where": "unattributed", "stack": []}
+
+        offender = self._offenders.get(stall["where"])
+        if offender is None:
+            if len(self._offenders) >= self.max_offenders:
+                # Make room by dropping the least costly offender
+                cheapest = min(self._offenders, key=lambda k: self._offenders[k]["total_ms"])
+                del self._offenders[cheapest]
+            offender = self._offenders[stall["where"]] = {
+                "where": stall["where"], "count": 0, "total_ms": 0.0, "max_ms": 0.0, "stack": stall["stack"],
+            }
+        lag_ms = lag * 1000
+        offender["count"] += 1
+        offender["total_ms"] += lag_ms
+        if lag_ms >= offender["max_ms"]:
+            offender["max_ms"] = lag_ms
+            offender["stack"] = stall["stack"]
+        print(f"🐢 Event loop blocked {lag_ms:.0f}ms at {stall['where']}")
+
+    # ------------------------------------------------------------------
+    # WATCHDOG THREAD
+    # ------------------------------------------------------------------
+
+    def _watch(self):
+        period = max(self.threshold / 2, 0.01)
+        while not self._stopping.wait(period):
+            overdue = time.perf_counter() - self._beat - self.interval
+            if overdue >= self.threshold and self._stall is None:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._stall = self._capture(frame)
+
+    def _capture(self, frame) -> Dict[str, Any]:
+        frames = traceback.extract_stack(frame)[-self.stack_depth:]
+        stack = [
+            f"{os.path.relpath(f.filename, PROJECT_ROOT) if _is_project_frame(f.filename) else f.filename}"
+            f":{f.lineno} in {f.name}"
+            for f in frames
+        ]
+        where = next(
+            (line for f, line in zip(reversed(frames), reversed(stack)) if _is_project_frame(f.filename)),
+            stack[-1] if stack else "unknown"
+        )
+        return {"where": where, "stack": stack}
+
+    # ------------------------------------------------------------------
+    # REPORTING
+    # ------------------------------------------------------------------
+
+    def snapshot(self, top: int = 10) -> Dict[str, Any]:
+        lags = sorted(self._lags)
+
+        def pct(p: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(len(lags) - 1, int(p / 100 * len(lags)))] * 1000, 2)
+
+        offenders: List[Dict[str, Any]] = sorted(
+            self._offenders.values(), key=lambda o: o["total_ms"], reverse=True
+        )[:top]
+        return {
+            "samples": len(lags),
+            "lag_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99), "max": pct(100)},
+            "threshold_ms": self.threshold * 1000,
+            "stalls": self.stalls,
+            "top_offenders": [
+                {**o, "total_ms": round(o["total_ms"], 1), "max_ms": round(o["max_ms"], 1)}
+                for o in offenders
+            ],
+        }
@@ -0,0 +1,289 @@
+"""
+Answer matching for riddle verification.
+
+A matcher is built ONCE per riddle (when buffer_worker enqueues it) and is
+stored next to the answer, so verify_answer only has to normalize the guess
+and run a cheap set lookup + bounded edit-distance check.
+
+Accepts:
+- Case/accents/punctuation variations ("washington dc", "Sao Paulo")
+- Parenthesised or slash-separated names ("Allahabad (Prayagraj)")
+- Known aliases / historical names ("Bombay", "Calcutta", "Peking")
+- Small typos, bounded by name length ("Mumbia", "Hyderbad")
+
+...but never another city: polyglot_ai registers every pool city with
+set_catalog(), a guess naming another city (or its alias) is rejected before
+the typo check, and each name's typo budget stays below its edit distance
+to the nearest other city ("Jaipur" is not a typo of "Raipur").
+"""
+
+import re
+import unicodedata
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+# Bump when the serialized layout changes (old payloads are rebuilt on read)
+MATCHER_VERSION = 1
+
+# ------------------------------------------------------------------
+# ALIASES (canonical name -> accepted alternatives)
+# ------------------------------------------------------------------
+# Keys must match the names used in polyglot_ai.CITY_POOLS.
+
+CITY_ALIASES: Dict[str, List[str]] = {
+    # India
+    "Mumbai": ["Bombay"],
+    "Chennai": ["Madras"],
+    "Kolkata": ["Calcutta"],
+    "Bangalore": ["Bengaluru"],
+    "Delhi": ["New Delhi"],
+    "Pune": ["Poona"],
+    "Vadodara": ["Baroda"],
+    "Varanasi": ["Banaras", "Benares", "Kashi"],
+    "Visakhapatnam": ["Vizag"],
+    "Aurangabad": ["Chhatrapati Sambhajinagar"],
+    "Guwahati": ["Gauhati"],
+    "Mysore": ["Mysuru"],
+    "Mangalore": ["Mangaluru"],
+    "Belgaum": ["Belagavi"],
+    "Kochi": ["Cochin"],
+    "Kozhikode": ["Calicut"],
+    "Thiruvananthapuram": ["Trivandrum"],
+    "Tiruchirappalli": ["Trichy", "Tiruchi"],
+    "Hubli-Dharwad": ["Hubli", "Dharwad", "Hubballi"],
+    "Jalandhar": ["Jullundur"],
+
+    # Global
+    "New York": ["New York City", "NYC"],
+    "Los Angeles": ["LA"],
+    "Washington D.C.": ["Washington", "Washington DC"],
+    "Mexico City": ["Ciudad de Mexico", "CDMX"],
+    "Sao Paulo": ["São Paulo"],
+    "Beijing": ["Peking"],
+    "St. Petersburg": ["Saint Petersburg", "Leningrad"],
+    "Munich": ["Munchen", "München"],
+    "Vienna": ["Wien"],
+    "Prague": ["Praha"],
+    "Lisbon": ["Lisboa"],
+    "Rome": ["Roma"],
+    "Brussels": ["Bruxelles", "Brussel"],
+    "Moscow": ["Moskva"],
+    "Istanbul": ["Constantinople"],
+    "Ulaanbaatar": ["Ulan Bator"],
+    "Almaty": ["Alma-Ata"],
+    "Kuwait City": ["Kuwait"],
+    "Asuncion": ["Asunción"],
+    "Reykjavik": ["Reykjavík"],
+}
+
+# ------------------------------------------------------------------
+# NORMALIZATION
+# ------------------------------------------------------------------
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_ALT_SPLIT = re.compile(r"[()/]")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Reduce a city name to its comparison key.
+    Lowercase, strip accents, drop punctuation AND spaces ("D.C." == "dc",
+    "newyork" == "new york"), and drop a leading "the".
+    """
+    if not name:
+        return ""
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower().strip()
+    if text.startswith("the "):
+        text = text[4:]
+    return _NON_ALNUM.sub("", text)
+
+
+def _split_alternatives(name: str) -> List[str]:
+    """'Allahabad (Prayagraj)' -> ['Allahabad', 'Prayagraj']"""
+    return [part.strip() for part in _ALT_SPLIT.split(name) if part.strip()]
+
+
+def _length_budget(key: str) -> int:
+    """
+    Typo budget by name length alone.
+    Short names must match exactly, otherwise "rome" would accept "roma"
+    style collisions with unrelated cities.
+    """
+    if len(key) <= 4:
+        return 0
+    if len(key) <= 8:
+        return 1
+    return 2
+
+
+def max_edits_for(key: str) -> int:
+    """Typo budget for a normalized name: by length, capped by the catalog."""
+    budget = _length_budget(key)
+    return min(budget, _BUDGETS.get(key, budget))
+
+# ------------------------------------------------------------------
+# BOUNDED EDIT DISTANCE
+# ------------------------------------------------------------------
+
+def within_edit_distance(a: str, b: str, k: int) -> bool:
+    """
+    True if the edit distance between a and b is <= k.
+    Adjacent transpositions count as one edit ("mumbia" -> "mumbai").
+    Runs the Levenshtein automaton as a diagonal band of width 2k+1 and
+    bails out as soon as every live state exceeds k, so a miss usually
+    costs a couple of rows instead of the full len(a) * len(b) table.
+    """
+    if k == 0:
+        return a == b
+    len_a, len_b = len(a), len(b)
+    if abs(len_a - len_b) > k:
+        return False
+
+    too_far = k + 1
+    prev_prev: List[int] = []
+    prev = [j if j <= k else too_far for j in range(len_b + 1)]
+
+    for i in range(1, len_a + 1):
+        ca = a[i - 1]
+        lo = max(1, i - k)
+        hi = min(len_b, i + k)
+        cur = [too_far] * (len_b + 1)
+        cur[0] = i if i <= k else too_far
+        row_min = cur[0]
+
+        for j in range(lo, hi + 1):
+            cost = 0 if ca == b[j - 1] else 1
+            best = prev[j - 1] + cost
+            if prev[j] + 1 < best:
+                best = prev[j] + 1
+            if cur[j - 1] + 1 < best:
+                best = cur[j - 1] + 1
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == b[j - 1]:
+                if prev_prev[j - 2] + 1 < best:
+                    best = prev_prev[j - 2] + 1
+            cur[j] = best if best < too_far else too_far
+            if best < row_min:
+                row_min = best
+
+        if row_min > k:
+            return False
+        prev_prev, prev = prev, cur
+
+    return prev[len_b] <= k
+
+# ------------------------------------------------------------------
+# CATALOG (nearest-neighbour typo budgets)
+# ------------------------------------------------------------------
+
+_CATALOG: Dict[str, str] = {}  # Normalized name or alias -> canonical city
+_BUDGETS: Dict[str, int] = {}  # Normalized name or alias -> capped typo budget
+
+
+def _deletions(key: str, depth: int) -> Set[str]:
+    """`key` with up to `depth` characters deleted (itself included)."""
+    variants = {key}
+    frontier = {key}
+    for _ in range(depth):
+        frontier = {v[:i] + v[i + 1:] for v in frontier for i in range(len(v))}
+        variants |= frontier
+    return variants
+
+
+def set_catalog(names: Iterable[str]):
+    """
+    Register every city a riddle can be about (replaces the previous catalog).
+    Cities closer than their typo budget get the budget cut to one below
+    their distance. Near neighbours are found through shared deletion
+    variants (two names within k edits share a variant with up to k
+    deletions each), so this stays linear in the pool size.
+    """
+    catalog: Dict[str, str] = {}
+    for name in names:
+        for key in build_matcher(name).keys:
+            catalog.setdefault(key, name)
+
+    max_budget = _length_budget("x" * 9)
+    index: Dict[str, Set[str]] = {}
+    for key in catalog:
+        for variant in _deletions(key, max_budget):
+            index.setdefault(variant, set()).add(key)
+
+    budgets = {}
+    for key, city in catalog.items():
+        budget = _length_budget(key)
+        for variant in _deletions(key, budget) if budget else ():
+            for other in index[variant]:
+                if catalog[other] == city:
+                    continue
+                while budget and within_edit_distance(key, other, budget):
+                    budget -= 1
+        budgets[key] = budget
+
+    _CATALOG.clear()
+    _CATALOG.update(catalog)
+    _BUDGETS.clear()
+    _BUDGETS.update(budgets)
+
+# ------------------------------------------------------------------
+# MATCHER
+# ------------------------------------------------------------------
+
+class AnswerMatcher:
+    """
+    Precompiled matcher for one riddle answer.
+    `keys` holds the normalized canonical name followed by its aliases.
+    """
+
+    __slots__ = ("canonical", "keys", "_key_set")
+
+    def __init__(self, canonical: str, keys: List[str]):
+        self.canonical = canonical
+        self.keys = keys
+        self._key_set = frozenset(keys)
+
+    def matches(self, guess: str) -> bool:
+        """
+        Exact key lookup first, then the bounded typo check per key.
+        A guess like "Mumbai (Bombay)" is accepted if any of its parts match.
+        """
+        guess_keys = [normalize_name(guess)] + [normalize_name(p) for p in _split_alternatives(guess)]
+        guess_keys = [k for k in guess_keys if k]
+        if not guess_keys:
+            return False
+        for key in guess_keys:
+            if key in self._key_set:
+                return True
+        # Another city's exact name or alias is never a typo of this one
+        for key in [k for k in guess_keys if k not in _CATALOG]:
+            for candidate in self.keys:
+                if within_edit_distance(key, candidate, max_edits_for(candidate)):
+                    return True
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"v": MATCHER_VERSION, "canonical": self.canonical, "keys": self.keys}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], fallback_answer: str = "") -> "AnswerMatcher":
+        """Rehydrate a stored matcher; rebuilds from the answer if missing or outdated."""
+        if not data or data.get("v") != MATCHER_VERSION:
+            return build_matcher(fallback_answer)
+        return cls(data.get("canonical", fallback_answer), list(data.get("keys", [])))
+
+
+def build_matcher(answer: str) -> AnswerMatcher:
+    """
+    Compile the matcher for a canonical answer.
+    Called once per riddle when it is enqueued.
+    """
+    names = [answer] + _split_alternatives(answer) + CITY_ALIASES.get(answer, [])
+    for part in _split_alternatives(answer):
+        names.extend(CITY_ALIASES.get(part, []))
+
+    keys: List[str] = []
+    for name in names:
+        key = normalize_name(name)
+        if key and key not in keys:
+            keys.append(key)
+
+    return AnswerMatcher(answer, keys)
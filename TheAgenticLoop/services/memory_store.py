@@ -0,0 +1,462 @@
+"""
+In-process SessionStore for single-node and dev deployments.
+
+Plain Python structures instead of a Redis emulator:
+    sessions   dict of _Session records (the hash fields as attributes)
+    queue      collections.deque per session
+    seen       [cursor, int bitmask] per session, or per (player, difficulty)
+               for sessions with a user_id (kept for the process lifetime)
+    logs       deque(maxlen=N) of (entry id, line) per session
+    listeners  asyncio.Queue per listen_logs() caller (the "pub/sub")
+    inventory  deque(maxlen=INVENTORY_MAX) of reclaimed riddles per difficulty
+
+Every operation is a handful of attribute reads/writes with no awaits in
+between, so each one is atomic on the event loop, just like the Lua scripts.
+
+TTL: sessions expire SESSION_TTL seconds after their last touch. A hashed
+timer wheel (one slot per tick) finds expired sessions in O(expiring) per tick
+instead of scanning every session; lookups also check the deadline, so an
+expired session is never served between ticks.
+
+Only player activity (the same calls that touch() in the Lua scripts) moves
+the deadline; generation writes don't. A second wheel, SESSION_IDLE_SEC deep,
+feeds reclaim_idle().
+
+Not shared across processes: run a single worker, or use Redis.
+checkpoint() / restore() carry the whole store across a graceful restart
+(services/snapshot.py).
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from services import riddle_codec
+from services.matcher import MATCHER_VERSION
+from services.redis_scripts import INVENTORY_MAX, PENDING_STALE_SEC, SESSION_IDLE_SEC, SESSION_TTL
+from services.session_store import SessionStore, parse_entry_id
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel. schedule() is O(1) and re-scheduling a key only
+    updates its deadline: the key stays in its old slot and is moved forward
+    lazily when that slot comes up, so each key sits in at most one slot.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 4096, now: Optional[float] = None):
+        self.tick = tick
+        self._slots: List[Set[Hashable]] = [set() for _ in range(slots)]
+        self._deadlines: Dict[Hashable, float] = {}
+        # Next tick number to process (ticks before it are done)
+        self._next_tick = int((time.monotonic() if now is None else now) // tick)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def _slot(self, deadline: float) -> Set[Hashable]:
+        return self._slots[int(deadline // self.tick) % len(self._slots)]
+
+    def schedule(self, key: Hashable, deadline: float):
+        if key not in self._deadlines:
+            self._slot(deadline).add(key)
+        self._deadlines[key] = deadline
+
+    def cancel(self, key: Hashable):
+        # Left in its slot; dropped when the slot comes up
+        self._deadlines.pop(key, None)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        return self._deadlines.get(key)
+
+    def is_expired(self, key: Hashable, now: float) -> bool:
+        deadline = self._deadlines.get(key)
+        return deadline is not None and deadline <= now
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Process every fully elapsed tick; returns the keys that expired."""
+        expired = []
+        last_complete = int(now // self.tick) - 1
+        while self._next_tick <= last_complete:
+            index = self._next_tick % len(self._slots)
+            slot, self._slots[index] = self._slots[index], set()
+            for key in slot:
+                deadline = self._deadlines.get(key)
+                if deadline is None:
+                    continue  # Cancelled
+                if deadline <= now:
+                    del self._deadlines[key]
+                    expired.append(key)
+                else:
+                    self._slot(deadline).add(key)  # Refreshed, or due on a later lap
+            self._next_tick += 1
+        return expired
+
+
+class _Session:
+    __slots__ = (
+        "difficulty", "answer", "lat", "lng", "keys", "attempts",
+        "user_id", "seen", "pending", "pending_at", "queue", "log", "last_log_id", "idle",
+    )
+
+    def __init__(self, log_maxlen: int):
+        self.difficulty: Optional[str] = None
+        self.answer: Optional[str] = None
+        self.lat = None
+        self.lng = None
+        self.keys: List[str] = []
+        self.attempts = 0
+        self.user_id: Optional[str] = None
+        self.seen: List[int] = [0, 0]  # Draw cursor, bitmask of seen city IDs
+        self.pending = 0
+        self.pending_at = 0
+        self.queue: Deque[str] = deque()
+        self.log: Deque[Tuple[str, str]] = deque(maxlen=log_maxlen)
+        self.last_log_id = (0, 0)
+        self.idle = False
+
+
+class MemorySessionStore(SessionStore):
+    """Single-process SessionStore. start() in lifespan startup, close() in shutdown."""
+
+    def __init__(
+        self,
+        ttl: int = SESSION_TTL,
+        log_maxlen: int = 200,
+        tick: float = 1.0,
+        idle_sec: int = SESSION_IDLE_SEC
+    ):
+        self.ttl = ttl
+        self.log_maxlen = log_maxlen
+        self.tick = tick
+        self.idle_sec = idle_sec
+        self._sessions: Dict[str, _Session] = {}
+        self._wheel = TimerWheel(tick=tick)
+        self._idle_wheel = TimerWheel(tick=tick)
+        self._inventory: Dict[str, Deque[str]] = {}
+        self._listeners: Set[asyncio.Queue] = set()
+        self._player_seen: Dict[Tuple[str, str], List[int]] = {}
+        self._evictor: Optional[asyncio.Task] = None
+
+    @property
+    def session_count(self) -> int:
+        return len(self._sessions)
+
+    async def start(self):
+        if self._evictor is None:
+            self._evictor = asyncio.create_task(self._evict_loop())
+
+    async def close(self):
+        if self._evictor:
+            self._evictor.cancel()
+            try:
+                await self._evictor
+            except asyncio.CancelledError:
+                pass
+            self._evictor = None
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            for session_id in self._wheel.advance(time.monotonic()):
+                self._sessions.pop(session_id, None)
+                self._idle_wheel.cancel(session_id)
+
+    # --------------------------------------------------------------
+    # RECORD ACCESS
+    # --------------------------------------------------------------
+
+    def _get(self, session_id: str) -> Optional[_Session]:
+        """Live record or None. Expired-but-not-yet-evicted records count as gone."""
+        session = self._sessions.get(session_id)
+        if session is not None and self._wheel.is_expired(session_id, time.monotonic()):
+            self._wheel.cancel(session_id)
+            self._idle_wheel.cancel(session_id)
+            del self._sessions[session_id]
+            return None
+        return session
+
+    def _get_or_create(self, session_id: str) -> _Session:
+        session = self._get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session(self.log_maxlen)
+        return session
+
+    def _touch(self, session_id: str):
+        """Player activity: new expiry, new idle deadline, not idle any more."""
+        now = time.monotonic()
+        self._wheel.schedule(session_id, now + self.ttl)
+        self._idle_wheel.schedule(session_id, now + self.idle_sec)
+        self._sessions[session_id].idle = False
+
+    @staticmethod
+    def _arm(session: _Session, raw: str):
+        riddle = riddle_codec.decode(raw)
+        session.answer = riddle.answer
+        session.lat = riddle.lat
+        session.lng = riddle.lng
+        session.keys = riddle.keys
+        session.attempts = 0
+
+    @staticmethod
+    def _claim_refill(session: _Session, depth: int, target: int) -> int:
+        now = int(time.time())
+        pending = session.pending
+        if pending < 0 or now - session.pending_at > PENDING_STALE_SEC:
+            pending = 0
+        refill = target - depth - pending
+        if refill <= 0:
+            return 0
+        session.pending = pending + refill
+        session.pending_at = now
+        return refill
+
+    # --------------------------------------------------------------
+    # SESSIONS
+    # --------------------------------------------------------------
+
+    async def create_session(
+        self,
+        session_id: str,
+        difficulty: str,
+        seen_ids: List[int] = None,
+        pending: int = 0,
+        user_id: Optional[str] = None
+    ):
+        session = self._get_or_create(session_id)
+        session.difficulty = difficulty
+        session.attempts = 0
+        session.user_id = user_id
+        session.pending = pending
+        session.pending_at = int(time.time())
+        self._touch(session_id)
+        seen = self._seen(session_id, difficulty, user_id)
+        for city_id in seen_ids or []:
+            seen[1] |= 1 << city_id
+
+    async def get_session(self, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        session = self._get(session_id)
+        if session is None:
+            return None, None
+        return session.difficulty, session.user_id
+
+    # --------------------------------------------------------------
+    # CITY EXCLUSION
+    # --------------------------------------------------------------
+
+    def _seen(self, session_id: str, difficulty: str, user_id: Optional[str] = None) -> Optional[List[int]]:
+        """None for an expired session: drawing for it isn't activity, so it isn't revived."""
+        if user_id:
+            return self._player_seen.setdefault((user_id, difficulty), [0, 0])
+        session = self._get(session_id)
+        return session.seen if session is not None else None
+
+    async def draw_city(self, session_id: str, difficulty: str, deck: List[int], user_id: Optional[str] = None) -> Optional[int]:
+        """Same walk as DRAW_CITY_LUA: next unseen ID on the deck, new lap when all are seen."""
+        seen = self._seen(session_id, difficulty, user_id)
+        if not deck or seen is None:
+            return None
+        for _ in range(2):
+            for _ in range(len(deck)):
+                seen[0] += 1
+                city_id = deck[seen[0] % len(deck)]
+                if not seen[1] >> city_id & 1:
+                    seen[1] |= 1 << city_id
+                    return city_id
+            seen[1] = 0
+        return None
+
+    async def mark_city_seen(self, session_id: str, difficulty: str, city_id: int, user_id: Optional[str] = None) -> bool:
+        seen = self._seen(session_id, difficulty, user_id)
+        if seen is None:
+            return False
+        was_seen = seen[1] >> city_id & 1
+        seen[1] |= 1 << city_id
+        return not was_seen
+
+    # --------------------------------------------------------------
+    # RIDDLE QUEUE
+    # --------------------------------------------------------------
+
+    async def push_riddle(self, session_id: str, payload: str, difficulty: Optional[str] = None) -> bool:
+        session = self._get(session_id)
+        if session is None or session.idle:
+            difficulty = session.difficulty if session is not None else difficulty
+            if difficulty:
+                await self.return_inventory(difficulty, payload)
+            return False
+        session.queue.append(payload)
+        session.pending -= 1
+        session.pending_at = int(time.time())
+        return True
+
+    async def release_generation(self, session_id: str):
+        session = self._get(session_id)
+        if session is not None:
+            session.pending -= 1
+
+    async def pop_question(self, session_id: str, target: int = 0) -> Tuple[Optional[str], Optional[str], int, int]:
+        session = self._get(session_id)
+        if session is None:
+            return None, None, 0, 0  # Unknown / expired: never create one here
+        raw = session.queue.popleft() if session.queue else None
+        if raw:
+            self._arm(session, raw)
+        depth = len(session.queue)
+        refill = self._claim_refill(session, depth, target)
+        self._touch(session_id)
+        return raw, session.difficulty, depth, refill
+
+    async def arm_question(self, session_id: str, raw: str, target: int = 0) -> Tuple[Optional[str], int, int]:
+        session = self._get(session_id)
+        if session is None:
+            return None, 0, 0
+        self._arm(session, raw)
+        depth = len(session.queue)
+        refill = self._claim_refill(session, depth, target)
+        self._touch(session_id)
+        return session.difficulty, depth, refill
+
+    async def check_answer(self, session_id: str) -> Tuple[Optional[Dict[str, Any]], int, Optional[str]]:
+        session = self._get(session_id)
+        if session is None:
+            return None, 0, None
+        if not session.answer:
+            return None, 0, session.difficulty
+
+        session.attempts += 1
+        self._touch(session_id)
+        answer_data = {
+            "answer": session.answer,
+            "location": {
+                "name": session.answer,
+                "lat": float(session.lat) if session.lat not in (None, "") else None,
+                "lng": float(session.lng) if session.lng not in (None, "") else None,
+            },
+            "matcher": {"v": MATCHER_VERSION, "canonical": session.answer, "keys": list(session.keys)} if session.keys else None,
+        }
+        return answer_data, session.attempts, session.difficulty
+
+    # --------------------------------------------------------------
+    # AGENT LOGS
+    # --------------------------------------------------------------
+
+    async def append_log(self, session_id: str, line: str) -> Optional[str]:
+        session = self._get(session_id)
+        if session is None:
+            return None
+        # Same "<ms>-<seq>" ids as XADD: monotonic even if the clock stalls
+        ms = int(time.time() * 1000)
+        last_ms, last_seq = session.last_log_id
+        session.last_log_id = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+        entry_id = "%d-%d" % session.last_log_id
+        session.log.append((entry_id, line))
+
+        message = f"{entry_id} {line}"
+        for listener in self._listeners:
+            listener.put_nowait((session_id, message))
+        return entry_id
+
+    async def read_log(self, session_id: str, after_id: Optional[str] = None) -> List[Tuple[str, str]]:
+        session = self._get(session_id)
+        if session is None:
+            return []
+        if not after_id:
+            return list(session.log)
+        after = parse_entry_id(after_id)
+        return [entry for entry in session.log if parse_entry_id(entry[0]) > after]
+
+    async def listen_logs(self) -> AsyncIterator[Tuple[str, str]]:
+        # Unbounded: the log hub drains it immediately and applies the
+        # per-client bounds itself
+        listener: asyncio.Queue = asyncio.Queue()
+        self._listeners.add(listener)
+        try:
+            while True:
+                yield await listener.get()
+        finally:
+            self._listeners.discard(listener)
+
+    # --------------------------------------------------------------
+    # IDLE SESSIONS + INVENTORY
+    # --------------------------------------------------------------
+
+    async def active(self, session_ids: List[str]) -> List[bool]:
+        sessions = [self._get(session_id) for session_id in session_ids]
+        return [session is not None and not session.idle for session in sessions]
+
+    async def reclaim_idle(self, limit: int = 500) -> List[Tuple[str, int]]:
+        # The wheel has no batch limit; one tick's worth of sessions is small
+        reclaimed = []
+        for session_id in self._idle_wheel.advance(time.monotonic()):
+            session = self._get(session_id)
+            if session is None:
+                continue
+            moved = len(session.queue)
+            if session.difficulty:
+                inventory = self._inventory.setdefault(session.difficulty, deque(maxlen=INVENTORY_MAX))
+                inventory.extend(session.queue)
+            session.queue.clear()
+            session.idle = True
+            session.pending = 0
+            reclaimed.append((session_id, moved))
+        return reclaimed
+
+    async def take_inventory(self, difficulty: str) -> Optional[str]:
+        inventory = self._inventory.get(difficulty)
+        return inventory.popleft() if inventory else None
+
+    async def return_inventory(self, difficulty: str, payload: str):
+        self._inventory.setdefault(difficulty, deque(maxlen=INVENTORY_MAX)).append(payload)
+
+    # --------------------------------------------------------------
+    # WARM RESTART (services/snapshot.py)
+    # --------------------------------------------------------------
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """Everything, JSON-ready. Expiry / idle deadlines as wall-clock times."""
+        now, wall = time.monotonic(), time.time()
+        sessions = {}
+        for session_id, session in self._sessions.items():
+            expires = self._wheel.deadline(session_id)
+            if expires is None or expires <= now:
+                continue
+            idle_at = self._idle_wheel.deadline(session_id)
+            sessions[session_id] = {
+                "expires_at": wall + expires - now,
+                "idle_at": wall + idle_at - now if idle_at is not None else None,
+                "fields": {name: getattr(session, name) for name in _Session.__slots__
+                           if name not in ("queue", "log", "last_log_id")},
+                "queue": list(session.queue),
+                "log": list(session.log),
+                "last_log_id": list(session.last_log_id),
+            }
+        return {
+            "sessions": sessions,
+            "player_seen": [[user_id, difficulty, seen] for (user_id, difficulty), seen in self._player_seen.items()],
+            "inventory": {difficulty: list(riddles) for difficulty, riddles in self._inventory.items()},
+        }
+
+    def restore(self, state: Dict[str, Any]) -> int:
+        """Load a checkpoint() (before start()). Returns the sessions restored."""
+        now, wall = time.monotonic(), time.time()
+        restored = 0
+        for session_id, record in state.get("sessions", {}).items():
+            if record["expires_at"] <= wall:
+                continue
+            session = self._sessions[session_id] = _Session(self.log_maxlen)
+            for name, value in record["fields"].items():
+                setattr(session, name, value)
+            session.queue.extend(record["queue"])
+            session.log.extend(tuple(entry) for entry in record["log"])
+            session.last_log_id = tuple(record["last_log_id"])
+            self._wheel.schedule(session_id, now + record["expires_at"] - wall)
+            if record["idle_at"] is not None:
+                self._idle_wheel.schedule(session_id, now + max(0.0, record["idle_at"] - wall))
+            restored += 1
+        for user_id, difficulty, seen in state.get("player_seen", []):
+            self._player_seen[(user_id, difficulty)] = seen
+        for difficulty, riddles in state.get("inventory", {}).items():
+            self._inventory.setdefault(difficulty, deque(maxlen=INVENTORY_MAX)).extend(riddles)
+        return restored
@@ -0,0 +1,262 @@
+"""
+In-process metrics in the Prometheus text format (GET /metrics).
+
+Deliberately tiny instead of pulling in prometheus_client: one event loop
+per process and no multiprocess mode needed, so a metric is a dict of
+label tuple -> value and recording is a dict lookup + bisect. Everything
+is defined here so names stay consistent across the API, the generation
+pipeline and worker.py (each process exposes its own registry; workers via
+--metrics-port).
+
+    PROVIDER_LATENCY    atlast_provider_latency_seconds{provider,stage,outcome}
+    PROVIDER_ERRORS     atlast_provider_errors_total{provider,kind}  429 / quota
+    GENERATION_LATENCY  atlast_generation_seconds{source}  whole pipeline per riddle
+    RIDDLE_SOURCE       atlast_riddles_total{source}  groq/gemini/db_cache/template/hardcoded/inventory
+    QUESTION_CACHE      atlast_question_cache_total{result}  hit/miss on pop
+    QUEUE_DEPTH         atlast_queue_depth  session buffer depth after each pop
+    HTTP_LATENCY        atlast_http_request_duration_seconds{method,endpoint,status}
+    LOOP_LAG            atlast_event_loop_lag_seconds  (services/loop_monitor.py)
+    LOOP_STALLS         atlast_event_loop_stalls_total  lag over the stall threshold
+    ADMISSIONS          atlast_admissions_total{result}  start_session shed / admitted per level
+    PRECRITIC           atlast_precritic_total{result}  local pre-critic pass / trimmed / failed check
+    SESSION_LIFECYCLE   atlast_session_lifecycle_total{event}  idle / reclaimed / served / diverted /
+                        skipped / cancelled (services/lifecycle.py)
+    QUOTA_PACING        atlast_quota_pacing_total{priority,result}  paced jobs allowed on the LLM /
+                        deferred to stored riddles (services/quota.py)
+"""
+
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PROVIDER_BUCKETS = (0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5, 8, 12, 20)
+DEPTH_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]; cumulated at render time
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def totals(self) -> Iterable[Tuple[Labels, float, float]]:
+        """(labels, observation count, sum) per series."""
+        for labels, series in self._values.items():
+            yield labels, sum(series[:-1]), series[-1]
+
+    def samples(self) -> Iterable[str]:
+        for labels, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                le_label = f'le="{le}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le_label)} {cumulative}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-1])}"
+
+
+class GaugeCallback:
+    """Gauge read at scrape time: fn() returns [(label values, value), ...]."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], fn: Callable[[], Iterable[Tuple[Labels, float]]]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def samples(self) -> Iterable[str]:
+        try:
+            values = list(self.fn())
+        except Exception as e:
+            print(f"⚠️ Metric {self.name} failed: {e}")
+            return
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def add(self, metric):
+        self._metrics[metric.name] = metric  # Re-registering (e.g. app reload) replaces
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.add(Histogram(name, help, labelnames, buckets))
+
+    def gauge_callback(self, name: str, help: str, labelnames: Sequence[str], fn) -> GaugeCallback:
+        return self.add(GaugeCallback(name, help, labelnames, fn))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+PROVIDER_LATENCY = REGISTRY.histogram(
+    "atlast_provider_latency_seconds", "LLM provider call latency by pipeline stage",
+    ("provider", "stage", "outcome"), PROVIDER_BUCKETS
+)
+PROVIDER_ERRORS = REGISTRY.counter(
+    "atlast_provider_errors_total", "Rate-limit (429) and quota-exhausted responses per attempt",
+    ("provider", "kind")
+)
+GENERATION_LATENCY = REGISTRY.histogram(
+    "atlast_generation_seconds", "End-to-end riddle generation time by riddle source",
+    ("source",), PROVIDER_BUCKETS
+)
+RIDDLE_SOURCE = REGISTRY.counter(
+    "atlast_riddles_total", "Riddles produced per source (LLM provider or fallback tier)", ("source",)
+)
+QUESTION_CACHE = REGISTRY.counter(
+    "atlast_question_cache_total", "get_question pops that found a buffered riddle (hit) or not (miss)",
+    ("result",)
+)
+QUEUE_DEPTH = REGISTRY.histogram(
+    "atlast_queue_depth", "Session buffer depth left after each pop", (), DEPTH_BUCKETS
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "atlast_http_request_duration_seconds", "Server-side request latency per endpoint",
+    ("method", "endpoint", "status")
+)
+LOOP_LAG = REGISTRY.histogram(
+    "atlast_event_loop_lag_seconds", "How late the event loop runs a timer scheduled for now", (), LAG_BUCKETS
+)
+LOOP_STALLS = REGISTRY.counter(
+    "atlast_event_loop_stalls_total", "Loop lag samples over the blocking threshold"
+)
+PRECRITIC = REGISTRY.counter(
+    "atlast_precritic_total", "Drafts through the local pre-critic: pass, trimmed, or the check that failed",
+    ("result",)
+)
+ADMISSIONS = REGISTRY.counter(
+    "atlast_admissions_total", "start_session outcomes: shed, or admitted at a degradation level", ("result",)
+)
+SESSION_LIFECYCLE = REGISTRY.counter(
+    "atlast_session_lifecycle_total",
+    "Idle sessions and their riddles: idle, reclaimed / served / diverted riddles, skipped / cancelled generations",
+    ("event",)
+)
+QUOTA_PACING = REGISTRY.counter(
+    "atlast_quota_pacing_total",
+    "Top-up / speculative jobs allowed on the LLM or deferred to stored riddles by the daily quota planner",
+    ("priority", "result")
+)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request (no BaseHTTPMiddleware
+    overhead). Labelled by endpoint function name, which the router writes
+    into the scope, so session ids never become label values.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], endpoint, str(status_code))
+
+
+async def start_metrics_server(port: int, host: str = "0.0.0.0") -> Optional[asyncio.AbstractServer]:
+    """Bare /metrics HTTP listener for processes without a web app (worker.py)."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = REGISTRY.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: " + CONTENT_TYPE.encode()
+                + b"\r\nContent-Length: " + str(len(body)).encode()
+                + b"\r\nConnection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"📈 Metrics on http://{host}:{port}/metrics")
+    return server
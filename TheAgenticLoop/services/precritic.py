@@ -0,0 +1,238 @@
+"""
+Local pre-critic: the mechanical half of the critic checklist, run before
+the remote critique (Cohere, ~20 RPM) spends a call on a draft.
+
+    trim     model preamble ("Here's a riddle:"), a "Riddle:" label, wrapping
+             quotes, an "Answer: ..." tail, and sentences past MAX_SENTENCES
+             are cut off. A trimmed draft still passes.
+    reject   name_leak      the city, an alias (services.matcher.CITY_ALIASES)
+                            or a distinctive token of a multi-word name
+                            ("York", "Aires"), also with a suffix ("Parisian")
+             country_leak   the country or its common names (GLOBAL_* only:
+                            every INDIA_* answer is in India anyway)
+             banned_phrase  giveaways like "the answer is", "my name is"
+             too_short / too_long   outside RiddleOutput's 50-500 chars
+
+A rejected draft is redrafted with the reason as feedback (polyglot_ai);
+semantic checks (facts, uniqueness) stay with the remote critic. Matching
+runs on a case/accent-folded copy of the text with the same length, so a
+leak found there can be redacted in the original (redact()).
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, NamedTuple, Pattern, Tuple
+
+from services.matcher import CITY_ALIASES
+
+MIN_CHARS = 50  # Same bounds as polyglot_ai.RiddleOutput
+MAX_CHARS = 500
+MAX_SENTENCES = 4
+
+# Endings that turn a name into a demonym / plural ("Parisian", "Londoners",
+# "Japanese"). A closed list, so "Agra" doesn't flag "agrarian"
+_SUFFIX = r"(?:s|n|an|ans|ian|ians|er|ers|ese|ite|ites|i|ish)?"
+# Tokens of multi-word names that give nothing away on their own
+_GENERIC_TOKENS = {"city", "new", "san", "saint", "los", "las", "cape", "town", "north", "south", "united"}
+_MIN_PARTIAL_TOKEN = 4
+
+BANNED_PHRASES = [
+    "the answer is", "answer:", "solution:", "my name is", "i am called", "i am named",
+    "is called", "spelled",
+]
+
+# Global pool cities -> country and its common short names
+CITY_COUNTRIES = {
+    # Americas
+    "New York": "United States", "Los Angeles": "United States", "Chicago": "United States",
+    "San Francisco": "United States", "Miami": "United States", "Las Vegas": "United States",
+    "Washington D.C.": "United States", "Toronto": "Canada", "Vancouver": "Canada", "Montreal": "Canada",
+    "Mexico City": "Mexico", "Rio de Janeiro": "Brazil", "Sao Paulo": "Brazil", "Buenos Aires": "Argentina",
+    "La Paz": "Bolivia", "Asuncion": "Paraguay",
+    # Europe
+    "London": "United Kingdom", "Manchester": "United Kingdom", "Paris": "France", "Lyon": "France",
+    "Berlin": "Germany", "Munich": "Germany", "Hamburg": "Germany", "Rome": "Italy", "Milan": "Italy",
+    "Madrid": "Spain", "Barcelona": "Spain", "Valencia": "Spain", "Amsterdam": "Netherlands",
+    "Vienna": "Austria", "Moscow": "Russia", "St. Petersburg": "Russia", "Istanbul": "Turkey",
+    "Dublin": "Ireland", "Brussels": "Belgium", "Zurich": "Switzerland", "Lisbon": "Portugal",
+    "Porto": "Portugal", "Athens": "Greece", "Stockholm": "Sweden", "Prague": "Czech Republic",
+    "Reykjavik": "Iceland", "Ljubljana": "Slovenia", "Skopje": "North Macedonia", "Tbilisi": "Georgia",
+    "Baku": "Azerbaijan",
+    # Asia / Pacific / Middle East / Africa
+    "Tokyo": "Japan", "Osaka": "Japan", "Kyoto": "Japan", "Beijing": "China", "Shanghai": "China",
+    "Chengdu": "China", "Hong Kong": "China", "Seoul": "South Korea", "Busan": "South Korea",
+    "Bangkok": "Thailand", "Singapore": "Singapore", "Dubai": "United Arab Emirates",
+    "Sydney": "Australia", "Melbourne": "Australia", "Auckland": "New Zealand", "Cairo": "Egypt",
+    "Jakarta": "Indonesia", "Kuala Lumpur": "Malaysia", "Cape Town": "South Africa",
+    "Ulaanbaatar": "Mongolia", "Bishkek": "Kyrgyzstan", "Tashkent": "Uzbekistan", "Almaty": "Kazakhstan",
+    "Windhoek": "Namibia", "Antananarivo": "Madagascar", "Thimphu": "Bhutan", "Kigali": "Rwanda",
+    "Lusaka": "Zambia", "Hanoi": "Vietnam", "Phnom Penh": "Cambodia", "Vientiane": "Laos",
+    "Muscat": "Oman", "Manama": "Bahrain", "Doha": "Qatar", "Kuwait City": "Kuwait", "Amman": "Jordan",
+}
+
+COUNTRY_ALIASES = {
+    "United States": ["USA", "America", "U.S."],
+    "United Kingdom": ["UK", "Britain", "England"],
+    "Netherlands": ["Holland"],
+    "Czech Republic": ["Czechia"],
+    "North Macedonia": ["Macedonia"],
+    "South Korea": ["Korea"],
+    "United Arab Emirates": ["UAE", "Emirates"],
+    "Turkey": ["Türkiye"],
+    "Vietnam": ["Viet Nam"],
+}
+
+
+class PreCriticResult(NamedTuple):
+    ok: bool
+    riddle: str  # Trimmed text (also when rejected)
+    rule: str  # "pass", "trimmed", or the failed check
+    reason: str  # Feedback for the redraft prompt ("" on pass)
+
+
+# ------------------------------------------------------------------
+# TEXT HELPERS
+# ------------------------------------------------------------------
+
+def _fold(text: str) -> str:
+    """Lowercase, accents stripped, SAME LENGTH as the input (offsets stay valid)."""
+    out = []
+    for ch in text:
+        base = unicodedata.normalize("NFKD", ch)[:1] or ch
+        out.append(base.lower()[:1] or base)
+    return "".join(out)
+
+
+_PREAMBLE = re.compile(r"^\s*(?:sure|okay|ok|here(?:'s| is)|riddle)\b[^\n:]{0,60}:\s*", re.I)
+_ANSWER_TAIL = re.compile(r"\s*[\(\[]?\s*\**\s*(?:answer|solution)\s*\**\s*[:\-].*$", re.I | re.S)
+_QUOTES = "\"'“”‘’*`"
+_ABBREVIATIONS = re.compile(r"\b(?:St|Mt|Dr|Mr|Mrs|Ms|No|vs|e\.g|i\.e|[A-Z](?:\.[A-Z])*)\.")
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]”’]*\s+")
+
+
+def split_sentences(text: str) -> List[str]:
+    # Mask the dots of abbreviations and initials ("St.", "D.C.") so they don't end sentences
+    masked = _ABBREVIATIONS.sub(lambda m: m.group(0).replace(".", "\0"), text)
+    return [s.replace("\0", ".").strip() for s in _SENTENCE_END.split(masked) if s.strip()]
+
+
+def trim(riddle: str) -> str:
+    """Cut the mechanical junk models wrap riddles in; leaves the wording alone."""
+    text = (riddle or "").strip()
+    text = _ANSWER_TAIL.sub("", text)
+    text = _PREAMBLE.sub("", text, count=1)
+    text = " ".join(text.split()).strip(_QUOTES + " ")
+    sentences = split_sentences(text)
+    if len(sentences) > MAX_SENTENCES:
+        text = " ".join(sentences[:MAX_SENTENCES])
+    return text
+
+
+# ------------------------------------------------------------------
+# LEAK PATTERNS (compiled once per city)
+# ------------------------------------------------------------------
+
+def _name_patterns(names: List[str]) -> List[Tuple[str, Pattern, bool]]:
+    """
+    (name, pattern, match on the original text?) for each full name, plus
+    the distinctive tokens of multi-word ones.
+    """
+    patterns = []
+    seen = set()
+    for name in names:
+        letters = name.replace(".", "")
+        if len(letters) <= 3 and letters.isupper():
+            # Short acronyms ("LA", "UK"): exact case only, "la" and "us" are words
+            key = ("acronym", name)
+            if key not in seen:
+                seen.add(key)
+                patterns.append((name, re.compile(rf"\b{re.escape(name)}(?!\w)"), True))
+            continue
+        tokens = re.findall(r"[a-z0-9]+", _fold(name))
+        if not tokens:
+            continue
+        key = ("phrase", tuple(tokens))
+        if key not in seen:
+            seen.add(key)
+            patterns.append((name, re.compile(r"\b" + r"[^a-z0-9]*".join(tokens) + _SUFFIX + r"\b"), False))
+        if len(tokens) > 1:
+            for token in tokens:
+                key = ("token", token)
+                if len(token) >= _MIN_PARTIAL_TOKEN and token not in _GENERIC_TOKENS and key not in seen:
+                    seen.add(key)
+                    patterns.append((token.title(), re.compile(rf"\b{token}{_SUFFIX}\b"), False))
+    return patterns
+
+
+def _city_names(city: str) -> List[str]:
+    names = [city] + [p.strip() for p in re.split(r"[()/]", city) if p.strip()]
+    for name in list(names):
+        names.extend(CITY_ALIASES.get(name, []))
+    return names
+
+
+@lru_cache(maxsize=1024)
+def _leak_patterns(city: str, check_country: bool) -> Tuple[Tuple[str, Tuple[Tuple[str, Pattern, bool], ...]], ...]:
+    groups = [("name_leak", tuple(_name_patterns(_city_names(city))))]
+    country = CITY_COUNTRIES.get(city)
+    if check_country and country:
+        groups.append(("country_leak", tuple(_name_patterns([country] + COUNTRY_ALIASES.get(country, [])))))
+    return tuple(groups)
+
+
+def _find_leak(text: str, city: str, difficulty: str):
+    folded = _fold(text)
+    for rule, patterns in _leak_patterns(city, not difficulty.upper().startswith("INDIA")):
+        for name, pattern, exact_case in patterns:
+            match = pattern.search(text if exact_case else folded)
+            if match:
+                return rule, name, match
+    return None
+
+
+# ------------------------------------------------------------------
+# PUBLIC API
+# ------------------------------------------------------------------
+
+def check(riddle: str, city: str, difficulty: str = "") -> PreCriticResult:
+    """Trim, then run the mechanical checks. Microseconds, no I/O."""
+    text = trim(riddle)
+    if len(text) < MIN_CHARS:
+        return PreCriticResult(False, text, "too_short", f"Too short ({len(text)} chars). Write 2-4 full sentences.")
+    if len(text) > MAX_CHARS:
+        return PreCriticResult(False, text, "too_long", f"Too long ({len(text)} chars). Max {MAX_CHARS} characters.")
+
+    leak = _find_leak(text, city, difficulty)
+    if leak:
+        rule, name, _ = leak
+        what = "the country" if rule == "country_leak" else "the city"
+        return PreCriticResult(False, text, rule, f"Mentions {what} by name ('{name}'). Never name it or its parts.")
+
+    folded = _fold(text)
+    for phrase in BANNED_PHRASES:
+        if phrase in folded:
+            return PreCriticResult(False, text, "banned_phrase", f"Gives the answer away ('{phrase}').")
+
+    return PreCriticResult(True, text, "trimmed" if text != (riddle or "").strip() else "pass", "")
+
+
+def leaks(text: str, city: str, difficulty: str = "") -> bool:
+    """True if the text names the city (or, GLOBAL_*, its country). For riddle fragments."""
+    return _find_leak(text, city, difficulty) is not None
+
+
+def redact(riddle: str, city: str, difficulty: str = "") -> str:
+    """Last resort for a draft that still leaks: blank out every leaked name."""
+    text = riddle
+    for _ in range(10):  # Each pass removes one leak; a riddle never has more
+        leak = _find_leak(text, city, difficulty)
+        if not leak:
+            break
+        rule, _, match = leak
+        replacement = "this land" if rule == "country_leak" else "this city"
+        start = match.start()
+        if text[max(0, start - 4):start].lower() == "the ":
+            start -= 4  # "in the USA" -> "in this land"
+        text = text[:start] + replacement + text[match.end():]
+    return text
@@ -0,0 +1,323 @@
+"""
+Daily provider quota planner: keep headroom in the providers' daily caps
+for the riddles players are about to need.
+
+The free tiers cap requests per day (Groq ~14,400, Gemini and Cohere far
+fewer), and top-ups and library refills spend the same quota as cold-start
+riddles. Left alone, a busy morning of speculative refills leaves nothing
+for the evening peak.
+
+    ACCOUNT   every successful provider call (polyglot_ai) records one
+              request and its tokens against the provider's UTC day.
+              Generation jobs are counted per hour: live (URGENT /
+              LOW_DEPTH, a player needs the riddle within a round or two)
+              and paced (TOP_UP / SPECULATIVE) ones. Counters are buffered
+              per process and flushed every FLUSH_SEC to one Redis hash per
+              day (quota:{YYYY-MM-DD}, HINCRBY), which every process reads
+              back, so API processes, worker.py and pregenerate.py share one
+              budget. Without Redis they stay in-process (and ride along in
+              the warm-restart snapshot).
+    FORECAST  live jobs still to come today = for each remaining hour, the
+              mean live jobs of that hour over the last HISTORY_DAYS days
+              (no history yet: today's hourly rate so far). Times the
+              provider's requests (tokens) per LLM job, measured today.
+    RESERVE   reserve = forecast * QUOTA_HEADROOM, spare = cap - used - reserve.
+    PACE      paced jobs may spend spare / hours left today in each hour, so
+              refills are spread over the day instead of front-loaded. A
+              paced job over the allowance runs on stored riddles
+              (RESERVOIR_ONLY, services/generation.py); pregenerate.py waits.
+              Live jobs are never paced. Only the generator
+              (QUOTA_PACED_PROVIDERS, default groq) paces: the Cohere critic
+              fails open and Gemini only stands in for Groq, so once their
+              cap is spent polyglot_ai skips that step (exhausted())
+              instead of generating less.
+
+Caps: *_DAILY_REQUESTS / *_DAILY_TOKENS per provider, 0 = not capped
+(recorded only). QUOTA_PACING=0 turns pacing off but keeps the accounting.
+Days are UTC: the providers reset their daily counters at midnight UTC.
+"""
+
+import asyncio
+import calendar
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from services.admission import RESERVOIR_ONLY
+from services.metrics import QUOTA_PACING, REGISTRY
+from services.scheduler import LOW_DEPTH, PRIORITY_NAMES
+
+PROVIDERS = ("groq", "cohere", "gemini")
+DAILY_REQUESTS = {
+    "groq": int(os.getenv("GROQ_DAILY_REQUESTS", "14400")),
+    "cohere": int(os.getenv("COHERE_DAILY_REQUESTS", "1000")),
+    "gemini": int(os.getenv("GEMINI_DAILY_REQUESTS", "1500")),
+}
+DAILY_TOKENS = {
+    "groq": int(os.getenv("GROQ_DAILY_TOKENS", "0")),
+    "cohere": int(os.getenv("COHERE_DAILY_TOKENS", "0")),
+    "gemini": int(os.getenv("GEMINI_DAILY_TOKENS", "0")),
+}
+HEADROOM = float(os.getenv("QUOTA_HEADROOM", "1.5"))  # Reserve = forecast live demand x this
+PACING = os.getenv("QUOTA_PACING", "1") == "1"
+PACED_PROVIDERS = tuple(p.strip() for p in os.getenv("QUOTA_PACED_PROVIDERS", "groq").split(",") if p.strip())
+HISTORY_DAYS = 7
+FLUSH_SEC = 10.0
+QUOTA_PREFIX = "quota"
+QUOTA_TTL_SEC = (HISTORY_DAYS + 2) * 86400
+# Requests / tokens per LLM job until today has MIN_JOBS_FOR_RATIO of them
+# (one draft, a redraft now and then, one critique; Gemini only on Groq failures)
+DEFAULT_PER_JOB = {
+    "requests": {"groq": 1.3, "cohere": 1.0, "gemini": 0.2},
+    "tokens": {"groq": 400, "cohere": 250, "gemini": 80},
+}
+MIN_JOBS_FOR_RATIO = 20
+
+
+def _now() -> Tuple[str, int]:
+    now = time.gmtime()
+    return time.strftime("%Y-%m-%d", now), now.tm_hour
+
+
+def _past_days(day: str) -> List[str]:
+    start = calendar.timegm(time.strptime(day, "%Y-%m-%d"))
+    return [time.strftime("%Y-%m-%d", time.gmtime(start - i * 86400)) for i in range(1, HISTORY_DAYS + 1)]
+
+
+class QuotaPlanner:
+    """
+    One per process (QUOTA below). start(client) in lifespan startup (client
+    None: in-process accounting), stop() in shutdown flushes what's left.
+    """
+
+    def __init__(self, requests: Dict[str, int] = DAILY_REQUESTS, tokens: Dict[str, int] = DAILY_TOKENS,
+                 headroom: float = HEADROOM):
+        self.caps: Dict[Tuple[str, str], int] = {(p, "requests"): n for p, n in requests.items() if n > 0}
+        self.caps.update({(p, "tokens"): n for p, n in tokens.items() if n > 0})
+        self.headroom = headroom
+        self.client = None
+        self._days: Dict[str, Dict[str, int]] = {}  # day -> field -> count (all processes, as of the last sync)
+        self._pending: Dict[Tuple[str, str], int] = {}  # Redis mode: recorded, not flushed yet
+        # (provider, unit) -> (per LLM job, paced spend allowed this hour), from plan()
+        self._budget: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._planned_for: Optional[Tuple[str, int]] = None
+        self._live_forecast = 0.0
+        self._task: Optional[asyncio.Task] = None
+        REGISTRY.gauge_callback(
+            "atlast_provider_quota_used", "Provider requests / tokens used today (UTC), all processes",
+            ("provider", "unit"), lambda: [((p, unit), self.used(p, unit)) for p in PROVIDERS
+                                           for unit in ("requests", "tokens")]
+        )
+        REGISTRY.gauge_callback(
+            "atlast_provider_quota_spare", "Daily cap left after the reserve for live demand (capped providers)",
+            ("provider", "unit"), lambda: [(key, self.spare(*key)) for key in self.caps]
+        )
+
+    async def start(self, client=None):
+        self.client = client
+        if self._task is None:
+            await self.tick()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.client is not None and self._pending:
+            try:
+                await self._sync()
+            except Exception as e:
+                print(f"⚠️ Quota flush failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_SEC)
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"⚠️ Quota sync failed: {e}")
+
+    async def tick(self):
+        if self.client is not None:
+            await self._sync()
+        day, _ = _now()
+        keep = {day, *_past_days(day)}
+        for old in [d for d in self._days if d not in keep]:
+            del self._days[old]
+        self.plan()
+
+    # --------------------------------------------------------------
+    # ACCOUNTING
+    # --------------------------------------------------------------
+
+    def _add(self, day: str, field: str, amount: int):
+        counts = self._days.setdefault(day, {})
+        counts[field] = counts.get(field, 0) + amount
+        if self.client is not None:
+            self._pending[(day, field)] = self._pending.get((day, field), 0) + amount
+
+    def record(self, provider: str, tokens: int = 0):
+        """One successful call (429s and errors don't count against the daily caps)."""
+        day, _ = _now()
+        self._add(day, f"{provider}:requests", 1)
+        if tokens:
+            self._add(day, f"{provider}:tokens", int(tokens))
+
+    async def _sync(self):
+        """Flush this process's counts, read back today's totals (and any history not cached yet)."""
+        pending, self._pending = self._pending, {}
+        day, _ = _now()
+        missing = [d for d in _past_days(day) if d not in self._days]
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for (pending_day, field), amount in pending.items():
+                    pipe.hincrby(f"{QUOTA_PREFIX}:{pending_day}", field, amount)
+                for pending_day in {d for d, _ in pending}:
+                    pipe.expire(f"{QUOTA_PREFIX}:{pending_day}", QUOTA_TTL_SEC)
+                for read_day in [day] + missing:
+                    pipe.hgetall(f"{QUOTA_PREFIX}:{read_day}")
+                results = await pipe.execute()
+        except Exception:
+            for key, amount in pending.items():  # Kept for the next flush
+                self._pending[key] = self._pending.get(key, 0) + amount
+            raise
+        for read_day, counts in zip([day] + missing, results[-(1 + len(missing)):]):
+            self._days[read_day] = {field: int(value) for field, value in counts.items()}
+        # Recorded while the pipeline was in flight: not in the totals yet
+        for (pending_day, field), amount in self._pending.items():
+            counts = self._days.setdefault(pending_day, {})
+            counts[field] = counts.get(field, 0) + amount
+
+    def used(self, provider: str, unit: str = "requests") -> int:
+        day, _ = _now()
+        return self._days.get(day, {}).get(f"{provider}:{unit}", 0)
+
+    def exhausted(self, provider: str) -> bool:
+        """The provider's daily cap (either unit) is spent: skip the step it serves."""
+        return any(
+            self.used(capped, unit) >= cap for (capped, unit), cap in self.caps.items() if capped == provider
+        )
+
+    # --------------------------------------------------------------
+    # FORECAST + PACING
+    # --------------------------------------------------------------
+
+    def forecast_live(self) -> float:
+        """Live generation jobs expected from now to midnight UTC."""
+        day, hour = _now()
+        today = self._days.get(day, {})
+        history = [self._days[d] for d in _past_days(day) if self._days.get(d)]
+        if history:
+            def mean(h: int) -> float:
+                return sum(counts.get(f"jobs:live:{h:02d}", 0) for counts in history) / len(history)
+            # This hour's expected demand, minus what already showed up
+            now_left = max(mean(hour) - today.get(f"jobs:live:{hour:02d}", 0), 0)
+            return now_left + sum(mean(h) for h in range(hour + 1, 24))
+        seconds = time.time() % 86400
+        per_hour = today.get("jobs:live", 0) / max(seconds / 3600, 1.0)
+        return per_hour * (86400 - seconds) / 3600
+
+    def _per_job(self, provider: str, unit: str) -> float:
+        day, _ = _now()
+        jobs = self._days.get(day, {}).get("jobs:llm", 0)
+        if jobs >= MIN_JOBS_FOR_RATIO:
+            return self.used(provider, unit) / jobs
+        return DEFAULT_PER_JOB[unit].get(provider, 1.0)
+
+    def spare(self, provider: str, unit: str = "requests") -> float:
+        """Cap minus used minus the reserve for live demand (negative: the reserve is eaten into)."""
+        cap = self.caps.get((provider, unit))
+        if cap is None:
+            return float("inf")
+        reserve = self._live_forecast * self._per_job(provider, unit) * self.headroom
+        return cap - self.used(provider, unit) - reserve
+
+    def plan(self):
+        """Recompute the forecast and this hour's paced allowance per capped provider."""
+        day, hour = _now()
+        self._planned_for = (day, hour)
+        self._live_forecast = self.forecast_live()
+        paced = self._days.get(day, {}).get(f"jobs:paced:{hour:02d}", 0)
+        hours_left = 24 - hour
+        self._budget = {}
+        for provider, unit in self.caps:
+            per_job = self._per_job(provider, unit)
+            # Spare as of the start of the hour (this hour's paced spend added back), spread evenly
+            budget = max(self.spare(provider, unit) + paced * per_job, 0)
+            self._budget[(provider, unit)] = (per_job, budget / hours_left)
+
+    def allows_paced(self) -> bool:
+        if not PACING:
+            return True
+        day, hour = _now()
+        if self._planned_for != (day, hour):
+            self.plan()
+        paced = self._days.get(day, {}).get(f"jobs:paced:{hour:02d}", 0)
+        return all(
+            paced * per_job < allowance
+            for (provider, _), (per_job, allowance) in self._budget.items() if provider in PACED_PROVIDERS
+        )
+
+    def admit(self, priority: int, level: int) -> int:
+        """
+        Count one generation job and return the ladder level it runs at:
+        RESERVOIR_ONLY for a paced job over this hour's allowance.
+        """
+        day, hour = _now()
+        if priority <= LOW_DEPTH:
+            self._add(day, "jobs:live", 1)
+            self._add(day, f"jobs:live:{hour:02d}", 1)
+        elif level < RESERVOIR_ONLY:
+            if not self.allows_paced():
+                QUOTA_PACING.inc(PRIORITY_NAMES.get(priority, "top_up"), "deferred")
+                return RESERVOIR_ONLY
+            QUOTA_PACING.inc(PRIORITY_NAMES.get(priority, "top_up"), "allowed")
+            self._add(day, f"jobs:paced:{hour:02d}", 1)
+        if level < RESERVOIR_ONLY:
+            self._add(day, "jobs:llm", 1)
+        return level
+
+    def snapshot(self) -> Dict[str, object]:
+        day, hour = _now()
+        paced = self._days.get(day, {}).get(f"jobs:paced:{hour:02d}", 0)
+        providers = {}
+        for (provider, unit), cap in self.caps.items():
+            per_job, allowance = self._budget.get((provider, unit), (self._per_job(provider, unit), 0.0))
+            providers[f"{provider}:{unit}"] = {
+                "cap": cap,
+                "used": self.used(provider, unit),
+                "spare": round(self.spare(provider, unit), 1),
+                "per_job": round(per_job, 2),
+                "paced_allowance": round(allowance, 1),
+                "paced_spent": round(paced * per_job, 1),
+                "paces": provider in PACED_PROVIDERS,
+            }
+        return {
+            "day": day,
+            "hour": hour,
+            "live_forecast": round(self._live_forecast, 1),
+            "paced_allowed": self.allows_paced(),
+            "history_days": sum(1 for d in _past_days(day) if self._days.get(d)),
+            "providers": providers,
+        }
+
+    # --------------------------------------------------------------
+    # WARM RESTART (services/snapshot.py, in-memory mode only)
+    # --------------------------------------------------------------
+
+    def checkpoint(self) -> Dict[str, Dict[str, int]]:
+        return self._days
+
+    def restore(self, days: Dict[str, Dict[str, int]]):
+        """Before start(): today's spend and the history survive a restart without Redis."""
+        for day, counts in days.items():
+            merged = self._days.setdefault(day, {})
+            for field, value in counts.items():
+                merged[field] = merged.get(field, 0) + int(value)
+
+
+QUOTA = QuotaPlanner()
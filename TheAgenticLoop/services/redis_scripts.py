@@ -0,0 +1,826 @@
+"""
+Server-side Redis scripts for the per-session state.
+
+SESSION LAYOUT (one shared TTL):
+    session:{id}  HASH    difficulty, answer, lat, lng, keys, attempts, user_id,
+                          pending, pending_at, active_at, idle
+    queue:{id}    LIST    buffered riddles (JSON)
+    logs:{id}     STREAM  capped agent log (written by services.session_store)
+    seen:{id}     STRING  seen-city bitmap: u32 draw cursor, then one bit per
+                          city ID (services.cities), ~25 bytes for 163 cities
+
+    sessions:active       ZSET  session key -> last player activity (unix s)
+    inventory:{difficulty} LIST riddles reclaimed from idle sessions (capped)
+    deck:{difficulty}:{crc} STRING a shuffled pool (services.cities), packed
+                          u32 city IDs, shared by every session drawing from it
+
+LIFECYCLE (services/lifecycle.py): only player transitions (create, pop / arm
+a question, check an answer) are activity. They set active_at and move every
+key of the session to SESSION_TTL. Generation writes (push_riddle, logs,
+city draws) keep the session's current expiry, so refills can't keep an
+abandoned session alive. After SESSION_IDLE_SEC without activity,
+RECLAIM_IDLE_LUA marks the session idle and moves its unread riddles to the
+inventory; riddles finished for an idle session go there too.
+
+A session started with a user_id draws from seen:user:{uid}:{difficulty}
+instead, which outlives the session (SEEN_USER_TTL), so players don't get
+repeats across sessions without the frontend uploading its history.
+
+The hash stays small enough for Redis's compact listpack encoding (ziplist
+before Redis 7; <= 128 fields, values <= 64 bytes by default), which is what
+makes the session state ~5x cheaper than the old layout of five keys with
+their own TTLs (config:, answer:, attempts:, used_cities:, queue:, plus a
+JSON copy of the location in answer:). See benchmarks/bench_session_memory.py.
+
+Every state transition runs as ONE atomic Lua script, so an endpoint costs a
+single round trip, two concurrent pops can't interleave, and every touch
+refreshes the TTL on all of the session's keys.
+
+MIGRATION: each script first folds any legacy keys for its session into the
+hash (and deletes them), so sessions created before the deploy keep working.
+`python -m services.redis_scripts --migrate` does the same for all sessions
+up front.
+
+If the server can't run Lua (e.g. FakeRedis without `lupa`), we fall back to
+MULTI/EXEC pipelines: still atomic per step, two round trips instead of one.
+"""
+
+import asyncio
+import os
+import struct
+import sys
+import time
+import zlib
+from typing import Optional, Tuple, List, Dict, Any
+
+from redis.exceptions import ResponseError, WatchError
+
+from services import riddle_codec
+from services.matcher import MATCHER_VERSION
+
+SESSION_PREFIX = "session"
+SESSION_TTL = 3600  # Seconds; every session key, refreshed on player activity
+SESSION_IDLE_SEC = int(os.getenv("SESSION_IDLE_SEC", "600"))  # No activity: stop generating, reclaim the buffer
+ACTIVE_KEY = "sessions:active"
+INVENTORY_PREFIX = "inventory"
+INVENTORY_MAX = int(os.getenv("INVENTORY_MAX", "500"))  # Reclaimed riddles kept per difficulty
+SEEN_PREFIX = "seen"
+SEEN_USER_TTL = int(os.getenv("SEEN_USER_TTL", str(90 * 24 * 3600)))  # Per-player history, refreshed per draw
+DECK_PREFIX = "deck"
+DECK_TTL = 24 * 3600  # Packed decks; re-uploaded by the next draw once expired
+PENDING_STALE_SEC = 120  # A scheduled generation not delivered by then is presumed lost
+
+LEGACY_PREFIXES = ("config", "answer", "attempts", "used_cities")
+
+# ------------------------------------------------------------------
+# LUA SOURCES
+# ------------------------------------------------------------------
+# NOTE: Lua tables stop at the first nil, so missing values are returned
+# as `false` (which Redis converts to a nil reply).
+#
+# Every script receives the same KEYS:
+#   1 session, 2 queue, 3-6 legacy config/answer/attempts/used_cities,
+#   7 logs, 8 session seen bitmap, 9 sessions:active
+# and ARGV[1] = TTL.
+
+_LUA_HELPERS = """
+-- TIME before writes: replicate effects, not the script (no-op on Redis 7)
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local session, queue = KEYS[1], KEYS[2]
+local ttl = tonumber(ARGV[1])
+
+-- Copy the verification fields of a queued riddle into the session hash.
+-- v2 payloads (services.riddle_codec) carry them up front as plain text.
+local function arm(raw)
+    if string.sub(raw, 1, 3) == 'R2\\31' then
+        local f, start = {}, 4
+        for i = 1, 4 do
+            local stop = string.find(raw, '\\31', start, true)
+            f[i] = string.sub(raw, start, stop - 1)
+            start = stop + 1
+        end
+        redis.call('HSET', session, 'answer', f[1], 'lat', f[2], 'lng', f[3], 'keys', f[4], 'attempts', 0)
+        return
+    end
+    local riddle = cjson.decode(raw)
+    local location = riddle.location or {}
+    local keys = ''
+    if type(riddle.matcher) == 'table' and type(riddle.matcher.keys) == 'table' then
+        keys = table.concat(riddle.matcher.keys, '|')
+    end
+    redis.call('HSET', session,
+        'answer', riddle.answer or location.name or '',
+        'lat', tostring(location.lat or ''),
+        'lng', tostring(location.lng or ''),
+        'keys', keys,
+        'attempts', 0)
+end
+
+-- Fold pre-consolidation keys into the hash (no-op once migrated)
+local function migrate()
+    if redis.call('EXISTS', session) == 1 or redis.call('EXISTS', KEYS[3]) == 0 then
+        return
+    end
+    local difficulty = redis.call('HGET', KEYS[3], 'difficulty')
+    local now = redis.call('TIME')[1]
+    redis.call('HSET', session, 'difficulty', difficulty or 'Medium', 'active_at', now)
+    -- Same lifetime and idle tracking as a new session, whichever script migrates it
+    redis.call('EXPIRE', session, ttl)
+    redis.call('EXPIRE', queue, ttl)
+    redis.call('ZADD', KEYS[9], now, session)
+    local answer = redis.call('GET', KEYS[4])
+    if answer then
+        arm(answer)
+    end
+    local attempts = redis.call('GET', KEYS[5])
+    if attempts then
+        redis.call('HSET', session, 'attempts', attempts)
+    end
+    -- Visited-city names (KEYS[6]) are dropped: exclusion is by city ID now
+    redis.call('DEL', KEYS[3], KEYS[4], KEYS[5], KEYS[6])
+end
+
+-- Player activity: every session key expires together, SESSION_TTL from now
+local function touch()
+    local now = redis.call('TIME')[1]
+    redis.call('HSET', session, 'active_at', now)
+    redis.call('HDEL', session, 'idle')
+    redis.call('ZADD', KEYS[9], now, session)
+    redis.call('EXPIRE', session, ttl)
+    redis.call('EXPIRE', queue, ttl)
+    redis.call('EXPIRE', KEYS[7], ttl)
+    redis.call('EXPIRE', KEYS[8], ttl)
+end
+
+migrate()
+"""
+
+# Refill accounting. `pending` counts generations scheduled but not yet
+# pushed, so repeated polls on an empty queue don't each start another one.
+# A count older than ARGV[4] seconds is considered lost (pod restart) and reset.
+# ARGV[2] = buffer target, ARGV[3] = now (unix seconds), ARGV[4] = stale after.
+_LUA_CLAIM_REFILL = """
+local function claim_refill(depth)
+    local target, now, stale = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local f = redis.call('HMGET', session, 'pending', 'pending_at')
+    local pending = tonumber(f[1] or '0') or 0
+    if pending < 0 or now - (tonumber(f[2] or '0') or 0) > stale then
+        pending = 0
+    end
+    local refill = target - depth - pending
+    if refill <= 0 then
+        return 0
+    end
+    redis.call('HSET', session, 'pending', pending + refill, 'pending_at', now)
+    return refill
+end
+"""
+
+# Unknown / expired session: a miss, and nothing is created (no refills either)
+_LUA_REQUIRE_SESSION = """
+if redis.call('HEXISTS', session, 'difficulty') == 0 then
+    return %s
+end
+"""
+
+# Returns {raw riddle or false, difficulty or false, remaining depth, refills to schedule}
+POP_QUESTION_LUA = _LUA_HELPERS + _LUA_CLAIM_REFILL + _LUA_REQUIRE_SESSION % "{false, false, 0, 0}" + """
+local raw = redis.call('LPOP', queue)
+if raw then
+    arm(raw)
+end
+local difficulty = redis.call('HGET', session, 'difficulty')
+local depth = redis.call('LLEN', queue)
+local refill = claim_refill(depth)
+touch()
+return {raw or false, difficulty or false, depth, refill}
+"""
+
+# Arm a riddle that was already popped (by a blocking BLPOP long-poll).
+# ARGV[5] = raw riddle. Returns {difficulty or false, remaining depth, refills to schedule}
+ARM_QUESTION_LUA = _LUA_HELPERS + _LUA_CLAIM_REFILL + _LUA_REQUIRE_SESSION % "{false, 0, 0}" + """
+arm(ARGV[5])
+local difficulty = redis.call('HGET', session, 'difficulty')
+local depth = redis.call('LLEN', queue)
+local refill = claim_refill(depth)
+touch()
+return {difficulty or false, depth, refill}
+"""
+
+# Returns {answer, lat, lng, keys, attempts, difficulty} (answer false if no active riddle)
+CHECK_ANSWER_LUA = _LUA_HELPERS + """
+local f = redis.call('HMGET', session, 'answer', 'lat', 'lng', 'keys', 'difficulty')
+if not f[1] or f[1] == '' then
+    return {false, false, false, false, 0, f[5] or false}
+end
+local attempts = redis.call('HINCRBY', session, 'attempts', 1)
+touch()
+return {f[1], f[2] or false, f[3] or false, f[4] or false, attempts, f[5] or false}
+"""
+
+# Returns {difficulty or false, user_id or false}
+GET_SESSION_LUA = _LUA_HELPERS + """
+local f = redis.call('HMGET', session, 'difficulty', 'user_id')
+return {f[1] or false, f[2] or false}
+"""
+
+# Standalone (no session keys). KEYS[1] = seen bitmap, KEYS[2] = the deck
+# (city IDs in draw order, packed u32, see SessionScripts._deck_key), ARGV[1] = TTL.
+# A negative TTL only applies to a bitmap without one: a session's bitmap
+# expires with the session (touch()), a player's is refreshed by every draw.
+# Bits 0-31 are the draw cursor; bit 32 + id marks city `id` as seen. Each
+# step reads one deck entry (BITFIELD GET at cursor % n), whatever the pool size.
+# Returns the drawn city ID, or -1 if the deck key is missing (upload, retry).
+DRAW_CITY_LUA = """
+local seen, deck, ttl = KEYS[1], KEYS[2], tonumber(ARGV[1])
+local n = redis.call('STRLEN', deck) / 4
+if n == 0 then
+    return -1
+end
+local function draw()
+    for _ = 1, n do
+        local cursor = redis.call('BITFIELD', seen, 'OVERFLOW', 'WRAP', 'INCRBY', 'u32', 0, 1)[1]
+        local id = redis.call('BITFIELD', deck, 'GET', 'u32', '#' .. (cursor % n))[1]
+        if redis.call('SETBIT', seen, 32 + id, 1) == 0 then
+            return id
+        end
+    end
+    return false
+end
+local id = draw()
+if not id then
+    -- Every city in the deck seen: start a new lap, keeping the cursor
+    local cursor = redis.call('BITFIELD', seen, 'GET', 'u32', 0)[1]
+    redis.call('DEL', seen)
+    redis.call('BITFIELD', seen, 'SET', 'u32', 0, cursor)
+    id = draw()
+end
+if ttl > 0 then
+    redis.call('EXPIRE', seen, ttl)
+elseif redis.call('TTL', seen) < 0 then
+    redis.call('EXPIRE', seen, -ttl)
+end
+return id
+"""
+
+# Generator side: not activity. ARGV[2] = riddle, ARGV[3] = now, ARGV[4] =
+# inventory prefix, ARGV[5] = inventory cap, ARGV[6] = difficulty (used if
+# the session is gone). Queues the riddle for a live session (expiring with
+# it) and returns 1; for an idle or expired one it goes to the inventory: 0.
+PUSH_RIDDLE_LUA = _LUA_HELPERS + """
+local raw = ARGV[2]
+local f = redis.call('HMGET', session, 'difficulty', 'idle')
+if f[1] and not f[2] then
+    redis.call('RPUSH', queue, raw)
+    redis.call('HINCRBY', session, 'pending', -1)
+    redis.call('HSET', session, 'pending_at', ARGV[3])
+    local left = redis.call('TTL', session)
+    redis.call('EXPIRE', queue, left > 0 and left or ttl)
+    return 1
+end
+if not f[1] and ARGV[6] == '' then
+    return 0
+end
+local inventory = ARGV[4] .. ':' .. (f[1] or ARGV[6])
+redis.call('RPUSH', inventory, raw)
+redis.call('LTRIM', inventory, -tonumber(ARGV[5]), -1)
+return 0
+"""
+
+# Standalone. KEYS[1] = session hash. Settles one pending generation of a
+# live session, keeping its expiry; a session that's gone stays gone (a bare
+# HINCRBY would recreate the hash without a TTL). Returns 1 if it decremented.
+RELEASE_GENERATION_LUA = """
+if redis.call('HEXISTS', KEYS[1], 'difficulty') == 0 then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], 'pending', -1)
+return 1
+"""
+
+# Standalone. KEYS[1] = sessions:active. ARGV: idle cutoff (unix s), batch
+# size, session prefix, queue prefix, inventory prefix, inventory cap.
+# Marks up to `batch` sessions inactive since the cutoff idle, resets their
+# pending generations and moves their unread riddles to the inventory
+# (oldest trimmed past the cap). Returns {session id, riddles moved, ...};
+# index entries of sessions that no longer exist are dropped, not reported.
+RECLAIM_IDLE_LUA = """
+local reclaimed = {}
+local idle = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, session in ipairs(idle) do
+    redis.call('ZREM', KEYS[1], session)
+    local id = string.sub(session, #ARGV[3] + 2)
+    local queue = ARGV[4] .. ':' .. id
+    local difficulty = redis.call('HGET', session, 'difficulty')
+    local moved = 0
+    if difficulty then
+        local riddles = redis.call('LRANGE', queue, 0, -1)
+        if #riddles > 0 then
+            local inventory = ARGV[5] .. ':' .. difficulty
+            redis.call('RPUSH', inventory, unpack(riddles))
+            redis.call('LTRIM', inventory, -tonumber(ARGV[6]), -1)
+            moved = #riddles
+        end
+        redis.call('HSET', session, 'idle', 1, 'pending', 0)
+        table.insert(reclaimed, id)
+        table.insert(reclaimed, moved)
+    end
+    redis.call('DEL', queue)
+end
+return reclaimed
+"""
+
+SEEN_CURSOR_BITS = 32
+
+
+class SessionScripts:
+    """
+    One-round-trip session transitions over the consolidated session hash.
+    Create once per Redis client (in lifespan) and share across requests.
+    """
+
+    def __init__(
+        self,
+        client,
+        queue_prefix: str = "queue",
+        ttl: int = SESSION_TTL,
+        log_prefix: str = "logs",
+        idle_sec: int = SESSION_IDLE_SEC
+    ):
+        self.client = client
+        self.queue_prefix = queue_prefix
+        self.ttl = ttl
+        self.log_prefix = log_prefix
+        self.idle_sec = idle_sec
+        self.lua_enabled = True
+        self._deck_keys: Dict[int, Tuple[List[int], str]] = {}
+        self._pop_question = client.register_script(POP_QUESTION_LUA)
+        self._arm_question = client.register_script(ARM_QUESTION_LUA)
+        self._check_answer = client.register_script(CHECK_ANSWER_LUA)
+        self._get_session = client.register_script(GET_SESSION_LUA)
+        self._draw_city = client.register_script(DRAW_CITY_LUA)
+        self._push_riddle = client.register_script(PUSH_RIDDLE_LUA)
+        self._reclaim_idle = client.register_script(RECLAIM_IDLE_LUA)
+        self._release_generation = client.register_script(RELEASE_GENERATION_LUA)
+
+    def _keys(self, session_id: str) -> List[str]:
+        return [
+            f"{SESSION_PREFIX}:{session_id}",
+            f"{self.queue_prefix}:{session_id}",
+        ] + [f"{prefix}:{session_id}" for prefix in LEGACY_PREFIXES] + [
+            f"{self.log_prefix}:{session_id}",
+            f"{SEEN_PREFIX}:{session_id}",
+            ACTIVE_KEY,
+        ]
+
+    def _disable_lua(self, error: Exception):
+        """Switch to the pipeline path if (and only if) the server lacks Lua support."""
+        if isinstance(error, ResponseError) and "unknown command" not in str(error).lower():
+            raise error
+        print(f"⚠️ Lua scripting unavailable ({error}). Falling back to MULTI pipelines.")
+        self.lua_enabled = False
+
+    def _seen(self, session_id: str, difficulty: str, user_id: Optional[str] = None) -> Tuple[str, int]:
+        """(seen-city bitmap key, its TTL): per player if known, else per session."""
+        if user_id:
+            return f"{SEEN_PREFIX}:user:{user_id}:{difficulty}", SEEN_USER_TTL
+        return f"{SEEN_PREFIX}:{session_id}", self.ttl
+
+    async def _run(self, script, session_id: str, *args, keys: List[str] = None, ttl: int = None):
+        """Run a script; returns None if Lua is unavailable (caller uses pipelines)."""
+        if not self.lua_enabled:
+            return None
+        try:
+            return await script(keys=keys or self._keys(session_id), args=[ttl or self.ttl, *args])
+        except (ResponseError, ImportError) as e:
+            self._disable_lua(e)
+            return None
+
+    @staticmethod
+    def _arm_fields(raw: str) -> Dict[str, Any]:
+        """Python twin of the Lua arm() helper (pipeline fallback only)."""
+        return riddle_codec.verification_fields(raw)
+
+    def _touch(self, pipe, session_id: str):
+        """Python twin of the Lua touch() helper: player activity."""
+        keys = self._keys(session_id)
+        now = int(time.time())
+        pipe.hset(keys[0], "active_at", now)
+        pipe.hdel(keys[0], "idle")
+        pipe.zadd(ACTIVE_KEY, {keys[0]: now})
+        for key in keys[:2] + keys[6:8]:
+            pipe.expire(key, self.ttl)
+
+    # --------------------------------------------------------------
+    # SESSION LIFECYCLE
+    # --------------------------------------------------------------
+
+    async def create_session(
+        self,
+        session_id: str,
+        difficulty: str,
+        seen_ids: List[int] = None,
+        pending: int = 0,
+        user_id: Optional[str] = None
+    ):
+        """
+        Write the initial session record (one pipelined round trip).
+        `seen_ids` = city IDs to exclude up front (legacy exclude_cities),
+        `pending` = generations the caller is about to schedule.
+        """
+        session_key = self._keys(session_id)[0]
+        now = int(time.time())
+        fields = {"difficulty": difficulty, "attempts": 0, "pending": pending, "pending_at": now, "active_at": now}
+        if user_id:
+            fields["user_id"] = user_id
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(session_key, mapping=fields)
+            pipe.expire(session_key, self.ttl)
+            pipe.zadd(ACTIVE_KEY, {session_key: now})
+            if seen_ids:
+                seen_key, seen_ttl = self._seen(session_id, difficulty, user_id)
+                for city_id in seen_ids:
+                    pipe.setbit(seen_key, SEEN_CURSOR_BITS + city_id, 1)
+                pipe.expire(seen_key, seen_ttl)
+            await pipe.execute()
+
+    async def get_session(self, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """Returns (difficulty or None, user_id or None)."""
+        result = await self._run(self._get_session, session_id)
+        if result is not None:
+            difficulty, user_id = result
+            return difficulty, user_id
+
+        await migrate_legacy_session(self.client, session_id, self.queue_prefix)
+        difficulty, user_id = await self.client.hmget(self._keys(session_id)[0], "difficulty", "user_id")
+        return difficulty, user_id
+
+    async def draw_city(
+        self,
+        session_id: str,
+        difficulty: str,
+        deck: List[int],
+        user_id: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Next unseen city ID from `deck` (services.cities.CityCatalog.deck),
+        marked seen in the same step. Starts a new lap once all are seen.
+        """
+        if not deck:
+            return None
+        seen_key, seen_ttl = self._seen(session_id, difficulty, user_id)
+        if self.lua_enabled:
+            deck_key = self._deck_key(difficulty, deck)
+            for _ in range(2):
+                # Negative: a session's bitmap keeps the session's expiry (drawing isn't activity)
+                result = await self._run(self._draw_city, session_id, keys=[seen_key, deck_key],
+                                         ttl=seen_ttl if user_id else -seen_ttl)
+                if result != -1:
+                    break
+                await self.client.set(deck_key, self._pack_deck(deck), ex=DECK_TTL)
+            if self.lua_enabled:
+                return None if result is None or result == -1 else int(result)
+
+        # Each step is atomic on its own: the cursor never hands out a slot
+        # twice and SETBIT's old value says whether someone else drew it
+        # Pipeline fallback: reads the deck from the Python list
+        for _ in range(2):
+            for _ in range(len(deck)):
+                cursor = (await self.client.bitfield(seen_key, default_overflow="WRAP")
+                          .incrby("u32", 0, 1).execute())[0]
+                city_id = deck[cursor % len(deck)]
+                if not await self.client.setbit(seen_key, SEEN_CURSOR_BITS + city_id, 1):
+                    await self._expire_seen(seen_key, seen_ttl, refresh=bool(user_id))
+                    return city_id
+            cursor = (await self.client.bitfield(seen_key).get("u32", 0).execute())[0]
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.delete(seen_key)
+                pipe.execute_command("BITFIELD", seen_key, "SET", "u32", 0, cursor)
+                await pipe.execute()
+        return None
+
+    @staticmethod
+    def _pack_deck(deck: List[int]) -> bytes:
+        """Deck as big-endian u32s, the layout BITFIELD GET u32 #i reads."""
+        return struct.pack(f">{len(deck)}I", *deck)
+
+    def _deck_key(self, difficulty: str, deck: List[int]) -> str:
+        """
+        Redis key of a deck's packed copy, named by its content (a pool change
+        gets a new key). Memoized per deck object: the catalog hands out the
+        same lists, so a draw doesn't re-pack or re-send the deck.
+        """
+        cached = self._deck_keys.get(id(deck))
+        if cached is None or cached[0] is not deck:
+            key = f"{DECK_PREFIX}:{difficulty}:{zlib.crc32(self._pack_deck(deck)):08x}"
+            cached = self._deck_keys[id(deck)] = (deck, key)
+        return cached[1]
+
+    async def _expire_seen(self, seen_key: str, ttl: int, refresh: bool):
+        """Player bitmaps: refresh. Session bitmaps: only give a new one the TTL (touch() does the rest)."""
+        if refresh or await self.client.ttl(seen_key) < 0:
+            await self.client.expire(seen_key, ttl)
+
+    async def mark_city_seen(
+        self,
+        session_id: str,
+        difficulty: str,
+        city_id: int,
+        user_id: Optional[str] = None
+    ) -> bool:
+        """
+        Exclude a city that reached the player without a draw (DB / hardcoded
+        fallbacks, the inventory). Returns True if it hadn't been seen yet.
+        """
+        seen_key, seen_ttl = self._seen(session_id, difficulty, user_id)
+        was_seen = await self.client.setbit(seen_key, SEEN_CURSOR_BITS + city_id, 1)
+        await self._expire_seen(seen_key, seen_ttl, refresh=bool(user_id))
+        return not was_seen
+
+    async def push_riddle(self, session_id: str, payload: str, difficulty: Optional[str] = None) -> bool:
+        """
+        Append a riddle to the session queue and settle one pending generation.
+        Not activity: the queue expires with the session. If the session went
+        idle (or expired) the riddle goes to the inventory instead: returns False.
+        """
+        now = int(time.time())
+        result = await self._run(self._push_riddle, session_id, payload, now, INVENTORY_PREFIX,
+                                 INVENTORY_MAX, difficulty or "")
+        if result is not None:
+            return bool(result)
+
+        session_key, queue_key = self._keys(session_id)[:2]
+        current, idle, left = await self._session_state(session_key)
+        if current and not idle:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.rpush(queue_key, payload)
+                pipe.hincrby(session_key, "pending", -1)
+                pipe.hset(session_key, "pending_at", now)
+                pipe.expire(queue_key, left if left > 0 else self.ttl)
+                await pipe.execute()
+            return True
+        if current or difficulty:
+            await self.return_inventory(current or difficulty, payload)
+        return False
+
+    async def _session_state(self, session_key: str) -> Tuple[Optional[str], bool, int]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hmget(session_key, "difficulty", "idle")
+            pipe.ttl(session_key)
+            (difficulty, idle), left = await pipe.execute()
+        return difficulty, bool(idle), left
+
+    async def release_generation(self, session_id: str):
+        """Settle a pending generation that failed without pushing a riddle (live sessions only)."""
+        session_key = self._keys(session_id)[0]
+        result = await self._run(self._release_generation, session_id, keys=[session_key])
+        if result is not None:
+            return
+
+        # WATCH: don't decrement a session that expires between the check and the write
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(session_key)
+                    if not await pipe.hexists(session_key, "difficulty"):
+                        return
+                    pipe.multi()
+                    pipe.hincrby(session_key, "pending", -1)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    async def _claim_refill_fallback(self, session_id: str, depth: int, target: int) -> int:
+        """Python twin of the Lua claim_refill() helper (pipeline fallback only)."""
+        session_key = self._keys(session_id)[0]
+        now = int(time.time())
+        pending, pending_at = await self.client.hmget(session_key, "pending", "pending_at")
+        pending = int(pending or 0)
+        if pending < 0 or now - int(pending_at or 0) > PENDING_STALE_SEC:
+            pending = 0
+        refill = target - depth - pending
+        if refill <= 0:
+            return 0
+        await self.client.hset(session_key, mapping={"pending": pending + refill, "pending_at": now})
+        return refill
+
+    # --------------------------------------------------------------
+    # ENDPOINT TRANSITIONS
+    # --------------------------------------------------------------
+
+    async def pop_question(self, session_id: str, target: int = 0) -> Tuple[Optional[str], Optional[str], int, int]:
+        """
+        Pop the next riddle, arm it as the active answer and reset attempts.
+        Also claims the refills needed to bring queue + pending back to `target`.
+        Returns (raw_riddle or None, difficulty or None, remaining depth, refills to schedule);
+        difficulty None = unknown or expired session, left untouched.
+        """
+        result = await self._run(self._pop_question, session_id, target, int(time.time()), PENDING_STALE_SEC)
+        if result is not None:
+            raw, difficulty, depth, refill = result
+            return raw, difficulty, int(depth), int(refill)
+
+        await migrate_legacy_session(self.client, session_id, self.queue_prefix)
+        session_key, queue_key = self._keys(session_id)[:2]
+        if not await self.client.hexists(session_key, "difficulty"):
+            return None, None, 0, 0
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lpop(queue_key)
+            pipe.hget(session_key, "difficulty")
+            pipe.llen(queue_key)
+            raw, difficulty, depth = await pipe.execute()
+
+        async with self.client.pipeline(transaction=True) as pipe:
+            if raw:
+                pipe.hset(session_key, mapping=self._arm_fields(raw))
+            self._touch(pipe, session_id)
+            await pipe.execute()
+
+        refill = await self._claim_refill_fallback(session_id, int(depth), target)
+        return raw, difficulty, int(depth), refill
+
+    async def arm_question(self, session_id: str, raw: str, target: int = 0) -> Tuple[Optional[str], int, int]:
+        """
+        Arm a riddle that was popped outside pop_question (blocking long-poll).
+        Returns (difficulty or None, remaining depth, refills to schedule);
+        difficulty None = unknown or expired session, left untouched.
+        """
+        result = await self._run(self._arm_question, session_id, target, int(time.time()), PENDING_STALE_SEC, raw)
+        if result is not None:
+            difficulty, depth, refill = result
+            return difficulty, int(depth), int(refill)
+
+        session_key, queue_key = self._keys(session_id)[:2]
+        if not await self.client.hexists(session_key, "difficulty"):
+            return None, 0, 0
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(session_key, mapping=self._arm_fields(raw))
+            pipe.hget(session_key, "difficulty")
+            pipe.llen(queue_key)
+            self._touch(pipe, session_id)
+            _, difficulty, depth, *_ = await pipe.execute()
+
+        refill = await self._claim_refill_fallback(session_id, int(depth), target)
+        return difficulty, int(depth), refill
+
+    async def check_answer(self, session_id: str) -> Tuple[Optional[Dict[str, Any]], int, Optional[str]]:
+        """
+        Load the active riddle and count this attempt.
+        Returns (answer_data or None, attempts, difficulty or None), where
+        answer_data = {"answer", "location", "matcher"}.
+        Attempts are not counted when there is no active riddle.
+        """
+        result = await self._run(self._check_answer, session_id)
+        if result is not None:
+            answer, lat, lng, keys, attempts, difficulty = result
+        else:
+            await migrate_legacy_session(self.client, session_id, self.queue_prefix)
+            session_key = self._keys(session_id)[0]
+            answer, lat, lng, keys, difficulty = await self.client.hmget(
+                session_key, "answer", "lat", "lng", "keys", "difficulty"
+            )
+            attempts = 0
+            if answer:
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.hincrby(session_key, "attempts", 1)
+                    self._touch(pipe, session_id)
+                    attempts = (await pipe.execute())[0]
+
+        if not answer:
+            return None, 0, difficulty
+
+        answer_data = {
+            "answer": answer,
+            "location": {
+                "name": answer,
+                "lat": float(lat) if lat else None,
+                "lng": float(lng) if lng else None,
+            },
+            # Stored keys are already normalized; empty -> rebuilt by AnswerMatcher
+            "matcher": {"v": MATCHER_VERSION, "canonical": answer, "keys": keys.split("|")} if keys else None,
+        }
+        return answer_data, int(attempts), difficulty
+
+    # --------------------------------------------------------------
+    # IDLE SESSIONS + INVENTORY (services/lifecycle.py)
+    # --------------------------------------------------------------
+
+    async def active(self, session_ids: List[str]) -> List[bool]:
+        """Per id: the session exists and isn't idle (generation for it is worth finishing)."""
+        async with self.client.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.hmget(self._keys(session_id)[0], "difficulty", "idle")
+            results = await pipe.execute()
+        return [bool(difficulty) and not idle for difficulty, idle in results]
+
+    async def reclaim_idle(self, limit: int = 500) -> List[Tuple[str, int]]:
+        """
+        Mark up to `limit` sessions without activity for idle_sec idle and move
+        their unread riddles to the inventory. Returns [(session id, riddles moved)].
+        """
+        cutoff = int(time.time()) - self.idle_sec
+        args = [cutoff, limit, SESSION_PREFIX, self.queue_prefix, INVENTORY_PREFIX, INVENTORY_MAX]
+        if self.lua_enabled:
+            try:
+                result = await self._reclaim_idle(keys=[ACTIVE_KEY], args=args)
+                return [(result[i], int(result[i + 1])) for i in range(0, len(result), 2)]
+            except (ResponseError, ImportError) as e:
+                self._disable_lua(e)
+
+        reclaimed = []
+        for session_key in await self.client.zrangebyscore(ACTIVE_KEY, "-inf", cutoff, start=0, num=limit):
+            session_id = session_key[len(SESSION_PREFIX) + 1:]
+            queue_key = f"{self.queue_prefix}:{session_id}"
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.zrem(ACTIVE_KEY, session_key)
+                pipe.hget(session_key, "difficulty")
+                pipe.lrange(queue_key, 0, -1)
+                pipe.delete(queue_key)
+                _, difficulty, riddles, _ = await pipe.execute()
+            if difficulty:
+                async with self.client.pipeline(transaction=True) as pipe:
+                    if riddles:
+                        pipe.rpush(f"{INVENTORY_PREFIX}:{difficulty}", *riddles)
+                        pipe.ltrim(f"{INVENTORY_PREFIX}:{difficulty}", -INVENTORY_MAX, -1)
+                    pipe.hset(session_key, mapping={"idle": 1, "pending": 0})
+                    await pipe.execute()
+                reclaimed.append((session_id, len(riddles)))
+        return reclaimed
+
+    async def take_inventory(self, difficulty: str) -> Optional[str]:
+        """Oldest reclaimed riddle for the difficulty, or None."""
+        return await self.client.lpop(f"{INVENTORY_PREFIX}:{difficulty}")
+
+    async def return_inventory(self, difficulty: str, payload: str):
+        key = f"{INVENTORY_PREFIX}:{difficulty}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.rpush(key, payload)
+            pipe.ltrim(key, -INVENTORY_MAX, -1)
+            await pipe.execute()
+
+# ------------------------------------------------------------------
+# LEGACY MIGRATION
+# ------------------------------------------------------------------
+
+async def migrate_legacy_session(client, session_id: str, queue_prefix: str = "queue") -> bool:
+    """
+    Fold the pre-consolidation keys of one session into session:{id}.
+    Python version of the Lua migrate() helper, for servers without Lua.
+    Returns True if anything was migrated.
+    """
+    session_key = f"{SESSION_PREFIX}:{session_id}"
+    config_key, answer_key, attempts_key, used_key = [f"{p}:{session_id}" for p in LEGACY_PREFIXES]
+
+    if await client.exists(session_key) or not await client.exists(config_key):
+        return False
+
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.hget(config_key, "difficulty")
+        pipe.get(answer_key)
+        pipe.get(attempts_key)
+        difficulty, answer, attempts = await pipe.execute()
+
+    now = int(time.time())
+    fields: Dict[str, Any] = {"difficulty": difficulty or "Medium", "active_at": now}
+    if answer:
+        fields.update(SessionScripts._arm_fields(answer))
+    if attempts:
+        fields["attempts"] = attempts
+
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.hset(session_key, mapping=fields)
+        pipe.expire(session_key, SESSION_TTL)
+        pipe.expire(f"{queue_prefix}:{session_id}", SESSION_TTL)
+        pipe.zadd(ACTIVE_KEY, {session_key: now})
+        pipe.delete(config_key, answer_key, attempts_key, used_key)
+        await pipe.execute()
+    return True
+
+
+async def migrate_all_legacy_sessions(client, queue_prefix: str = "queue") -> int:
+    """Scan for legacy config:* keys and migrate every session found."""
+    migrated = 0
+    async for key in client.scan_iter(match="config:*", count=1000):
+        session_id = key.split(":", 1)[1]
+        if await migrate_legacy_session(client, session_id, queue_prefix):
+            migrated += 1
+    return migrated
+
+
+if __name__ == "__main__":
+    if "--migrate" not in sys.argv:
+        print("Usage: python -m services.redis_scripts --migrate")
+        sys.exit(1)
+
+    import redis.asyncio as redis
+
+    async def _main():
+        client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True)
+        count = await migrate_all_legacy_sessions(client)
+        print(f"✅ Migrated {count} legacy sessions to {SESSION_PREFIX}:* hashes")
+        await client.close()
+
+    asyncio.run(_main())
@@ -0,0 +1,109 @@
+"""
+Queued riddle payloads: what push_riddle stores and pop_question returns.
+
+    v1  the whole riddle dict as JSON, matcher included. Serving it meant
+        json.loads, dropping the matcher, and FastAPI re-encoding the rest
+        (jsonable_encoder + json.dumps); arm() cjson-decoded it again in Redis.
+    v2  "R2" US answer US lat US lng US keys US <client JSON>
+        The verification fields come first as plain text: they are what arm()
+        copies into the session hash, and parsing them takes a few
+        string.find calls instead of cjson.decode. Next comes the
+        client-facing riddle (no matcher), encoded once at generation time
+        and spliced verbatim into the HTTP / WebSocket response. Nothing on
+        the serving path parses or re-encodes it.
+
+US is \\x1f (ASCII unit separator), which never appears in a city name or a
+normalized matcher key. It stays a str payload (the Redis clients use
+decode_responses=True, and the frontend wants JSON anyway, so msgpack would
+only add a transcode). decode() accepts v1 too, so queues written before
+the deploy drain normally. See benchmarks/bench_riddle_payload.py.
+"""
+
+import json
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from services.matcher import MATCHER_VERSION, AnswerMatcher, build_matcher
+
+try:
+    import orjson
+    ENCODER = "orjson"
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    ENCODER = "json"
+
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+SEP = "\x1f"
+V2 = "R2" + SEP
+
+
+class QueuedRiddle(NamedTuple):
+    answer: str
+    lat: Optional[float]
+    lng: Optional[float]
+    keys: List[str]  # Normalized matcher keys ([] = rebuild from answer)
+    client_json: str  # The riddle as the client sees it, already encoded
+
+    def matcher(self) -> AnswerMatcher:
+        if not self.keys:
+            return build_matcher(self.answer)
+        return AnswerMatcher(self.answer, list(self.keys))
+
+    def client_data(self) -> Dict[str, Any]:
+        """Parsed client part (only for callers that need to look inside)."""
+        return json.loads(self.client_json)
+
+
+def _coord(value) -> Optional[float]:
+    return float(value) if value not in (None, "") else None
+
+
+def encode(riddle: Dict[str, Any]) -> str:
+    """Riddle dict (with "matcher" from build_matcher().to_dict()) -> v2 payload."""
+    client = {k: v for k, v in riddle.items() if k != "matcher"}
+    location = riddle.get("location") or {}
+    matcher = riddle.get("matcher") or {}
+    keys = matcher.get("keys", []) if matcher.get("v") == MATCHER_VERSION else []
+    answer = riddle.get("answer") or location.get("name", "")
+    lat, lng = location.get("lat"), location.get("lng")
+    return SEP.join([
+        "R2", answer,
+        "" if lat is None else repr(float(lat)),
+        "" if lng is None else repr(float(lng)),
+        "|".join(keys), dumps(client),
+    ])
+
+
+def decode(raw: str) -> QueuedRiddle:
+    if raw.startswith(V2):
+        _, answer, lat, lng, keys, client_json = raw.split(SEP, 5)
+        return QueuedRiddle(answer, _coord(lat), _coord(lng), keys.split("|") if keys else [], client_json)
+
+    # v1: plain JSON of the whole riddle
+    riddle = json.loads(raw)
+    matcher = riddle.pop("matcher", None) or {}
+    location = riddle.get("location") or {}
+    keys = list(matcher.get("keys", [])) if matcher.get("v") == MATCHER_VERSION else []
+    return QueuedRiddle(
+        riddle.get("answer") or location.get("name", ""),
+        _coord(location.get("lat")), _coord(location.get("lng")),
+        keys, dumps(riddle),
+    )
+
+
+def verification_fields(raw: str) -> Dict[str, Any]:
+    """What arm() writes into the session hash (Python twin of the Lua helper)."""
+    if raw.startswith(V2):
+        _, answer, lat, lng, keys, _ = raw.split(SEP, 5)
+        return {"answer": answer, "lat": lat, "lng": lng, "keys": keys, "attempts": 0}
+    riddle = decode(raw)
+    return {
+        "answer": riddle.answer,
+        "lat": "" if riddle.lat is None else riddle.lat,
+        "lng": "" if riddle.lng is None else riddle.lng,
+        "keys": "|".join(riddle.keys),
+        "attempts": 0,
+    }
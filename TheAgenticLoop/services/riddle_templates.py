@@ -0,0 +1,153 @@
+"""
+Template riddles: the offline tier behind the providers and the DB.
+
+When generation times out (or the admission controller is shedding load)
+and the riddle store has nothing, a riddle is assembled from city_facts.json
+instead of falling back to a fixed Delhi / Tokyo riddle:
+
+    facts     per pool city: country, region (state for INDIA_*, a part of
+              the world for GLOBAL_*), landmarks, river, cuisine, known_for.
+              "currencies" maps a country to its currency; a city can
+              override it ("currency").
+    clues     one first-person sentence per fact, plus the coordinate band
+              (5° of latitude / longitude), which every city has, gazetteer
+              cities without facts included.
+    pick      *_EASY difficulties lead with landmarks and food, *_HARD with
+              the river, what the city is known for, the currency and the
+              band. Three of the best four clues and a closing line:
+              precritic's 4 sentences.
+
+Every fact goes through precritic.leaks() first (a landmark like "the Melbourne
+Cricket Ground" would name the answer; checked once per city and difficulty),
+and the finished riddle through precritic.check(). No I/O after import: a
+riddle takes a fraction of a millisecond, most of it the final check.
+"""
+
+import json
+import os
+import random
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from services import precritic
+
+FACTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "city_facts.json")
+BAND_DEG = 5
+CLUES_PER_RIDDLE = precritic.MAX_SENTENCES - 1
+
+CLOSINGS = ["Identify me.", "Which city am I?", "Name me.", "Where am I?"]
+
+with open(FACTS_PATH, encoding="utf-8") as _f:
+    _data = json.load(_f)
+CITY_FACTS: Dict[str, Dict[str, Any]] = _data["cities"]
+CURRENCIES: Dict[str, str] = _data["currencies"]
+_FACTS_BY_KEY = {name.lower(): facts for name, facts in CITY_FACTS.items()}
+
+
+def facts_for(city: str) -> Optional[Dict[str, Any]]:
+    return _FACTS_BY_KEY.get(city.lower())
+
+
+@lru_cache(maxsize=1024)
+def _safe_facts(city: str, difficulty: str) -> Dict[str, Any]:
+    """The city's facts minus any that name it (or, GLOBAL_*, its country)."""
+    safe = {}
+    for field, value in (facts_for(city) or {}).items():
+        if isinstance(value, list):
+            value = [item for item in value if not precritic.leaks(item, city, difficulty)]
+        elif isinstance(value, str) and field != "country" and precritic.leaks(value, city, difficulty):
+            value = None
+        if value:
+            safe[field] = value
+    return safe
+
+
+# ------------------------------------------------------------------
+# CLUES
+# ------------------------------------------------------------------
+
+def _capitalize(text: str) -> str:
+    return text[:1].upper() + text[1:]
+
+
+def _pair(items: List[str], rng: random.Random) -> str:
+    if len(items) < 2:
+        return items[0]
+    a, b = rng.sample(items, 2)
+    return f"{a} and {b}"
+
+
+def _band(value: float, positive: str, negative: str) -> str:
+    low = int(abs(value) // BAND_DEG) * BAND_DEG
+    return f"{low}° and {low + BAND_DEG}° {positive if value >= 0 else negative}"
+
+
+def coordinate_clue(lat: float, lng: float) -> str:
+    return f"I lie between {_band(lat, 'north', 'south')} and between {_band(lng, 'east', 'west')}."
+
+
+def _clues(facts: Dict[str, Any], lat: float, lng: float, india: bool, rng: random.Random) -> Dict[str, str]:
+    """Every clue the facts allow, by kind."""
+    clues = {"band": coordinate_clue(lat, lng)}
+    if facts.get("landmarks"):
+        clues["landmarks"] = rng.choice([
+            "Visitors come to see {}.", "My skyline is known for {}.", "Postcards of me show {}.",
+        ]).format(_pair(facts["landmarks"], rng))
+    if facts.get("cuisine"):
+        clues["cuisine"] = rng.choice([
+            "Hungry travellers seek out {} here.", "Try {} before you leave.", "My streets smell of {}.",
+        ]).format(_pair(facts["cuisine"], rng))
+    if facts.get("region"):
+        clues["region"] = ("I belong to {}." if india else "I am found in {}.").format(facts["region"])
+    if facts.get("river"):
+        clues["river"] = rng.choice(["{} flows past me.", "My banks meet {}."]).format(facts["river"])
+    if facts.get("known_for"):
+        clues["known_for"] = f"I am known for {facts['known_for']}."
+    currency = facts.get("currency") or CURRENCIES.get(facts.get("country", ""))
+    if currency and not india:
+        clues["currency"] = f"In my markets you pay with {currency}."
+    return {kind: _capitalize(text) for kind, text in clues.items()}
+
+
+# Preferred clue order per difficulty class; the first available win
+_ORDER = {
+    "EASY": ["landmarks", "cuisine", "region", "known_for", "river", "band"],
+    "HARD": ["river", "known_for", "currency", "band", "region", "cuisine", "landmarks"],
+}
+
+
+# ------------------------------------------------------------------
+# PUBLIC API
+# ------------------------------------------------------------------
+
+def template_riddle_text(
+    city: str,
+    lat: float,
+    lng: float,
+    difficulty: str,
+    population: int = 0,
+    rng: Optional[random.Random] = None
+) -> Optional[str]:
+    """
+    A riddle for `city` from its facts (coordinates only if it has none).
+    None if nothing passes the pre-critic, which the facts file shouldn't allow.
+    """
+    rng = rng or random
+    india = difficulty.upper().startswith("INDIA")
+    hard = difficulty.upper().endswith("HARD")
+    facts = _safe_facts(city, difficulty)
+    clues = _clues(facts, lat, lng, india, rng)
+    if population >= 1_000_000:
+        clues["population"] = f"About {population / 1_000_000:.0f} million people call me home."
+    elif population:
+        clues["population"] = f"About {population // 1000:,} thousand people call me home."
+    if not facts and india:
+        clues["region"] = "I am a city of India."
+
+    # Three of the four best clues, in preference order: repeat fallbacks vary
+    order = _ORDER["HARD" if hard else "EASY"] + ["population"]
+    head = [clues[kind] for kind in order if kind in clues][:CLUES_PER_RIDDLE + 1]
+    picked = sorted(rng.sample(head, min(len(head), CLUES_PER_RIDDLE)), key=head.index)
+    riddle = " ".join(picked + [rng.choice(CLOSINGS)])
+    result = precritic.check(riddle, city, difficulty)
+    return result.riddle if result.ok else None
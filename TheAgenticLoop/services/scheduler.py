@@ -0,0 +1,218 @@
+"""
+Priority scheduling for riddle generation.
+
+URGENCY CLASSES (lower runs first), by where the riddle will land in the
+session queue when it's done:
+    URGENT       position 0 and the client is waiting (202 spinner / long-poll)
+    LOW_DEPTH    position 0-1: the player will need it within a round or two
+    TOP_UP       deeper buffer refills
+    SPECULATIVE  pool refills nobody is waiting on
+
+AGING: jobs are ordered by score = enqueued_at + class * AGING_STEP_SEC, so a
+top-up enqueued 2 * AGING_STEP_SEC ago ties with a fresh urgent job and can't
+starve. The same score orders the in-process heap (inline mode) and the
+Redis ready ZSET (worker mode).
+
+PROVIDER SLOTS: each LLM provider gets a concurrency limit, and waiters are
+granted slots in score order (PrioritySemaphore). The running job's score is
+carried to the provider call through a ContextVar, so under saturation the
+critic call of an urgent riddle overtakes the draft call of a top-up.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+URGENT = 0
+LOW_DEPTH = 1
+TOP_UP = 2
+SPECULATIVE = 3
+PRIORITY_NAMES = {URGENT: "urgent", LOW_DEPTH: "low_depth", TOP_UP: "top_up", SPECULATIVE: "speculative"}
+
+AGING_STEP_SEC = 5.0
+
+# Score of the generation running in the current task (None outside a job)
+current_priority: ContextVar[Optional[float]] = ContextVar("generation_priority", default=None)
+
+
+def job_priority(position: int, client_waiting: bool = False) -> int:
+    """Urgency class of a riddle that will land at `position` in the session queue."""
+    if position <= 0 and client_waiting:
+        return URGENT
+    if position <= 1:
+        return LOW_DEPTH
+    return TOP_UP
+
+
+def refill_priorities(buffer_size: int, count: int, client_waiting: bool = False) -> List[int]:
+    """
+    Classes for `count` refills claimed by pop_question. Refills top the
+    buffer back up to buffer_size, so they land at positions
+    buffer_size - count ... buffer_size - 1.
+    """
+    first = max(buffer_size - count, 0)
+    return [job_priority(first + i, client_waiting) for i in range(count)]
+
+
+def priority_score(priority: int, enqueued_at: Optional[float] = None) -> float:
+    """Ordering key (lower first). Wall clock, so scores from any process compare."""
+    return (time.time() if enqueued_at is None else enqueued_at) + priority * AGING_STEP_SEC
+
+
+# ------------------------------------------------------------------
+# PROVIDER SLOTS
+# ------------------------------------------------------------------
+
+class PrioritySemaphore:
+    """Semaphore whose waiters are woken lowest score first instead of FIFO."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, score: float):
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (score, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # Slot was handed over just as we got cancelled
+            raise
+
+    def release(self):
+        # Hand the slot straight to the best live waiter (active count unchanged)
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+
+class ProviderSlots:
+    """Per-provider PrioritySemaphores. Unknown providers are unlimited."""
+
+    def __init__(self, limits: Dict[str, int]):
+        self._semaphores = {name: PrioritySemaphore(limit) for name, limit in limits.items() if limit > 0}
+
+    @asynccontextmanager
+    async def slot(self, provider: str):
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            yield
+            return
+        score = current_priority.get()
+        if score is None:
+            score = priority_score(TOP_UP)
+        await semaphore.acquire(score)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {"limit": sem.limit, "active": sem.active, "waiting": sem.waiting}
+            for name, sem in self._semaphores.items()
+        }
+
+
+# ------------------------------------------------------------------
+# IN-PROCESS SCHEDULER (GENERATION_MODE=inline)
+# ------------------------------------------------------------------
+
+class GenerationScheduler:
+    """
+    Priority queue of single-riddle generation jobs run by `concurrency`
+    worker tasks. start() in lifespan startup; drain() (warm restart,
+    services/snapshot.py) or stop() in shutdown.
+    """
+
+    def __init__(self, run: Callable[[str, str, int], Awaitable[None]], concurrency: int = 16):
+        self.run = run
+        self.concurrency = concurrency
+        self._heap: List[Tuple[float, int, str, str, int]] = []
+        self._seq = itertools.count()
+        self._available = asyncio.Semaphore(0)
+        self._workers: List[asyncio.Task] = []
+        # Worker task -> (session id, difficulty, priority) of the job it runs
+        self._current: Dict[asyncio.Task, Tuple[str, str, int]] = {}
+        self.running = 0
+        self._draining = False
+
+    @property
+    def queued(self) -> int:
+        return len(self._heap)
+
+    def submit(self, session_id: str, difficulty: str, priority: int = TOP_UP):
+        score = priority_score(priority)
+        heapq.heappush(self._heap, (score, next(self._seq), session_id, difficulty, priority))
+        self._available.release()
+
+    def queued_by_priority(self) -> Dict[str, int]:
+        counts = {name: 0 for name in PRIORITY_NAMES.values()}
+        for *_, priority in self._heap:
+            counts[PRIORITY_NAMES[priority]] += 1
+        return counts
+
+    async def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def drain(self, timeout: float) -> List[Tuple[str, str, int]]:
+        """
+        Stop taking jobs, give the running ones `timeout` seconds to finish,
+        cancel the rest. Returns the unfinished jobs as (session id,
+        difficulty, priority), most urgent first, for submit() after a restart.
+        """
+        self._draining = True  # Busy workers exit after their current job
+        busy = set(self._current)
+        for task in self._workers:
+            if task not in busy:
+                task.cancel()  # Idle: waiting for a job
+        if busy:
+            _, late = await asyncio.wait(busy, timeout=timeout)
+        else:
+            late = set()
+        unfinished = [self._current[task] for task in late if task in self._current]
+        await self.stop()
+        queued = [(session_id, difficulty, priority) for *_, session_id, difficulty, priority in sorted(self._heap)]
+        self._heap = []
+        return sorted(unfinished, key=lambda job: job[2]) + queued
+
+    async def _worker(self):
+        while not self._draining:
+            await self._available.acquire()
+            score, _, session_id, difficulty, priority = heapq.heappop(self._heap)
+            task = asyncio.current_task()
+            self._current[task] = (session_id, difficulty, priority)
+            token = current_priority.set(score)
+            self.running += 1
+            try:
+                await self.run(session_id, difficulty, priority)
+            except Exception as e:
+                print(f"❌ Scheduled generation failed for {session_id}: {e}")
+            finally:
+                self.running -= 1
+                self._current.pop(task, None)
+                current_priority.reset(token)
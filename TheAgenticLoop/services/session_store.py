@@ -0,0 +1,197 @@
+"""
+SessionStore: the storage operations the API actually needs, behind one interface.
+
+    sessions   create / get
+    cities     draw_city / mark_city_seen (seen-city bitmap, per session or per player)
+    queue      push_riddle / pop_question / arm_question (+ pending-generation accounting)
+    answers    check_answer (counts the attempt)
+    logs       append_log / read_log / listen_logs (capped per-session log + live fan-out)
+    lifecycle  active / reclaim_idle / take_inventory / return_inventory
+               (idle sessions and the shared riddle inventory, services/lifecycle.py)
+
+Backends:
+    RedisSessionStore   Lua scripts over the consolidated session hash (services.redis_scripts)
+                        + Redis Streams / Pub/Sub for logs. Shared across processes.
+    MemorySessionStore  Native asyncio dicts/deques with a timer-wheel TTL evictor
+                        (services.memory_store). Single process only; used when Redis
+                        is unreachable instead of emulating Redis with FakeRedis.
+
+Log entry ids use the Redis Stream format ("<ms>-<seq>") in both backends, so
+SSE Last-Event-ID resumption works the same everywhere.
+"""
+
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+
+from redis.exceptions import ResponseError
+
+from services.redis_scripts import SessionScripts, SESSION_IDLE_SEC, SESSION_TTL
+
+# KEYS: stream (also used as channel name), session | ARGV: maxlen, line, ttl
+# Logging isn't activity: the stream expires with the session, and lines for
+# an expired session are dropped (returns false)
+APPEND_LOG_LUA = """
+local left = redis.call('TTL', KEYS[2])
+if left == -2 then
+    return false
+end
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'msg', ARGV[2])
+redis.call('EXPIRE', KEYS[1], left > 0 and left or ARGV[3])
+redis.call('PUBLISH', KEYS[1], id .. ' ' .. ARGV[2])
+return id
+"""
+
+
+def parse_entry_id(entry_id: str) -> Tuple[int, int]:
+    """'1700000000000-3' -> (1700000000000, 3), for ordering comparisons."""
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def next_entry_id(entry_id: str) -> str:
+    """Smallest id strictly after entry_id (exclusive XRANGE on Redis < 6.2)."""
+    ms, seq = parse_entry_id(entry_id)
+    return f"{ms}-{seq + 1}"
+
+
+class SessionStore:
+    """
+    Interface shared by the backends. Return shapes match SessionScripts,
+    which is the reference implementation.
+    """
+
+    lua_enabled = False
+
+    async def start(self):
+        """Start background work (TTL eviction). Called from lifespan."""
+
+    async def close(self):
+        """Stop background work. Called from lifespan shutdown."""
+
+    # --- Sessions -------------------------------------------------
+    async def create_session(
+        self,
+        session_id: str,
+        difficulty: str,
+        seen_ids: List[int] = None,
+        pending: int = 0,
+        user_id: Optional[str] = None
+    ):
+        raise NotImplementedError
+
+    async def get_session(self, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        raise NotImplementedError
+
+    # --- City exclusion -------------------------------------------
+    async def draw_city(self, session_id: str, difficulty: str, deck: List[int], user_id: Optional[str] = None) -> Optional[int]:
+        raise NotImplementedError
+
+    async def mark_city_seen(self, session_id: str, difficulty: str, city_id: int, user_id: Optional[str] = None) -> bool:
+        """True if the city hadn't been seen yet."""
+        raise NotImplementedError
+
+    # --- Riddle queue ---------------------------------------------
+    async def push_riddle(self, session_id: str, payload: str, difficulty: Optional[str] = None) -> bool:
+        """False if the session was idle or gone and the riddle went to the inventory."""
+        raise NotImplementedError
+
+    async def release_generation(self, session_id: str):
+        raise NotImplementedError
+
+    async def pop_question(self, session_id: str, target: int = 0) -> Tuple[Optional[str], Optional[str], int, int]:
+        raise NotImplementedError
+
+    async def arm_question(self, session_id: str, raw: str, target: int = 0) -> Tuple[Optional[str], int, int]:
+        raise NotImplementedError
+
+    async def check_answer(self, session_id: str) -> Tuple[Optional[Dict[str, Any]], int, Optional[str]]:
+        raise NotImplementedError
+
+    # --- Agent logs -----------------------------------------------
+    async def append_log(self, session_id: str, line: str) -> Optional[str]:
+        """Append to the session log and notify listen_logs(); returns the entry id (None: no such session)."""
+        raise NotImplementedError
+
+    async def read_log(self, session_id: str, after_id: Optional[str] = None) -> List[Tuple[str, str]]:
+        """Entries strictly after after_id (all retained entries if None)."""
+        raise NotImplementedError
+
+    def listen_logs(self) -> AsyncIterator[Tuple[str, str]]:
+        """Yields (session_id, "<entry id> <line>") for every appended line, any session."""
+        raise NotImplementedError
+
+    # --- Lifecycle ------------------------------------------------
+    async def active(self, session_ids: List[str]) -> List[bool]:
+        """Per id: the session exists and isn't idle."""
+        raise NotImplementedError
+
+    async def reclaim_idle(self, limit: int = 500) -> List[Tuple[str, int]]:
+        """Mark sessions past the idle timeout idle, unread riddles to the inventory. [(id, moved)]"""
+        raise NotImplementedError
+
+    async def take_inventory(self, difficulty: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def return_inventory(self, difficulty: str, payload: str):
+        raise NotImplementedError
+
+
+class RedisSessionStore(SessionScripts, SessionStore):
+    """SessionScripts plus the durable log stream and its Pub/Sub channel."""
+
+    def __init__(
+        self,
+        client,
+        queue_prefix: str = "queue",
+        ttl: int = SESSION_TTL,
+        log_prefix: str = "logs",
+        log_maxlen: int = 200,
+        idle_sec: int = SESSION_IDLE_SEC
+    ):
+        super().__init__(client, queue_prefix=queue_prefix, ttl=ttl, log_prefix=log_prefix, idle_sec=idle_sec)
+        self.log_maxlen = log_maxlen
+        self._append_log = client.register_script(APPEND_LOG_LUA)
+
+    async def append_log(self, session_id: str, line: str) -> Optional[str]:
+        """XADD + EXPIRE + PUBLISH in one script (or a pipeline + PUBLISH without Lua). None if the session expired."""
+        key = f"{self.log_prefix}:{session_id}"
+        session_key = self._keys(session_id)[0]
+
+        if self.lua_enabled:
+            try:
+                return await self._append_log(keys=[key, session_key], args=[self.log_maxlen, line, self.ttl])
+            except (ResponseError, ImportError) as e:
+                self._disable_lua(e)
+
+        left = await self.client.ttl(session_key)
+        if left == -2:
+            return None
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.xadd(key, {"msg": line}, maxlen=self.log_maxlen, approximate=True)
+            pipe.expire(key, left if left > 0 else self.ttl)
+            entry_id, _ = await pipe.execute()
+        await self.client.publish(key, f"{entry_id} {line}")
+        return entry_id
+
+    async def read_log(self, session_id: str, after_id: Optional[str] = None) -> List[Tuple[str, str]]:
+        key = f"{self.log_prefix}:{session_id}"
+        start = next_entry_id(after_id) if after_id else "-"
+        entries = await self.client.xrange(key, min=start, max="+")
+        return [(entry_id, fields.get("msg", "")) for entry_id, fields in entries]
+
+    async def listen_logs(self) -> AsyncIterator[Tuple[str, str]]:
+        """One pattern subscription (`logs:*`) for the whole process."""
+        pattern = f"{self.log_prefix}:*"
+        prefix_len = len(self.log_prefix) + 1
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.psubscribe(pattern)
+            print(f"📡 Log hub subscribed to {pattern}")
+            async for message in pubsub.listen():
+                if message["type"] == "pmessage":
+                    yield message["channel"][prefix_len:], message["data"]
+        finally:
+            try:
+                await pubsub.punsubscribe(pattern)
+                await pubsub.close()
+            except Exception:
+                pass
@@ -0,0 +1,88 @@
+"""
+Warm restart: what a process checkpoints on graceful shutdown and picks up
+on the next startup, so a deploy doesn't start from cold.
+
+    jobs       generations still queued in the GenerationScheduler, plus the
+               ones cut off by the drain deadline (inline mode). Restored
+               jobs are resubmitted with their urgency class. Their
+               sessions' pending counters were never settled, so nothing
+               gets double-counted.
+    admission  the EWMA generation latencies (services/admission.py), so
+               the first ticks don't estimate from the defaults
+    store      the whole MemorySessionStore (sessions, queues, seen bitmaps,
+               logs, the inventory) when running without Redis. In Redis
+               mode all of that is already in Redis.
+    quota      the day's provider usage and live-job history
+               (services/quota.py), without Redis too
+
+WHERE: with Redis, snapshots are RPUSHed to one list (restart:snapshots,
+SNAPSHOT_TTL_SEC) and every starting process LPOPs one. serve.py's workers
+therefore hand their jobs over whatever their count or pids on the other
+side. Without Redis it's one JSON file (SNAPSHOT_PATH, atomically replaced);
+on a pod it has to live on a volume that survives the restart.
+
+Expiries are stored as wall-clock deadlines, so downtime counts against
+them. Jobs from a snapshot older than PENDING_STALE_SEC are dropped: by then
+the sessions' pending counters have gone stale and the next pop re-claims
+those refills itself.
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from services.redis_scripts import PENDING_STALE_SEC
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", ".atlast_snapshot.json")
+SNAPSHOT_KEY = "restart:snapshots"
+SNAPSHOT_TTL_SEC = int(os.getenv("SNAPSHOT_TTL_SEC", "900"))
+SNAPSHOT_KEEP = 64  # Newest snapshots kept in the list (one per process that shut down)
+WARM_RESTART = os.getenv("WARM_RESTART", "1") == "1"
+
+
+async def save_snapshot(snapshot: Dict[str, Any], client=None, path: str = SNAPSHOT_PATH) -> str:
+    """Store one process's snapshot in Redis (client) or the local file. Returns where."""
+    snapshot = {"version": SNAPSHOT_VERSION, "saved_at": time.time(), **snapshot}
+    data = json.dumps(snapshot, separators=(",", ":"))
+    if client is not None:
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.rpush(SNAPSHOT_KEY, data)
+            pipe.ltrim(SNAPSHOT_KEY, -SNAPSHOT_KEEP, -1)
+            pipe.expire(SNAPSHOT_KEY, SNAPSHOT_TTL_SEC)
+            await pipe.execute()
+        return SNAPSHOT_KEY
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+async def load_snapshot(client=None, path: str = SNAPSHOT_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Take one snapshot (consumed: a second startup doesn't replay it). None
+    if there is none or it's from another version.
+    """
+    if client is not None:
+        data = await client.lpop(SNAPSHOT_KEY)
+    else:
+        try:
+            with open(path) as f:
+                data = f.read()
+            os.remove(path)
+        except FileNotFoundError:
+            data = None
+    if not data:
+        return None
+    try:
+        snapshot = json.loads(data)
+    except ValueError as e:
+        print(f"⚠️ Ignoring unreadable snapshot: {e}")
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    if time.time() - snapshot.get("saved_at", 0) > PENDING_STALE_SEC:
+        snapshot["jobs"] = []
+    return snapshot
@@ -0,0 +1,56 @@
+import asyncio
+import uuid
+
+import pytest
+import redis.asyncio as redis
+
+from services.lifecycle import SessionReaper
+from services.memory_store import MemorySessionStore
+from services.redis_scripts import ACTIVE_KEY, SESSION_PREFIX
+from services.session_store import RedisSessionStore
+
+REDIS_URL = "redis://localhost:6379"
+
+
+def test_unknown_id_never_reaches_the_idle_index():
+    async def scenario():
+        store = MemorySessionStore(idle_sec=0, tick=0.01)
+        await store.create_session("real", "GLOBAL_EASY")
+        await store.pop_question("phantom", 3)
+        await store.arm_question("phantom", "raw", 3)
+        await asyncio.sleep(0.05)  # Past every idle deadline
+        return await store.reclaim_idle(), "phantom" in store._sessions
+
+    reclaimed, created = asyncio.run(scenario())
+    assert created is False
+    assert reclaimed == [("real", 0)]
+
+
+@pytest.mark.parametrize("lua", [True, False])
+def test_redis_reaper_ignores_unknown_and_expired_ids(lua):
+    async def scenario():
+        client = redis.from_url(REDIS_URL, decode_responses=True)
+        try:
+            await client.ping()
+        except Exception:
+            await client.aclose()
+            pytest.skip("no Redis on localhost:6379")
+        store = RedisSessionStore(client)
+        store.lua_enabled = lua
+        phantom, expired = uuid.uuid4().hex, uuid.uuid4().hex
+        try:
+            await store.pop_question(phantom, 3)
+            # An index entry whose session hash expired (score 0: reaped first)
+            await client.zadd(ACTIVE_KEY, {f"{SESSION_PREFIX}:{expired}": 0})
+            in_index = await client.zscore(ACTIVE_KEY, f"{SESSION_PREFIX}:{phantom}")
+            sessions = await SessionReaper(store, batch=1).reap()
+            left = await client.zscore(ACTIVE_KEY, f"{SESSION_PREFIX}:{expired}")
+            return in_index, sessions, left, await client.exists(f"{SESSION_PREFIX}:{expired}")
+        finally:
+            await client.aclose()
+
+    in_index, sessions, left, hash_created = asyncio.run(scenario())
+    assert in_index is None
+    assert sessions == 0
+    assert left is None
+    assert hash_created == 0
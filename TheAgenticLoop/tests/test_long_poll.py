@@ -0,0 +1,26 @@
+import asyncio
+
+from services.long_poll import QuestionWaiter
+
+
+class ScriptedStore:
+    """pop_question answers from a script: a miss that claims 2 refills, then a hit that claims 1."""
+
+    def __init__(self):
+        self.pops = [(None, "GLOBAL_EASY", 0, 2), ("riddle", "GLOBAL_EASY", 0, 1)]
+
+    async def pop_question(self, session_id, target=0):
+        return self.pops.pop(0)
+
+
+def test_refills_claimed_by_every_pass_are_returned():
+    async def scenario():
+        waiter = QuestionWaiter(ScriptedStore())
+        waiting = asyncio.create_task(waiter.wait_for_question("s1", timeout=5, target=3))
+        await asyncio.sleep(0)
+        waiter.notify("s1")
+        return await waiting
+
+    raw, _, _, refill = asyncio.run(scenario())
+    assert raw == "riddle"
+    assert refill == 3
@@ -0,0 +1,48 @@
+import pytest
+
+from services.matcher import build_matcher, max_edits_for, set_catalog
+
+POOL = ["Raipur", "Jaipur", "Bangalore", "Mangalore", "Mumbai", "Hyderabad", "Rome"]
+
+
+@pytest.fixture(autouse=True)
+def catalog():
+    set_catalog(POOL)
+    yield
+    set_catalog([])
+
+
+@pytest.mark.parametrize("answer, guess", [
+    ("Raipur", "Jaipur"),
+    ("Jaipur", "Raipur"),
+    ("Bangalore", "Mangalore"),
+    ("Mangalore", "Bangalore"),
+    ("Mangalore", "Bengaluru"),
+])
+def test_other_pool_city_is_not_a_typo(answer, guess):
+    assert not build_matcher(answer).matches(guess)
+
+
+def test_budget_capped_below_nearest_neighbour():
+    assert max_edits_for("raipur") == 0
+    assert max_edits_for("bangalore") == 0
+    # Aliases keep their own budget when nothing else is near
+    assert max_edits_for("bengaluru") == 1
+    assert max_edits_for("hyderabad") == 2
+
+
+@pytest.mark.parametrize("answer, guess", [
+    ("Raipur", "raipur"),
+    ("Bangalore", "Bengaluru"),
+    ("Bangalore", "bengalru"),
+    ("Mumbai", "Mumbia"),
+    ("Mumbai", "Bombay"),
+    ("Hyderabad", "Hyderbad"),
+])
+def test_aliases_and_typos_still_accepted(answer, guess):
+    assert build_matcher(answer).matches(guess)
+
+
+def test_without_catalog_only_length_budget_applies():
+    set_catalog([])
+    assert build_matcher("Raipur").matches("Jaipur")
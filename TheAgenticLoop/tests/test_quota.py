@@ -0,0 +1,23 @@
+from services.admission import FULL, RESERVOIR_ONLY
+from services.quota import QuotaPlanner
+from services.scheduler import TOP_UP, URGENT
+
+
+def test_spent_critic_and_fallback_caps_dont_pace_generation():
+    planner = QuotaPlanner(requests={"groq": 14400, "cohere": 10, "gemini": 10}, tokens={})
+    for _ in range(12):
+        planner.record("cohere")
+        planner.record("gemini")
+    planner.plan()
+    assert planner.exhausted("cohere") and planner.exhausted("gemini")
+    assert not planner.exhausted("groq")
+    assert [planner.admit(TOP_UP, FULL) for _ in range(5)] == [FULL] * 5
+
+
+def test_spent_generator_defers_paced_jobs_but_not_live_ones():
+    planner = QuotaPlanner(requests={"groq": 10}, tokens={})
+    for _ in range(10):
+        planner.record("groq")
+    planner.plan()
+    assert planner.admit(TOP_UP, FULL) == RESERVOIR_ONLY
+    assert planner.admit(URGENT, FULL) == FULL
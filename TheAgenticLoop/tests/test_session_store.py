@@ -0,0 +1,151 @@
+import asyncio
+import uuid
+
+import pytest
+import redis.asyncio as redis
+
+from services.memory_store import MemorySessionStore
+from services.redis_scripts import ACTIVE_KEY
+from services.session_store import RedisSessionStore
+
+REDIS_URL = "redis://localhost:6379"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def redis_store(lua: bool):
+    client = redis.from_url(REDIS_URL, decode_responses=True)
+    try:
+        await client.ping()
+    except Exception:
+        await client.aclose()
+        pytest.skip("no Redis on localhost:6379")
+    store = RedisSessionStore(client)
+    store.lua_enabled = lua
+    return client, store
+
+
+def test_memory_pop_for_unknown_session_creates_nothing():
+    async def scenario():
+        store = MemorySessionStore()
+        popped = await store.pop_question("nobody", 3)
+        armed = await store.arm_question("nobody", "raw", 3)
+        return popped, armed, await store.get_session("nobody"), len(store._sessions)
+
+    popped, armed, session, records = run(scenario())
+    assert popped == (None, None, 0, 0)
+    assert armed == (None, 0, 0)
+    assert session == (None, None)
+    assert records == 0
+
+
+@pytest.mark.parametrize("lua", [True, False])
+def test_redis_pop_for_unknown_session_creates_nothing(lua):
+    async def scenario():
+        client, store = await redis_store(lua)
+        session_id = uuid.uuid4().hex
+        try:
+            popped = await store.pop_question(session_id, 3)
+            armed = await store.arm_question(session_id, "raw", 3)
+            keys = [key for key in store._keys(session_id)[:-1] if await client.exists(key)]
+            active = await client.zscore(ACTIVE_KEY, store._keys(session_id)[0])
+            return popped, armed, keys, active
+        finally:
+            await client.aclose()
+
+    popped, armed, keys, active = run(scenario())
+    assert popped == (None, None, 0, 0)
+    assert armed == (None, 0, 0)
+    assert keys == []
+    assert active is None
+
+
+def test_known_session_still_claims_refills():
+    async def scenario():
+        store = MemorySessionStore()
+        await store.create_session("s1", "GLOBAL_EASY")
+        return await store.pop_question("s1", 3)
+
+    assert run(scenario()) == (None, "GLOBAL_EASY", 0, 3)
+
+
+@pytest.mark.parametrize("lua", [True, False])
+def test_legacy_session_migrated_by_get_session_expires(lua):
+    async def scenario():
+        client, store = await redis_store(lua)
+        session_id = uuid.uuid4().hex
+        session_key = store._keys(session_id)[0]
+        try:
+            await client.hset(f"config:{session_id}", mapping={"difficulty": "GLOBAL_EASY"})
+            await client.expire(f"config:{session_id}", 3600)
+            difficulty, _ = await store.get_session(session_id)
+            return (
+                difficulty,
+                await client.ttl(session_key),
+                await client.zscore(ACTIVE_KEY, session_key),
+                await client.exists(f"config:{session_id}"),
+            )
+        finally:
+            await client.delete(session_key)
+            await client.zrem(ACTIVE_KEY, session_key)
+            await client.aclose()
+
+    difficulty, ttl, active, legacy_left = run(scenario())
+    assert difficulty == "GLOBAL_EASY"
+    assert ttl > 0
+    assert active is not None
+    assert legacy_left == 0
+
+
+@pytest.mark.parametrize("lua", [True, False])
+def test_release_generation_leaves_expired_session_gone(lua):
+    async def scenario():
+        client, store = await redis_store(lua)
+        gone, live = uuid.uuid4().hex, uuid.uuid4().hex
+        live_key = store._keys(live)[0]
+        try:
+            await store.create_session(live, "GLOBAL_EASY", pending=2)
+            await client.expire(live_key, 100)
+            await store.release_generation(gone)
+            await store.release_generation(live)
+            return (
+                await client.exists(store._keys(gone)[0]),
+                await client.hget(live_key, "pending"),
+                await client.ttl(live_key),
+            )
+        finally:
+            await client.delete(*store._keys(live)[:-1])
+            await client.zrem(ACTIVE_KEY, live_key)
+            await client.aclose()
+
+    gone_exists, pending, ttl = run(scenario())
+    assert gone_exists == 0
+    assert pending == "1"
+    assert 0 < ttl <= 100
+
+
+def test_redis_draw_city_reads_deck_stored_once():
+    async def scenario():
+        client, store = await redis_store(True)
+        session_id = uuid.uuid4().hex
+        deck = [7, 3, 11, 5]
+        deck_key = store._deck_key("GLOBAL_EASY", deck)
+        try:
+            await store.create_session(session_id, "GLOBAL_EASY")
+            await client.delete(deck_key)
+            first_lap = [await store.draw_city(session_id, "GLOBAL_EASY", deck) for _ in deck]
+            stored = await client.strlen(deck_key)
+            await client.delete(deck_key)  # Expired / evicted: the next draw uploads it again
+            second_lap = [await store.draw_city(session_id, "GLOBAL_EASY", deck) for _ in deck]
+            return first_lap, second_lap, stored, store.lua_enabled
+        finally:
+            await client.delete(deck_key, *store._keys(session_id)[:-1])
+            await client.zrem(ACTIVE_KEY, store._keys(session_id)[0])
+            await client.aclose()
+
+    first_lap, second_lap, stored, lua = run(scenario())
+    assert lua
+    assert stored == 4 * len(first_lap)
+    assert sorted(first_lap) == sorted(second_lap) == [3, 5, 7, 11]
@@ -0,0 +1,185 @@
+"""
+Standalone riddle generation worker.
+
+Pulls jobs from the Redis generation queue (services/job_queue.py), runs the
+Polyglot AI pipeline and pushes each riddle straight into the session queue,
+where the API serves it. Run as many as you like, on any machine that can
+reach Redis:
+
+    REDIS_URL=redis://localhost:6379 python worker.py --concurrency 4 [--metrics-port 9101]
+
+The API enqueues instead of generating in-process when started with
+GENERATION_MODE=queue. Under overload (job backlog vs the workers' provider
+capacity, services/admission.py) riddles come from the stored library
+instead of the LLMs, and so do top-ups over the daily quota planner's
+allowance (services/quota.py). Jobs for idle or expired sessions are acked without
+generating, and cancelled if the session goes idle mid-generation
+(services/lifecycle.py).
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import uuid
+from typing import Dict
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+import polyglot_ai
+from services.admission import LEVEL_NAMES, AdmissionController
+from services.generation import generate_and_buffer
+from services.job_queue import GenerationJobQueue, HEARTBEAT_SEC, HEARTBEAT_TTL
+from services.lifecycle import GenerationGuard
+from services.loop_monitor import LoopMonitor
+from services.metrics import start_metrics_server
+from services.quota import QUOTA
+from services.scheduler import PRIORITY_NAMES, current_priority
+from services.session_store import RedisSessionStore
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REAP_EVERY_SEC = 15
+CLAIM_TIMEOUT_SEC = 5
+
+
+class GenerationWorker:
+    def __init__(self, client, concurrency: int = 4):
+        self.client = client
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.store = RedisSessionStore(client)
+        self.jobs = GenerationJobQueue(client)
+        # Idle slots park a BLPOP connection each; keep those off the main pool
+        self.blocking_client = redis.from_url(
+            REDIS_URL, decode_responses=True, max_connections=concurrency,
+            socket_timeout=CLAIM_TIMEOUT_SEC + 5
+        )
+        self.active: Dict[str, str] = {}  # job id -> session id
+        # Same backlog estimate as the API's; here it only picks the ladder level
+        self.admission = AdmissionController(
+            lambda: self.jobs.load(concurrency, min(concurrency, polyglot_ai.generation_capacity())),
+            demand_per_session=0
+        )
+        self.guard = GenerationGuard(self.store)
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        print("🛑 Worker stopping after current jobs...")
+        self._stopping.set()
+
+    async def run(self):
+        await self.jobs.register_worker(self.worker_id)
+        print(f"👷 Worker {self.worker_id} ready ({self.concurrency} slots) on {REDIS_URL}")
+
+        housekeeping = asyncio.create_task(self._housekeeping())
+        await self.admission.start()
+        await self.guard.start()
+        await QUOTA.start(self.client)
+        try:
+            await asyncio.gather(*(self._slot() for _ in range(self.concurrency)))
+        finally:
+            housekeeping.cancel()
+            await QUOTA.stop()
+            await self.guard.stop()
+            await self.admission.stop()
+            await self.jobs.unregister_worker(self.worker_id)
+            await self.blocking_client.close()
+
+    async def _slot(self):
+        while not self._stopping.is_set():
+            try:
+                job = await self.jobs.claim(self.worker_id, self.blocking_client, CLAIM_TIMEOUT_SEC)
+            except Exception as e:
+                print(f"⚠️ Claim failed: {e}. Retrying in 1s")
+                await asyncio.sleep(1)
+                continue
+            if job:
+                await self._process(job)
+
+    async def _process(self, job: Dict):
+        job_id, session_id, difficulty = job["id"], job["session_id"], job["difficulty"] or "Medium"
+        self.active[job_id] = session_id
+        priority = PRIORITY_NAMES.get(job["priority"], "top_up")
+        level = self.admission.level
+        print(f"⚙️ Job {job_id[:8]}: generating for {session_id} [Difficulty: {difficulty}] [{priority}] "
+              f"[{LEVEL_NAMES[level]}] (attempt {job['attempts']})")
+        # Provider slots in polyglot_ai order their waiters by this score
+        token = current_priority.set(job["score"])
+        try:
+            # Skipped if the session went idle / expired while the job waited,
+            # cancelled if it does mid-generation: None
+            queued = await self.guard.run(session_id, generate_and_buffer(
+                self.store, session_id, difficulty, level, job["priority"]
+            ))
+        except Exception as e:
+            print(f"❌ Job {job_id[:8]} failed: {e}")
+            buried = await self.jobs.fail(self.worker_id, job_id, str(e))
+            if buried:
+                await self._bury(buried)
+        else:
+            await self.jobs.ack(self.worker_id, job_id)
+            if queued:
+                print(f"✅ Buffered question for {session_id}")
+            else:
+                print(f"⏹️ Job {job_id[:8]}: session {session_id} is idle, nothing buffered")
+        finally:
+            current_priority.reset(token)
+            self.active.pop(job_id, None)
+
+    async def _bury(self, session_id: str):
+        """A dead-lettered job will never push: settle its pending slot."""
+        print(f"🪦 Generation for {session_id} dead-lettered")
+        await self.store.release_generation(session_id)
+        await self.store.append_log(session_id, "⚠️ Generation failed repeatedly. Retrying with a fresh request...")
+
+    async def _housekeeping(self):
+        """Heartbeat every HEARTBEAT_SEC, reap abandoned jobs every REAP_EVERY_SEC."""
+        loop = asyncio.get_running_loop()
+        next_reap = loop.time()
+        while True:
+            try:
+                await self.jobs.heartbeat(self.worker_id, list(self.active), HEARTBEAT_TTL)
+                if loop.time() >= next_reap:
+                    next_reap = loop.time() + REAP_EVERY_SEC
+                    requeued, buried = await self.jobs.reap()
+                    if requeued or buried:
+                        print(f"♻️ Reaped jobs: {requeued} requeued, {len(buried)} dead-lettered")
+                    for session_id in buried:
+                        await self._bury(session_id)
+            except Exception as e:
+                print(f"⚠️ Worker housekeeping failed: {e}")
+            await asyncio.sleep(HEARTBEAT_SEC)
+
+
+async def main(concurrency: int, metrics_port: int = 0):
+    client = redis.from_url(REDIS_URL, decode_responses=True)
+    await client.ping()
+    metrics_server = await start_metrics_server(metrics_port) if metrics_port else None
+    # Same detector as the API: stalls are logged and exported via --metrics-port
+    loop_monitor = LoopMonitor()
+    await loop_monitor.start()
+
+    worker = GenerationWorker(client, concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    await worker.run()
+    await loop_monitor.stop()
+    if metrics_server:
+        metrics_server.close()
+    await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Riddle generation worker")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")),
+                        help="Jobs generated in parallel by this process")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("WORKER_METRICS_PORT", "0")),
+                        help="Serve Prometheus /metrics on this port (0 = off)")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.metrics_port))